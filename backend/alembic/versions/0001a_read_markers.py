@@ -0,0 +1,44 @@
+"""Per-room message sequence numbers and read markers
+
+Revision ID: 0001a
+Revises: 0001
+Create Date: 2026-10-19 00:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001a'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('rooms', sa.Column('message_seq', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('messages', sa.Column('seq', sa.Integer(), nullable=True))
+    op.create_index('ix_messages_room_id_seq', 'messages', ['room_id', 'seq'], unique=True)
+    op.create_table(
+        'read_markers',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('room_id', sa.Integer(), nullable=False),
+        sa.Column('last_read_id', sa.Integer(), nullable=False),
+        sa.Column('last_read_seq', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.ForeignKeyConstraint(['room_id'], ['rooms.id']),
+        sa.PrimaryKeyConstraint('user_id', 'room_id'),
+    )
+    op.create_index('ix_read_markers_room_id', 'read_markers', ['room_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_read_markers_room_id', table_name='read_markers')
+    op.drop_table('read_markers')
+    op.drop_index('ix_messages_room_id_seq', table_name='messages')
+    with op.batch_alter_table('messages') as batch_op:
+        batch_op.drop_column('seq')
+    with op.batch_alter_table('rooms') as batch_op:
+        batch_op.drop_column('message_seq')
@@ -0,0 +1,34 @@
+"""Materialized thread roots and reply counts on messages
+
+Revision ID: 0002
+Revises: 0001a
+Create Date: 2026-10-19 01:00:00.000000
+
+Existing replies start with thread_root_id NULL; fill them in with
+`python -m scripts.backfill_thread_roots` (batched, safe while serving).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('messages') as batch_op:
+        batch_op.add_column(sa.Column('thread_root_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('reply_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.create_foreign_key('fk_messages_thread_root_id', 'messages', ['thread_root_id'], ['id'])
+    op.create_index('ix_messages_thread_root_id_id', 'messages', ['thread_root_id', 'id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_messages_thread_root_id_id', table_name='messages')
+    with op.batch_alter_table('messages') as batch_op:
+        batch_op.drop_constraint('fk_messages_thread_root_id', type_='foreignkey')
+        batch_op.drop_column('reply_count')
+        batch_op.drop_column('thread_root_id')
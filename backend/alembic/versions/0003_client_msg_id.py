@@ -0,0 +1,28 @@
+"""Client message ids for idempotent sends
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 02:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('messages', sa.Column('client_msg_id', sa.String(length=64), nullable=True))
+    op.create_index(
+        'ix_messages_user_id_client_msg_id', 'messages', ['user_id', 'client_msg_id'], unique=True
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_messages_user_id_client_msg_id', table_name='messages')
+    op.drop_column('messages', 'client_msg_id')
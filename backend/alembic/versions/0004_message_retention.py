@@ -0,0 +1,37 @@
+"""Per-room message retention and purge checkpoints
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 03:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('rooms', sa.Column('retention_days', sa.Integer(), nullable=True))
+    op.add_column('messages', sa.Column('deleted_at', sa.DateTime(timezone=True), nullable=True))
+    op.create_table(
+        'retention_checkpoints',
+        sa.Column('room_id', sa.Integer(), nullable=False),
+        sa.Column('purged_through_seq', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('purged_through_id', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('purged_total', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.ForeignKeyConstraint(['room_id'], ['rooms.id']),
+        sa.PrimaryKeyConstraint('room_id'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('retention_checkpoints')
+    op.drop_column('messages', 'deleted_at')
+    op.drop_column('rooms', 'retention_days')
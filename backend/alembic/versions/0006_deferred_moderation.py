@@ -0,0 +1,58 @@
+"""Deliver-first moderation: trust flags, pending marker and audit trail
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19 05:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('is_trusted', sa.Boolean(), server_default='0', nullable=False))
+    op.add_column('rooms', sa.Column('deliver_first', sa.Boolean(), server_default='0', nullable=False))
+    op.add_column('messages', sa.Column('pending_moderation', sa.Boolean(), server_default='0', nullable=False))
+    # Partial: only the few messages still waiting for the classifier are indexed
+    op.create_index(
+        'ix_messages_pending_moderation', 'messages', ['id'],
+        postgresql_where=sa.text('pending_moderation'), sqlite_where=sa.text('pending_moderation')
+    )
+    op.create_table(
+        'moderation_audit',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('message_id', sa.Integer(), nullable=False),
+        sa.Column('room_id', sa.Integer(), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('action', sa.String(length=16), nullable=False),
+        sa.Column('reason', sa.String(), nullable=True),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('recipients', sa.Integer(), nullable=False),
+        sa.Column('exposure_ms', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_moderation_audit_id', 'moderation_audit', ['id'])
+    op.create_index('ix_moderation_audit_message_id', 'moderation_audit', ['message_id'])
+    op.create_index('ix_moderation_audit_user_id', 'moderation_audit', ['user_id'])
+    op.create_index('ix_moderation_audit_created_at', 'moderation_audit', ['created_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_moderation_audit_created_at', table_name='moderation_audit')
+    op.drop_index('ix_moderation_audit_user_id', table_name='moderation_audit')
+    op.drop_index('ix_moderation_audit_message_id', table_name='moderation_audit')
+    op.drop_index('ix_moderation_audit_id', table_name='moderation_audit')
+    op.drop_table('moderation_audit')
+    op.drop_index('ix_messages_pending_moderation', table_name='messages')
+    op.drop_column('messages', 'pending_moderation')
+    op.drop_column('rooms', 'deliver_first')
+    op.drop_column('users', 'is_trusted')
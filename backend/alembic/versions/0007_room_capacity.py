@@ -0,0 +1,24 @@
+"""Per-room socket capacity
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19 06:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('rooms', sa.Column('max_connections', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('rooms', 'max_connections')
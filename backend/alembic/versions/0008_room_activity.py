@@ -0,0 +1,35 @@
+"""Room activity rollups
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-19 08:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'room_activity',
+        sa.Column('room_id', sa.Integer(), nullable=False),
+        sa.Column('period', sa.String(length=8), nullable=False),
+        sa.Column('bucket_start', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('messages', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('users', sa.LargeBinary(), nullable=False),
+        sa.ForeignKeyConstraint(['room_id'], ['rooms.id']),
+        sa.PrimaryKeyConstraint('room_id', 'period', 'bucket_start'),
+    )
+    op.create_index('ix_room_activity_period_bucket_start', 'room_activity', ['period', 'bucket_start'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_room_activity_period_bucket_start', table_name='room_activity')
+    op.drop_table('room_activity')
@@ -0,0 +1,32 @@
+"""Mention inbox index
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'mentions',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('message_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('user_id', 'message_id'),
+    )
+    op.create_index('ix_mentions_message_id', 'mentions', ['message_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_mentions_message_id', table_name='mentions')
+    op.drop_table('mentions')
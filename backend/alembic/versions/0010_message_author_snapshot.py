@@ -0,0 +1,28 @@
+"""Author snapshot on messages
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-19 10:00:00.000000
+
+Existing messages start with an empty snapshot; fill it in with
+`python -m scripts.backfill_author_snapshot` (batched, safe while serving).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('messages', sa.Column('author_username', sa.String(), nullable=True))
+    op.add_column('messages', sa.Column('author_avatar_url', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('messages', 'author_avatar_url')
+    op.drop_column('messages', 'author_username')
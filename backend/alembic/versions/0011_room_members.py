@@ -0,0 +1,39 @@
+"""Private room membership
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0011'
+down_revision = '0010'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'room_members',
+        sa.Column('room_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.ForeignKeyConstraint(['room_id'], ['rooms.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('room_id', 'user_id'),
+    )
+    op.create_index('ix_room_members_user_id', 'room_members', ['user_id'])
+    # Creators of existing private rooms keep access to them
+    op.execute(
+        "INSERT INTO room_members (room_id, user_id) "
+        "SELECT id, created_by FROM rooms WHERE NOT is_public"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_room_members_user_id', table_name='room_members')
+    op.drop_table('room_members')
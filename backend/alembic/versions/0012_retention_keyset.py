@@ -0,0 +1,23 @@
+"""Index for the retention keyset on (room_id, id)
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0012'
+down_revision = '0011'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_messages_room_id_id', 'messages', ['room_id', 'id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_messages_room_id_id', table_name='messages')
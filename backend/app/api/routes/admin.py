@@ -0,0 +1,227 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.diagnostics import sample_stacks
+from app.core.security import CurrentUser, get_current_admin_user, revoke_user_tokens
+from app.core.tasks import executor
+from app.db.session import get_db
+from app.models.moderation_audit import ModerationAudit
+from app.models.room import Room
+from app.models.user import User
+from app.schemas.analytics import RoomActivityReport, RoomActivitySummary
+from app.schemas.moderation import ModerationReport, RoomModerationUpdate, UserTrustUpdate
+from app.schemas.room import RoomResponse
+from app.schemas.user import UserResponse
+from app.services.activity import HOUR, MINUTE, bucket_start, room_report, top_rooms
+from app.services.deferred_moderation import deferred_moderation
+from app.services.retention import retention_job
+from app.services.room_directory import room_directory
+from app.websocket.admission import admission
+from app.websocket.drain import drain
+
+router = APIRouter()
+
+# Only one profile at a time; sampling is cheap but not free
+_profile_lock = asyncio.Lock()
+
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def run_profiler(
+    seconds: float = Query(10.0, gt=0),
+    interval_ms: float = Query(5.0, ge=1),
+    current_user: CurrentUser = Depends(get_current_admin_user)
+):
+    """Sample all threads for N seconds and return collapsed stacks (flamegraph.pl / speedscope input)"""
+    if seconds > settings.profiler_max_seconds:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"seconds must be at most {settings.profiler_max_seconds:g}"
+        )
+    if _profile_lock.locked():
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A profile is already running"
+        )
+    async with _profile_lock:
+        stacks = await asyncio.to_thread(sample_stacks, seconds, interval_ms / 1000)
+    return PlainTextResponse(
+        stacks,
+        headers={"Content-Disposition": 'attachment; filename="profile.collapsed"'}
+    )
+
+
+@router.post("/drain", status_code=status.HTTP_202_ACCEPTED)
+async def start_drain(
+    current_user: CurrentUser = Depends(get_current_admin_user)
+):
+    """Stop accepting sockets on this worker and close existing ones in waves"""
+    drain.start()
+    return drain.report()
+
+
+@router.get("/drain")
+async def drain_status(
+    current_user: CurrentUser = Depends(get_current_admin_user)
+):
+    """Progress of the current drain on this worker"""
+    return drain.report()
+
+
+@router.get("/admission")
+async def admission_status(
+    current_user: CurrentUser = Depends(get_current_admin_user)
+):
+    """Sockets, handshake queue and load shedding state on this worker"""
+    return admission.report()
+
+
+@router.get("/tasks")
+async def task_queues(
+    current_user: CurrentUser = Depends(get_current_admin_user)
+):
+    """Background job queues on this worker"""
+    return executor.report()
+
+
+@router.post("/retention", status_code=status.HTTP_202_ACCEPTED)
+async def start_retention(
+    current_user: CurrentUser = Depends(get_current_admin_user)
+):
+    """Run the message retention purge now on this worker"""
+    if not retention_job.trigger():
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A retention run is already in progress"
+        )
+    return retention_job.report()
+
+
+@router.get("/retention")
+async def retention_status(
+    current_user: CurrentUser = Depends(get_current_admin_user)
+):
+    """Progress of the current (or last) retention run on this worker"""
+    return retention_job.report()
+
+
+@router.post("/users/{user_id}/revoke-tokens", status_code=status.HTTP_204_NO_CONTENT)
+async def revoke_tokens(
+    user_id: int,
+    deactivate: bool = False,
+    current_user: CurrentUser = Depends(get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    """Sign a user out everywhere within seconds (optionally deactivating the account too)"""
+    user = db.get(User, user_id)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    if deactivate:
+        user.is_active = False
+    await revoke_user_tokens(db, user)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@router.put("/users/{user_id}/trust", response_model=UserResponse)
+async def set_user_trust(
+    user_id: int,
+    update: UserTrustUpdate,
+    current_user: CurrentUser = Depends(get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    """Let a user's messages go out before the classifier has seen them (applies from their next token)"""
+    user = db.get(User, user_id)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    user.is_trusted = update.is_trusted
+    db.commit()
+    db.refresh(user)
+    return user
+
+
+@router.put("/rooms/{room_id}/moderation", response_model=RoomResponse)
+async def set_room_moderation(
+    room_id: int,
+    update: RoomModerationUpdate,
+    current_user: CurrentUser = Depends(get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    """Opt a room in or out of deliver-first moderation (applies to new connections)"""
+    room = db.get(Room, room_id)
+    if room is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Room not found"
+        )
+    room.deliver_first = update.deliver_first
+    db.commit()
+    db.refresh(room)
+    room_directory.invalidate()
+    return room
+
+
+@router.get("/moderation", response_model=ModerationReport)
+async def moderation_status(
+    limit: int = Query(50, ge=1, le=500),
+    current_user: CurrentUser = Depends(get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    """Deferred moderation counters on this worker and the latest retractions"""
+    recent = db.query(ModerationAudit).order_by(ModerationAudit.id.desc()).limit(limit).all()
+    return {**deferred_moderation.report(), "recent": recent}
+
+
+def _analytics_window(hours: int, period: str = HOUR):
+    """The last N hours, starting on a bucket boundary"""
+    if hours > settings.analytics_max_hours:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"hours must be at most {settings.analytics_max_hours}"
+        )
+    until = datetime.now(timezone.utc)
+    return bucket_start((until - timedelta(hours=hours)).timestamp(), period), until
+
+
+@router.get("/analytics/rooms", response_model=List[RoomActivitySummary])
+async def busiest_rooms(
+    hours: int = Query(24, ge=1),
+    limit: int = Query(20, ge=1, le=200),
+    current_user: CurrentUser = Depends(get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    """Busiest rooms over the last N hours, from the hourly rollups"""
+    since, until = _analytics_window(hours)
+    return top_rooms(db, since, until, limit)
+
+
+@router.get("/analytics/rooms/{room_id}", response_model=RoomActivityReport)
+async def room_analytics(
+    room_id: int,
+    hours: int = Query(24, ge=1),
+    period: str = Query(HOUR, pattern=f"^({MINUTE}|{HOUR})$"),
+    current_user: CurrentUser = Depends(get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    """Messages per minute/hour, active users and peak hours for a room (rollups only, up to a flush behind)"""
+    since, until = _analytics_window(hours, period)
+    if period == MINUTE and settings.rollup_minute_retention_days and hours > settings.rollup_minute_retention_days * 24:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Minute rollups are kept for {settings.rollup_minute_retention_days} days; use period=hour"
+        )
+    if db.get(Room, room_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Room not found"
+        )
+    return room_report(db, room_id, period, since, until)
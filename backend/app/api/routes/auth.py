@@ -1,24 +1,36 @@
-from datetime import timedelta
-from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import datetime, timezone
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import update
 from sqlalchemy.orm import Session
 
-from app.core.config import settings
+from app.core.rate_limit import RateLimit
+from app.core.revocation import token_revocations
 from app.core.security import (
+    CurrentUser,
     verify_password,
     get_password_hash,
-    create_access_token,
+    decode_refresh_token,
+    issue_tokens,
+    revoke_user_tokens,
     get_current_user
 )
 from app.db.session import get_db
+from app.models.refresh_token import RefreshToken
 from app.models.user import User
 from app.schemas.user import UserCreate, UserResponse, Token
-from app.schemas.auth import RegisterRequest
+from app.schemas.auth import LogoutRequest, RefreshRequest, RegisterRequest
+from app.services.mentions import mention_index
 
 router = APIRouter()
 
 
-@router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
+@router.post(
+    "/register",
+    response_model=UserResponse,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(RateLimit("register", "ip"))]
+)
 async def register(
     user_data: RegisterRequest,
     db: Session = Depends(get_db)
@@ -51,10 +63,11 @@ async def register(
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    mention_index.add_user(db_user.username, db_user.id)
     return db_user
 
 
-@router.post("/token", response_model=Token)
+@router.post("/token", response_model=Token, dependencies=[Depends(RateLimit("login", "ip"))])
 async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db)
@@ -74,17 +87,88 @@ async def login(
             detail="User account is inactive"
         )
     
-    access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
-    access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+    tokens = issue_tokens(db, user)
+    db.commit()
+    return tokens
+
+
+@router.post("/refresh", response_model=Token, dependencies=[Depends(RateLimit("refresh", "ip"))])
+async def refresh(
+    body: RefreshRequest,
+    db: Session = Depends(get_db)
+):
+    """Trade a refresh token for a new access + refresh pair (the old refresh token stops working)"""
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
     )
-    return {"access_token": access_token, "token_type": "bearer"}
+    payload = decode_refresh_token(body.refresh_token)
+    if payload is None:
+        raise credentials_exception
+    stored = db.get(RefreshToken, payload["jti"])
+    if stored is None:
+        raise credentials_exception
+    user = db.get(User, stored.user_id)
+    if user is None:
+        raise credentials_exception
+    if stored.revoked_at is not None:
+        if stored.replaced_by is not None:
+            # A rotated token came back: it was copied, so end that whole login
+            db.execute(
+                update(RefreshToken)
+                .where(RefreshToken.family_id == stored.family_id, RefreshToken.revoked_at.is_(None))
+                .values(revoked_at=datetime.now(timezone.utc))
+            )
+            db.commit()
+        raise credentials_exception
+    if not user.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="User account is inactive"
+        )
+    
+    tokens = issue_tokens(db, user, family_id=stored.family_id)
+    stored.revoked_at = datetime.now(timezone.utc)
+    stored.replaced_by = decode_refresh_token(tokens["refresh_token"])["jti"]
+    db.commit()
+    return tokens
+
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(
+    body: LogoutRequest,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Revoke the current access token (and refresh token, or every session with everywhere=true)"""
+    if body.everywhere:
+        user = db.get(User, current_user.id)
+        if user is not None:
+            await revoke_user_tokens(db, user)
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
+    
+    token_revocations.revoke_token(current_user.token_id)
+    if body.refresh_token:
+        payload = decode_refresh_token(body.refresh_token)
+        stored = db.get(RefreshToken, payload["jti"]) if payload else None
+        if stored is not None and stored.user_id == current_user.id and stored.revoked_at is None:
+            stored.revoked_at = datetime.now(timezone.utc)
+            db.commit()
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
 @router.get("/me", response_model=UserResponse)
 async def get_current_user_info(
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
 ):
     """Get current authenticated user information"""
-    return current_user
+    user = db.get(User, current_user.id)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    return user
 
@@ -1,15 +1,24 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from sqlalchemy.orm import Session
 from sqlalchemy import desc
 
-from app.db.session import get_db
+from app.db.session import get_db, get_read_db, replica_router
 from app.models.message import Message
 from app.models.room import Room
-from app.models.user import User
-from app.schemas.message import MessageCreate, MessageResponse
-from app.core.security import get_current_user
-from app.services.moderation import moderate_content
+from app.schemas.message import MessageCreate, MessageResponse, ThreadResponse
+from app.core.rate_limit import RateLimit
+from app.core.security import CurrentUser, get_current_user, get_optional_user
+from app.core.serialization import json_list_response, message_list_adapter
+from app.services.activity import room_activity
+from app.services.authors import author_profiles
+from app.services.deferred_moderation import deferred_moderation, deliver_first
+from app.services.moderation import moderate_content, quick_check
+from app.services.mentions import mention_index
+from app.services.dedup import commit_message, duplicate_sends_total, find_duplicate
+from app.services.read_markers import next_room_seq, read_markers
+from app.services.room_access import room_access
+from app.services.threads import attach_reply, get_thread_page, get_thread_root
 
 router = APIRouter()
 
@@ -19,22 +28,34 @@ async def get_messages(
     room_id: int,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    after_seq: Optional[int] = None,
+    current_user: Optional[CurrentUser] = Depends(get_optional_user),
+    db: Session = Depends(get_read_db)
 ):
-    """Get messages for a room (paginated)"""
-    # Verify room exists and is public
+    """Get messages for a room (paginated, or everything after a sequence number to resume)"""
+    # Verify room exists and the caller may read it
     room = db.query(Room).filter(Room.id == room_id).first()
     if not room:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Room not found"
         )
-    if not room.is_public:
+    if not room_access.can_access(db, room, current_user.id if current_user else None):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Room is private"
         )
     
+    if after_seq is not None:
+        messages = (
+            db.query(Message)
+            .filter(Message.room_id == room_id, Message.seq > after_seq)
+            .order_by(Message.seq)
+            .limit(limit)
+            .all()
+        )
+        return json_list_response(message_list_adapter, messages)
+    
     messages = (
         db.query(Message)
         .filter(Message.room_id == room_id)
@@ -43,31 +64,44 @@ async def get_messages(
         .limit(limit)
         .all()
     )
-    return messages
+    return json_list_response(message_list_adapter, messages)
 
 
-@router.post("/rooms/{room_id}/messages", response_model=MessageResponse, status_code=status.HTTP_201_CREATED)
+@router.post(
+    "/rooms/{room_id}/messages",
+    response_model=MessageResponse,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(RateLimit("messages", "user"))]
+)
 async def create_message(
     room_id: int,
     message_data: MessageCreate,
-    current_user: User = Depends(get_current_user),
+    response: Response,
+    current_user: CurrentUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Send a message to a room (authenticated users only)"""
-    # Verify room exists and is public
+    """Send a message to a room (authenticated users only; resends with the same client_msg_id return 200)"""
+    # Verify room exists and the sender may post in it
     room = db.query(Room).filter(Room.id == room_id).first()
     if not room:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Room not found"
         )
-    if not room.is_public:
+    if not room_access.can_access(db, room, current_user.id):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Room is private"
         )
     
+    existing = find_duplicate(db, current_user.id, message_data.client_msg_id)
+    if existing:
+        duplicate_sends_total.inc(source="rest")
+        response.status_code = status.HTTP_200_OK
+        return existing
+    
     # Verify reply_to message exists if provided
+    reply_message = None
     if message_data.reply_to_id:
         reply_message = db.query(Message).filter(Message.id == message_data.reply_to_id).first()
         if not reply_message:
@@ -81,8 +115,9 @@ async def create_message(
                 detail="Reply message is not in this room"
             )
     
-    # Moderate content
-    is_safe, reason = moderate_content(message_data.content)
+    # Moderate content (trusted senders / opted-in rooms: remote check after the response)
+    deferred = deliver_first(room, current_user.is_trusted) and deferred_moderation.has_capacity()
+    is_safe, reason = quick_check(message_data.content) if deferred else moderate_content(message_data.content)
     if not is_safe:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -93,22 +128,50 @@ async def create_message(
         content=message_data.content,
         room_id=room_id,
         user_id=current_user.id,
-        reply_to_id=message_data.reply_to_id
+        client_msg_id=message_data.client_msg_id,
+        seq=next_room_seq(db, room_id),
+        pending_moderation=deferred
     )
+    author_profiles.stamp(db, db_message)
+    if reply_message is not None:
+        attach_reply(db, db_message, reply_message)
     db.add(db_message)
-    db.commit()
-    db.refresh(db_message)
+    db_message, created = commit_message(db, db_message)
+    if not created:
+        duplicate_sends_total.inc(source="rest")
+        response.status_code = status.HTTP_200_OK
+        return db_message
+    replica_router.note_write(current_user.username)
+    read_markers.message_committed(
+        room_id, db_message.seq, sender=(current_user.username, current_user.id, db_message.id)
+    )
+    room_activity.record(room_id, current_user.id)
+    mention_index.submit(db_message)
+    if deferred:
+        await deferred_moderation.after_delivery(db_message)
     return db_message
 
 
-@router.post("/messages/{message_id}/reply", response_model=MessageResponse, status_code=status.HTTP_201_CREATED)
+@router.post(
+    "/messages/{message_id}/reply",
+    response_model=MessageResponse,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(RateLimit("messages", "user"))]
+)
 async def reply_to_message(
     message_id: int,
     message_data: MessageCreate,
-    current_user: User = Depends(get_current_user),
+    response: Response,
+    current_user: CurrentUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Reply to a specific message (convenience endpoint)"""
+    existing = find_duplicate(db, current_user.id, message_data.client_msg_id)
+    if existing:
+        duplicate_sends_total.inc(source="rest")
+        response.status_code = status.HTTP_200_OK
+        return existing
+    
     # Get the original message
     original_message = db.query(Message).filter(Message.id == message_id).first()
     if not original_message:
@@ -116,9 +179,19 @@ async def reply_to_message(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Message not found"
         )
+    if original_message.room_id is not None and not room_access.allowed(db, original_message.room_id, current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Room is private"
+        )
     
-    # Moderate content
-    is_safe, reason = moderate_content(message_data.content)
+    # Moderate content (trusted senders / opted-in rooms: remote check after the response)
+    deferred = (
+        original_message.room is not None
+        and deliver_first(original_message.room, current_user.is_trusted)
+        and deferred_moderation.has_capacity()
+    )
+    is_safe, reason = quick_check(message_data.content) if deferred else moderate_content(message_data.content)
     if not is_safe:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -130,10 +203,56 @@ async def reply_to_message(
         content=message_data.content,
         room_id=original_message.room_id,
         user_id=current_user.id,
-        reply_to_id=message_id
+        client_msg_id=message_data.client_msg_id,
+        pending_moderation=deferred
     )
+    author_profiles.stamp(db, db_message)
+    attach_reply(db, db_message, original_message)
+    if original_message.room_id is not None:
+        db_message.seq = next_room_seq(db, original_message.room_id)
     db.add(db_message)
-    db.commit()
-    db.refresh(db_message)
+    db_message, created = commit_message(db, db_message)
+    if not created:
+        duplicate_sends_total.inc(source="rest")
+        response.status_code = status.HTTP_200_OK
+        return db_message
+    replica_router.note_write(current_user.username)
+    if db_message.seq is not None:
+        read_markers.message_committed(
+            db_message.room_id, db_message.seq, sender=(current_user.username, current_user.id, db_message.id)
+        )
+        room_activity.record(db_message.room_id, current_user.id)
+    mention_index.submit(db_message)
+    if deferred:
+        await deferred_moderation.after_delivery(db_message)
     return db_message
 
+
+@router.get("/messages/{message_id}/thread", response_model=ThreadResponse)
+async def get_thread(
+    message_id: int,
+    after_id: int = 0,
+    limit: int = 50,
+    current_user: Optional[CurrentUser] = Depends(get_optional_user),
+    db: Session = Depends(get_read_db)
+):
+    """Get the thread a message belongs to: its root plus one page of replies in order"""
+    root = get_thread_root(db, message_id)
+    if not root:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Message not found"
+        )
+    if root.room is None or not room_access.can_access(db, root.room, current_user.id if current_user else None):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Room is private"
+        )
+    
+    replies, next_after_id = get_thread_page(db, root.id, after_id, max(1, min(limit, 200)))
+    return ThreadResponse(
+        root=root,
+        replies=replies,
+        reply_count=root.reply_count,
+        next_after_id=next_after_id
+    )
@@ -1,12 +1,21 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
 from sqlalchemy.orm import Session
 
-from app.db.session import get_db
+from app.db.session import get_db, get_read_db, replica_router
 from app.models.room import Room
+from app.models.room_member import RoomMember
+from app.models.message import Message
 from app.models.user import User
-from app.schemas.room import RoomCreate, RoomResponse
-from app.core.security import get_current_user
+from app.schemas.room import (
+    RoomCreate, RoomCapacityUpdate, RoomMemberAdd, RoomMemberResponse, RoomResponse, RoomRetentionUpdate
+)
+from app.schemas.read_marker import ReadMarkerUpdate, UnreadCount
+from app.core.security import CurrentUser, get_current_user, get_optional_user
+from app.core.serialization import json_list_response, unread_list_adapter
+from app.services.read_markers import read_markers
+from app.services.room_access import room_access
+from app.services.room_directory import etag_matches, room_directory
 
 router = APIRouter()
 
@@ -15,17 +24,27 @@ router = APIRouter()
 async def list_rooms(
     skip: int = 0,
     limit: int = 100,
+    if_none_match: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
-    """List all public rooms"""
-    rooms = db.query(Room).filter(Room.is_public == True).offset(skip).limit(limit).all()
-    return rooms
+    """List all public rooms (cached, with live occupancy)"""
+    # Stays on the primary: a page cached under a new directory version must
+    # not be loaded from a replica that hasn't replayed the change yet
+    content, etag = room_directory.render(db, skip, limit)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(
+        content=content,
+        media_type="application/json",
+        headers=headers
+    )
 
 
 @router.post("", response_model=RoomResponse, status_code=status.HTTP_201_CREATED)
 async def create_room(
     room_data: RoomCreate,
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Create a new room (authenticated users only)"""
@@ -41,30 +60,254 @@ async def create_room(
         name=room_data.name,
         description=room_data.description,
         is_public=room_data.is_public,
+        retention_days=room_data.retention_days,
+        max_connections=room_data.max_connections,
         created_by=current_user.id
     )
     db.add(db_room)
+    if not db_room.is_public:
+        # The creator is the first member of a private room
+        db.flush()
+        db.add(RoomMember(room_id=db_room.id, user_id=current_user.id))
     db.commit()
     db.refresh(db_room)
+    replica_router.note_write(current_user.username)
+    room_directory.invalidate()
     return db_room
 
 
+@router.put("/{room_id}/retention", response_model=RoomResponse)
+async def set_room_retention(
+    room_id: int,
+    policy: RoomRetentionUpdate,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Set how long a room keeps messages (room creator or admin)"""
+    room = db.query(Room).filter(Room.id == room_id).first()
+    if not room:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Room not found"
+        )
+    if room.created_by != current_user.id and not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only the room creator can change retention"
+        )
+    room.retention_days = policy.retention_days
+    db.commit()
+    db.refresh(room)
+    replica_router.note_write(current_user.username)
+    room_directory.invalidate()
+    return room
+
+
+@router.put("/{room_id}/capacity", response_model=RoomResponse)
+async def set_room_capacity(
+    room_id: int,
+    capacity: RoomCapacityUpdate,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Set how many sockets a room admits at once (room creator or admin)"""
+    room = db.query(Room).filter(Room.id == room_id).first()
+    if not room:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Room not found"
+        )
+    if room.created_by != current_user.id and not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only the room creator can change capacity"
+        )
+    room.max_connections = capacity.max_connections
+    db.commit()
+    db.refresh(room)
+    replica_router.note_write(current_user.username)
+    room_directory.invalidate()
+    return room
+
+
+@router.get("/unread", response_model=List[UnreadCount])
+async def list_unread(
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Unread counts for every room the current user has read in"""
+    return json_list_response(unread_list_adapter, read_markers.get_unread(db, current_user.id))
+
+
+@router.put("/{room_id}/read", response_model=UnreadCount)
+async def mark_room_read(
+    room_id: int,
+    marker: ReadMarkerUpdate,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Move the current user's read marker in a room up to a message"""
+    if not room_access.allowed(db, room_id, current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Room is private"
+        )
+    message = db.query(Message.id, Message.seq).filter(
+        Message.id == marker.message_id, Message.room_id == room_id
+    ).first()
+    if not message or message.seq is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Message not found"
+        )
+    read_markers.mark_read(current_user.id, room_id, message.id, message.seq, username=current_user.username)
+    last_read_id, last_read_seq = read_markers.get_marker(current_user.id, room_id)
+    head_seq = read_markers.get_heads(db, [room_id]).get(room_id, last_read_seq)
+    return UnreadCount(
+        room_id=room_id,
+        last_read_id=last_read_id,
+        last_read_seq=last_read_seq,
+        head_seq=head_seq,
+        unread=max(0, head_seq - last_read_seq)
+    )
+
+
+@router.get("/private", response_model=List[RoomResponse])
+async def list_private_rooms(
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """Private rooms the current user is a member of"""
+    return (
+        db.query(Room)
+        .join(RoomMember, RoomMember.room_id == Room.id)
+        .filter(RoomMember.user_id == current_user.id, Room.is_public == False)
+        .order_by(Room.id)
+        .all()
+    )
+
+
 @router.get("/{room_id}", response_model=RoomResponse)
 async def get_room(
     room_id: int,
-    db: Session = Depends(get_db)
+    current_user: Optional[CurrentUser] = Depends(get_optional_user),
+    db: Session = Depends(get_read_db)
 ):
-    """Get room details by ID"""
+    """Get room details by ID (private rooms: members only)"""
     room = db.query(Room).filter(Room.id == room_id).first()
     if not room:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Room not found"
         )
-    if not room.is_public:
+    if not room_access.can_access(db, room, current_user.id if current_user else None):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Room is private"
         )
     return room
 
+
+def get_private_room(db: Session, room_id: int) -> Room:
+    room = db.query(Room).filter(Room.id == room_id).first()
+    if not room:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Room not found"
+        )
+    if room.is_public:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Public rooms have no member list"
+        )
+    return room
+
+
+@router.get("/{room_id}/members", response_model=List[RoomMemberResponse])
+async def list_room_members(
+    room_id: int,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Members of a private room (members only)"""
+    room = get_private_room(db, room_id)
+    if not room_access.can_access(db, room, current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Room is private"
+        )
+    return (
+        db.query(RoomMember.user_id, User.username, RoomMember.created_at)
+        .join(User, User.id == RoomMember.user_id)
+        .filter(RoomMember.room_id == room_id)
+        .order_by(RoomMember.created_at, RoomMember.user_id)
+        .all()
+    )
+
+
+@router.post("/{room_id}/members", response_model=RoomMemberResponse, status_code=status.HTTP_201_CREATED)
+async def add_room_member(
+    room_id: int,
+    member: RoomMemberAdd,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Let a user into a private room (room creator or admin)"""
+    room = get_private_room(db, room_id)
+    if room.created_by != current_user.id and not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only the room creator can add members"
+        )
+    user = db.query(User).filter(User.username == member.username, User.is_active == True).first()
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    if db.get(RoomMember, (room_id, user.id)):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Already a member"
+        )
+    db_member = RoomMember(room_id=room_id, user_id=user.id)
+    db.add(db_member)
+    db.commit()
+    db.refresh(db_member)
+    replica_router.note_write(current_user.username)
+    room_access.member_added(room_id, user.id, user.username)
+    return {"user_id": user.id, "username": user.username, "created_at": db_member.created_at}
+
+
+@router.delete("/{room_id}/members/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def remove_room_member(
+    room_id: int,
+    user_id: int,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Remove a member from a private room (room creator or admin), or leave it yourself"""
+    room = get_private_room(db, room_id)
+    if user_id != current_user.id and room.created_by != current_user.id and not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only the room creator can remove members"
+        )
+    if user_id == room.created_by:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="The room creator can't be removed"
+        )
+    db_member = db.get(RoomMember, (room_id, user_id))
+    if not db_member:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Not a member"
+        )
+    username = db.query(User.username).filter(User.id == user_id).scalar()
+    db.delete(db_member)
+    db.commit()
+    replica_router.note_write(current_user.username)
+    await room_access.member_removed(room_id, user_id, username)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
@@ -1,19 +1,62 @@
-from fastapi import APIRouter, Depends
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
 
-from app.db.session import get_db
+from app.db.session import get_db, replica_router
 from app.models.user import User
-from app.schemas.user import UserResponse
-from app.core.security import get_current_user
+from app.schemas.message import MentionInboxResponse
+from app.schemas.user import UserResponse, UserUpdate
+from app.core.security import CurrentUser, get_current_user
+from app.services.authors import author_profiles
+from app.services.mentions import mention_index
 
 router = APIRouter()
 
 
 @router.get("/me", response_model=UserResponse)
 async def get_me(
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get current user information"""
-    return current_user
+    user = db.get(User, current_user.id)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    return user
 
+
+@router.patch("/me", response_model=UserResponse)
+async def update_me(
+    profile: UserUpdate,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Update the current user's profile (existing messages pick it up in the background)"""
+    user = db.get(User, current_user.id)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    for field, value in profile.model_dump(exclude_unset=True).items():
+        setattr(user, field, value)
+    db.commit()
+    db.refresh(user)
+    replica_router.note_write(current_user.username)
+    author_profiles.changed(user)
+    return user
+
+
+@router.get("/me/mentions", response_model=MentionInboxResponse)
+async def get_my_mentions(
+    before_id: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=200),
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Messages that @mention the current user, newest first (pass next_before_id for older ones)"""
+    mentions, next_before_id = mention_index.inbox(db, current_user.id, before_id, limit)
+    return {"mentions": mentions, "next_before_id": next_before_id}
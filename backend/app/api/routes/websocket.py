@@ -1,36 +1,68 @@
+import time
+
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException, status
 from sqlalchemy.orm import Session
-from jose import JWTError, jwt
 from typing import Optional
 
 from app.core.config import settings
-from app.core.security import get_current_user
-from app.db.session import SessionLocal
-from app.models.user import User
+from app.core.metrics import ws_message_stage_seconds
+from app.core.security import decode_access_token
+from app.core.serialization import loads
+from app.core.tracing import span, span_between, tracer
+from app.db.session import SessionLocal, replica_router
 from app.models.room import Room
 from app.models.message import Message
+from app.websocket.admission import admission
+from app.websocket.affinity import room_affinity, ws_misrouted_connections_total
+from app.websocket.drain import drain
 from app.websocket.manager import manager
 from app.schemas.message import MessageResponse
-from app.services.moderation import moderate_content
+from app.services.activity import room_activity
+from app.services.authors import author_profiles
+from app.services.deferred_moderation import deferred_moderation, deliver_first
+from app.services.moderation import moderate_content, quick_check
+from app.services.mentions import mention_index
+from app.services.dedup import commit_message, duplicate_sends_total, find_duplicate
+from app.services.read_markers import next_room_seq, read_markers
+from app.services.room_access import room_access
+from app.services.threads import attach_reply
 
 router = APIRouter()
 
 
 def get_user_from_token(token: str) -> Optional[dict]:
-    """Extract user info from JWT token"""
-    try:
-        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
-        username: str = payload.get("sub")
-        if username:
-            return {"username": username}
-    except JWTError:
+    """Extract user info from an access token (revocation checked, no database lookup)"""
+    user = decode_access_token(token)
+    if user is None:
         return None
-    return None
+    return {"username": user.username, "user_id": user.id, "is_trusted": user.is_trusted}
+
+
+def message_frame(message: Message) -> dict:
+    """Chat frame for a stored message (author from its snapshot)"""
+    return {
+        "type": "message",
+        "id": message.id,
+        "content": message.content,
+        "room_id": message.room_id,
+        "user_id": message.user_id,
+        "username": message.author_username,
+        "avatar_url": message.author_avatar_url,
+        "reply_to_id": message.reply_to_id,
+        "thread_root_id": message.thread_root_id,
+        "client_msg_id": message.client_msg_id,
+        "seq": message.seq,
+        "created_at": message.created_at.isoformat()
+    }
 
 
 @router.websocket("/system")
 async def system_websocket_endpoint(websocket: WebSocket):
     """WebSocket endpoint for global system events (presence, DMs)"""
+    if drain.draining:
+        await drain.reject(websocket)
+        return
+    
     token = websocket.query_params.get("token")
     if not token:
         await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
@@ -41,30 +73,60 @@ async def system_websocket_endpoint(websocket: WebSocket):
         await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
         return
 
-    # Connect to system "room" (id=0) with username
-    await manager.connect(websocket, 0, user_info["username"])
+    # Caps and load shedding, then wait for a handshake slot
+    if not await admission.admit(websocket, user_info["username"]):
+        return
     
     try:
-        # Send initial presence list
-        online_users = await manager.get_online_users()
-        await manager.send_personal_message({
-            "type": "presence_sync",
-            "users": online_users
-        }, websocket)
+        try:
+            # Connect to system "room" (id=0) with username
+            await manager.connect(websocket, 0, user_info["username"])
+            
+            # Send initial presence list
+            online_users = await manager.get_online_users()
+            await manager.send_personal_message({
+                "type": "presence_sync",
+                "users": online_users
+            }, websocket)
+            
+            # Send unread state and subscribe to unread deltas
+            db = SessionLocal()
+            try:
+                await manager.send_personal_message({
+                    "type": "unread_sync",
+                    "rooms": read_markers.watch(db, user_info["username"], user_info["user_id"])
+                }, websocket)
+            finally:
+                db.close()
+        finally:
+            admission.done(user_info["username"])
         
         while True:
-            data = await websocket.receive_json()
+            data = loads(await websocket.receive_text())
+            manager.touch(websocket)
+            if data.get("type") == "ping":
+                await manager.send_personal_message({"type": "pong"}, websocket)
+            elif data.get("type") == "route" and isinstance(data.get("room_id"), int):
+                # Which worker to open a room socket on
+                await manager.send_personal_message(room_affinity.route(data["room_id"]), websocket)
             # Handle DMs here later
             
     except WebSocketDisconnect:
         await manager.disconnect(websocket, user_info["username"])
     except Exception:
         await manager.disconnect(websocket, user_info["username"])
+    finally:
+        if not manager.has_system_connection(user_info["username"]):
+            read_markers.unwatch(user_info["username"])
 
 
 @router.websocket("/{room_id}")
 async def websocket_endpoint(websocket: WebSocket, room_id: int):
     """WebSocket endpoint for real-time chat in a room"""
+    if drain.draining:
+        await drain.reject(websocket)
+        return
+    
     # Get token from query params
     token = websocket.query_params.get("token")
     if not token:
@@ -77,29 +139,55 @@ async def websocket_endpoint(websocket: WebSocket, room_id: int):
         await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
         return
     
-    # Verify room exists and is public
+    # Caps and load shedding, then wait for a handshake slot
+    if not await admission.admit(websocket, user_info["username"]):
+        return
+    
+    # Verify room exists and the user may join it
     db = SessionLocal()
     try:
-        room = db.query(Room).filter(Room.id == room_id).first()
-        if not room:
-            await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Room not found")
-            db.close()
-            return
-        if not room.is_public:
-            await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Room is private")
-            db.close()
-            return
-        
-        # Connect to room with username for presence
-        await manager.connect(websocket, room_id, user_info["username"])
+        try:
+            room = db.query(Room).filter(Room.id == room_id).first()
+            if not room:
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Room not found")
+                db.close()
+                return
+            if not room_access.can_access(db, room, user_info["user_id"]):
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Room is private")
+                db.close()
+                return
+            # Membership is checked again per message (cached; removals also close the socket)
+            private = not room.is_public
+            rejection = admission.check_room(room)
+            if rejection:
+                await admission.reject(websocket, rejection)
+                db.close()
+                return
+            
+            # Connect to room with username for presence
+            # Clients that ask for it get their frames coalesced (see app.websocket.batching)
+            batch = websocket.query_params.get("batch") == "1" and settings.ws_batch_window_ms > 0
+            await manager.connect(websocket, room_id, user_info["username"], batch=batch)
+        finally:
+            admission.done(user_info["username"])
         
         # Send welcome message
         await manager.send_personal_message({
             "type": "connected",
             "message": f"Connected to {room.name}",
-            "room_id": room_id
+            "room_id": room_id,
+            "batch_ms": settings.ws_batch_window_ms if batch else 0
         }, websocket)
         
+        # Served here either way (the relay keeps rooms in sync across workers), but
+        # point the client at the owning worker for next time
+        if room_affinity.enabled and not room_affinity.is_local(room_id):
+            ws_misrouted_connections_total.inc()
+            await manager.send_personal_message(room_affinity.route(room_id), websocket)
+        
+        # Trusted senders / opted-in rooms: broadcast first, remote moderation afterwards
+        defer_moderation = deliver_first(room, user_info["is_trusted"])
+        
         # Notify others in room
         await manager.broadcast_to_room({
             "type": "user_joined",
@@ -110,54 +198,135 @@ async def websocket_endpoint(websocket: WebSocket, room_id: int):
         try:
             while True:
                 # Receive message from client
-                data = await websocket.receive_json()
+                raw = await websocket.receive_text()
+                manager.touch(websocket)
+                received_ns = time.time_ns()
+                with ws_message_stage_seconds.time(stage="receive"):
+                    data = loads(raw)
+                decoded_ns = time.time_ns()
                 
                 if data.get("type") == "message":
-                    content = data.get("content", "").strip()
-                    reply_to_id = data.get("reply_to_id")
-                    
-                    if not content:
-                        continue
-                    
-                    # Moderate content
-                    is_safe, reason = moderate_content(content)
-                    if not is_safe:
-                        await manager.send_personal_message({
-                            "type": "error",
-                            "message": reason or "Message content violates community guidelines"
-                        }, websocket)
-                        continue
-                    
-                    # Get user from database
-                    user = db.query(User).filter(User.username == user_info["username"]).first()
-                    if not user:
-                        continue
-                    
-                    # Create message in database
-                    db_message = Message(
-                        content=content,
-                        room_id=room_id,
-                        user_id=user.id,
-                        reply_to_id=reply_to_id
-                    )
-                    db.add(db_message)
-                    db.commit()
-                    db.refresh(db_message)
-                    
-                    # Prepare message response
-                    message_response = {
-                        "type": "message",
-                        "id": db_message.id,
-                        "content": db_message.content,
-                        "room_id": db_message.room_id,
-                        "user_id": db_message.user_id,
-                        "username": user.username,
-                        "reply_to_id": db_message.reply_to_id,
-                        "created_at": db_message.created_at.isoformat()
-                    }
-                    
-                    # Broadcast to all in room
-                    await manager.broadcast_to_room(message_response, room_id)
+                    if private and not room_access.allowed(db, room_id, user_info["user_id"]):
+                        await manager.remove_connection(websocket, "removed", code=status.WS_1008_POLICY_VIOLATION)
+                        break
+                    with tracer.trace(
+                        "chat.message", start_ns=received_ns, room_id=room_id, user_id=user_info["user_id"]
+                    ) as trace_root:
+                        span_between("decode", received_ns, decoded_ns, bytes=len(raw))
+                        content = data.get("content", "").strip()
+                        reply_to_id = data.get("reply_to_id")
+                        client_msg_id = data.get("client_msg_id")
+                        
+                        if not content:
+                            continue
+                        # Error frames echo client_msg_id so the client stops resending a rejected message
+                        if client_msg_id is not None and (not isinstance(client_msg_id, str) or len(client_msg_id) > 64):
+                            await manager.send_personal_message({
+                                "type": "error",
+                                "message": "Invalid client_msg_id",
+                                "client_msg_id": client_msg_id
+                            }, websocket)
+                            continue
+                        
+                        # Moderate content
+                        deferred = defer_moderation and deferred_moderation.has_capacity()
+                        with ws_message_stage_seconds.time(stage="moderate"), span("moderate", deferred=deferred):
+                            is_safe, reason = quick_check(content) if deferred else moderate_content(content)
+                        if not is_safe:
+                            await manager.send_personal_message({
+                                "type": "error",
+                                "message": reason or "Message content violates community guidelines",
+                                "client_msg_id": client_msg_id
+                            }, websocket)
+                            continue
+                        
+                        parent = None
+                        if reply_to_id:
+                            with span("reply_lookup"):
+                                parent = db.query(Message).filter(
+                                    Message.id == reply_to_id, Message.room_id == room_id
+                                ).first()
+                            if not parent:
+                                await manager.send_personal_message({
+                                    "type": "error",
+                                    "message": "Reply message not found",
+                                    "client_msg_id": client_msg_id
+                                }, websocket)
+                                continue
+                        
+                        # Finish persisting and fanning out even if a drain starts meanwhile
+                        async with drain.inflight():
+                            with ws_message_stage_seconds.time(stage="persist"):
+                                # Sender identity comes from the token, the profile snapshot from the author cache
+                                user_id, username = user_info["user_id"], user_info["username"]
+                                
+                                # A resend of something already stored: echo it back to the sender only
+                                with span("dedup_lookup"):
+                                    db_message = find_duplicate(db, user_id, client_msg_id)
+                                created = False
+                                if db_message is None:
+                                    # Create message in database
+                                    with span("next_seq"):
+                                        seq = next_room_seq(db, room_id)
+                                    db_message = Message(
+                                        content=content,
+                                        room_id=room_id,
+                                        user_id=user_id,
+                                        client_msg_id=client_msg_id,
+                                        seq=seq,
+                                        pending_moderation=deferred
+                                    )
+                                    author_profiles.stamp(db, db_message)
+                                    if parent is not None:
+                                        attach_reply(db, db_message, parent)
+                                    db.add(db_message)
+                                    db_message, created = commit_message(db, db_message)
+                                if not created:
+                                    duplicate_sends_total.inc(source="websocket")
+                                    await manager.send_personal_message(message_frame(db_message), websocket)
+                                    continue
+                                replica_router.note_write(username)
+                            
+                            # Prepare message response
+                            message_response = message_frame(db_message)
+                            if trace_root is not None:
+                                # Lets a client report a slow message by trace id
+                                trace_root.set(message_id=db_message.id)
+                                message_response["trace_id"] = trace_root.trace_id
+                            
+                            with ws_message_stage_seconds.time(stage="broadcast"):
+                                # Broadcast to all in room
+                                with span("broadcast"):
+                                    await manager.broadcast_to_room(message_response, room_id)
+                                
+                                # Unread deltas for users watching this room (background queue)
+                                read_markers.message_committed(
+                                    room_id, db_message.seq, sender=(username, user_id, db_message.id)
+                                )
+                            
+                            # Per-minute activity counters (flushed into the rollups)
+                            room_activity.record(room_id, user_id)
+                            
+                            # Index @mentions and push them to the mentioned users (background queue)
+                            mention_index.submit(db_message)
+                            
+                            if deferred:
+                                with span("moderation_enqueue"):
+                                    await deferred_moderation.after_delivery(db_message)
+                
+                elif data.get("type") == "read":
+                    # Move the read marker (coalesced, flushed in batches)
+                    message_id = data.get("message_id")
+                    message = db.query(Message.id, Message.seq).filter(
+                        Message.id == message_id, Message.room_id == room_id
+                    ).first()
+                    if message and message.seq is not None:
+                        read_markers.mark_read(
+                            user_info["user_id"], room_id, message.id, message.seq, username=user_info["username"]
+                        )
+                
+                elif data.get("type") == "ping":
+                    await manager.send_personal_message({"type": "pong"}, websocket)
                 
                 elif data.get("type") == "typing":
                     # Broadcast typing indicator
@@ -168,13 +337,13 @@ async def websocket_endpoint(websocket: WebSocket, room_id: int):
                     }, room_id, exclude=websocket)
         
         except WebSocketDisconnect:
-            await manager.disconnect(websocket, user_info["username"])
-            # Notify others in room
-            await manager.broadcast_to_room({
-                "type": "user_left",
-                "username": user_info["username"],
-                "room_id": room_id
-            }, room_id)
+            # Notify others in room (unless the reaper already removed this socket)
+            if await manager.disconnect(websocket, user_info["username"]):
+                await manager.broadcast_to_room({
+                    "type": "user_left",
+                    "username": user_info["username"],
+                    "room_id": room_id
+                }, room_id)
         finally:
             db.close()
     
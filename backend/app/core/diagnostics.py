@@ -0,0 +1,210 @@
+"""
+Diagnostics
+- Slow-query log: SQLAlchemy cursor listeners that log statements over a
+  threshold together with the app call site that issued them.
+- Event-loop lag monitor: a loop task measures scheduling drift, and a
+  watchdog thread captures the loop thread's stack while it is blocked, so
+  the offending callback shows up in the log.
+- Sampling profiler: samples every thread's stack for N seconds and returns
+  collapsed stacks (one "frame;frame;frame count" line per stack), the input
+  format of flamegraph.pl and speedscope.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter as StackCounter
+from typing import Optional
+
+from sqlalchemy import event
+
+from app.core.config import settings
+from app.core.metrics import Counter, Gauge, Histogram, db_commit_seconds
+
+logger = logging.getLogger("app.diagnostics")
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+slow_queries_total = Counter("db_slow_queries_total", "Statements slower than the slow-query threshold")
+db_statement_seconds = Histogram("db_statement_seconds", "Cursor execute latency")
+event_loop_lag_seconds = Histogram(
+    "event_loop_lag_seconds", "Event loop scheduling delay",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+)
+event_loop_stalls_total = Counter("event_loop_stalls_total", "Times the loop was blocked over the lag threshold")
+
+
+def _call_site() -> str:
+    """Innermost app frame outside this module, e.g. app/api/routes/websocket.py:142 in websocket_endpoint"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(APP_DIR) and filename != __file__:
+            return f"{os.path.relpath(filename, os.path.dirname(APP_DIR))}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return "unknown"
+
+
+def install_slow_query_log(engine) -> None:
+    """Attach cursor timing listeners to an engine"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+        db_statement_seconds.observe(elapsed)
+        if elapsed * 1000 >= settings.slow_query_threshold_ms:
+            slow_queries_total.inc()
+            logger.warning(
+                "Slow query (%.1f ms) at %s: %s",
+                elapsed * 1000, _call_site(), " ".join(statement.split())[:1000]
+            )
+
+
+def install_commit_timer(session_factory) -> None:
+    """Time ORM commits for every session made by the factory"""
+
+    @event.listens_for(session_factory, "before_commit")
+    def before_commit(session):
+        session.info["commit_start_time"] = time.perf_counter()
+
+    @event.listens_for(session_factory, "after_commit")
+    def after_commit(session):
+        start = session.info.pop("commit_start_time", None)
+        if start is not None:
+            db_commit_seconds.observe(time.perf_counter() - start)
+
+
+def install_pool_metrics(engine) -> None:
+    """Connection pool gauges, read at scrape time"""
+    pool = engine.pool
+
+    def pool_state():
+        state = {}
+        for name in ("size", "checkedin", "checkedout", "overflow"):
+            getter = getattr(pool, name, None)
+            if getter is not None:
+                state[(name,)] = getter()
+        return state
+
+    Gauge("db_pool_connections", "SQLAlchemy pool state", ("state",), callback=pool_state)
+    checkouts = Counter("db_pool_checkouts_total", "Connections checked out of the pool")
+    event.listen(engine, "checkout", lambda *args: checkouts.inc())
+
+
+_installed = False
+
+
+def install(engine, session_factory, replica_engines=()) -> None:
+    """Install all database instrumentation once per process"""
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    install_slow_query_log(engine)
+    for replica_engine in replica_engines:
+        install_slow_query_log(replica_engine)
+    install_commit_timer(session_factory)
+    install_pool_metrics(engine)
+
+
+class LoopLagMonitor:
+    """Measures event-loop drift and reports the stack of whatever is blocking it"""
+
+    def __init__(self):
+        self.heartbeat = time.monotonic()
+        # Smoothed drift of recent ticks (load shedding reads this)
+        self.recent_lag = 0.0
+        self.loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    @property
+    def lag_seconds(self) -> float:
+        """How long the loop has gone without ticking (0 while healthy)"""
+        return max(0.0, time.monotonic() - self.heartbeat - settings.loop_lag_check_interval_seconds)
+
+    async def _run(self) -> None:
+        interval = settings.loop_lag_check_interval_seconds
+        while True:
+            expected = time.monotonic() + interval
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            drift = max(0.0, now - expected)
+            event_loop_lag_seconds.observe(drift)
+            self.recent_lag = 0.8 * self.recent_lag + 0.2 * drift
+            self.heartbeat = now
+
+    def _watch(self) -> None:
+        threshold = settings.loop_lag_threshold_ms / 1000
+        reported_for = None
+        while not self._stopped.wait(threshold / 2):
+            heartbeat = self.heartbeat
+            if self.lag_seconds < threshold or reported_for == heartbeat:
+                continue
+            # Report each stall once, with the loop thread's current stack
+            reported_for = heartbeat
+            event_loop_stalls_total.inc()
+            frame = sys._current_frames().get(self.loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "unavailable\n"
+            logger.warning("Event loop blocked for %.0f ms, loop thread is in:\n%s", self.lag_seconds * 1000, stack)
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        self.heartbeat = time.monotonic()
+        self.loop_thread_id = threading.get_ident()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._run())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def sample_stacks(seconds: float, interval: float) -> str:
+    """
+    Sample all threads (except this one) every `interval` seconds for `seconds`.
+
+    Blocking; call it from a worker thread. Thread names prefix each stack so
+    the event loop thread can be told apart from the thread pool.
+    """
+    own_id = threading.get_ident()
+    counts = StackCounter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            counts[f"{names.get(thread_id, thread_id)};{_collapse(frame)}"] += 1
+        time.sleep(interval)
+    return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+
+# Global loop lag monitor instance
+loop_monitor = LoopLagMonitor()
@@ -0,0 +1,99 @@
+"""
+Dependency health
+Startup checks run in parallel with a timeout and are repeated in the
+background. The app only reports ready once the database is reachable;
+Redis and OpenAI are optional and only mark the service as degraded.
+"""
+import asyncio
+import time
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.core.redis import ping_redis
+from app.db.session import engine
+
+
+def check_database() -> bool:
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    return True
+
+
+def check_redis() -> bool:
+    return ping_redis()
+
+
+def warm_openai() -> bool:
+    """Create the OpenAI client off the event loop so the first message doesn't pay for it"""
+    from app.services.moderation import get_openai_client
+    return get_openai_client() is not None
+
+
+CHECKS: Dict[str, Callable[[], bool]] = {
+    "database": check_database,
+    "redis": check_redis,
+}
+REQUIRED = {"database"}
+
+
+class DependencyHealth:
+    """Last known state of each dependency"""
+
+    def __init__(self):
+        self.status: Dict[str, bool] = {}
+        self.checked_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return all(self.status.get(name, False) for name in REQUIRED)
+
+    async def _run_check(self, name: str, check: Callable[[], bool]) -> None:
+        try:
+            self.status[name] = bool(await asyncio.wait_for(
+                asyncio.to_thread(check), timeout=settings.startup_check_timeout_seconds
+            ))
+        except Exception as e:
+            if self.status.get(name, True):
+                print(f"Health check failed for {name}: {e}")
+            self.status[name] = False
+
+    async def check_all(self) -> Dict[str, bool]:
+        await asyncio.gather(*(self._run_check(name, check) for name, check in CHECKS.items()))
+        self.checked_at = time.time()
+        return self.status
+
+    async def startup(self) -> None:
+        """Initial checks plus client warm-up, all in parallel"""
+        jobs = [self.check_all()]
+        if settings.openai_api_key:
+            jobs.append(self._run_check("openai", warm_openai))
+        await asyncio.gather(*jobs)
+        self._task = asyncio.create_task(self._monitor())
+
+    async def _monitor(self) -> None:
+        while True:
+            await asyncio.sleep(settings.health_check_interval_seconds)
+            await self.check_all()
+
+    async def shutdown(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def report(self) -> dict:
+        return {
+            "ready": self.ready,
+            "dependencies": {name: "up" if ok else "down" for name, ok in self.status.items()},
+            "checked_at": self.checked_at,
+        }
+
+
+# Global dependency health instance
+dependency_health = DependencyHealth()
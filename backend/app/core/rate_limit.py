@@ -0,0 +1,192 @@
+"""
+Rate limiting
+GCRA (generic cell rate algorithm) limits keyed by rule, client IP and/or
+JWT subject. A decision is one dict lookup and a few float operations, and
+runs as a route dependency before the database or bcrypt is touched.
+
+State lives in memory, split into lock-protected shards so threadpool
+handlers don't contend on one lock. With rate_limit_backend = "redis" the
+same algorithm runs as a Lua script, so all workers share one budget; if
+Redis is unavailable decisions fall back to the local shards.
+"""
+import functools
+import math
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+
+from app.core.config import settings
+from app.core.metrics import Counter
+from app.core.redis import get_redis_client, report_redis_failure
+from app.core.tokens import bearer_subject
+
+rate_limited_total = Counter("rate_limited_total", "Requests rejected by a rate limit", ("rule",))
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+# Keys a full shard drops per hit, so eviction stays O(1) under a flood of new keys
+EVICT_PER_HIT = 8
+
+
+@functools.lru_cache(maxsize=None)
+def parse_rate(rate: str) -> Tuple[int, float]:
+    """Parse "10/minute" or "30/10second" into (count, period seconds)"""
+    count, _, period = rate.partition("/")
+    digits = period.rstrip("abcdefghijklmnopqrstuvwxyz")
+    unit = period[len(digits):].rstrip("s") or "second"
+    if unit not in PERIODS:
+        raise ValueError(f"Unknown rate period in {rate!r}")
+    return int(count), float(digits or 1) * PERIODS[unit]
+
+
+@dataclass
+class Decision:
+    allowed: bool
+    remaining: int
+    retry_after: float
+
+
+def gcra(tat: float, now: float, emission: float, tolerance: float) -> Tuple[Decision, float]:
+    """
+    One GCRA step: returns the decision and the new theoretical arrival time.
+
+    `emission` is the spacing between requests at the sustained rate and
+    `tolerance` how far ahead of schedule a client may run (the burst).
+    """
+    new_tat = max(tat, now) + emission
+    ahead = new_tat - now
+    if ahead > tolerance:
+        return Decision(False, 0, ahead - tolerance), tat
+    return Decision(True, int((tolerance - ahead) // emission), 0.0), new_tat
+
+
+class MemoryStore:
+    """Sharded key -> theoretical arrival time map, least recently hit first"""
+
+    def __init__(self, shards: int = 16, max_keys_per_shard: int = 10000):
+        self._shards = [(OrderedDict(), threading.Lock()) for _ in range(shards)]
+        self._max_keys = max_keys_per_shard
+
+    def _shard(self, key: str) -> Tuple["OrderedDict[str, float]", threading.Lock]:
+        return self._shards[zlib.crc32(key.encode()) % len(self._shards)]
+
+    def hit(self, key: str, emission: float, tolerance: float) -> Decision:
+        tats, lock = self._shard(key)
+        now = time.monotonic()
+        with lock:
+            decision, tats[key] = gcra(tats.get(key, now), now, emission, tolerance)
+            tats.move_to_end(key)
+            if len(tats) > self._max_keys:
+                # A key whose TAT is in the past is the same as a fresh one; past
+                # the cap the least recently hit key goes even if it is not
+                for _ in range(EVICT_PER_HIT):
+                    oldest, tat = next(iter(tats.items()))
+                    if tat > now and len(tats) <= self._max_keys:
+                        break
+                    del tats[oldest]
+        return decision
+
+    def clear(self) -> None:
+        for tats, lock in self._shards:
+            with lock:
+                tats.clear()
+
+
+GCRA_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local emission = tonumber(ARGV[1])
+local tolerance = tonumber(ARGV[2])
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+local new_tat = math.max(tat, now) + emission
+local ahead = new_tat - now
+if ahead > tolerance then
+    return {0, 0, tostring(ahead - tolerance)}
+end
+redis.call('SET', KEYS[1], tostring(new_tat), 'PX', math.ceil(ahead * 1000))
+return {1, math.floor((tolerance - ahead) / emission), '0'}
+"""
+
+
+class RedisStore:
+    """Same algorithm as a Lua script, using Redis' clock so workers agree"""
+
+    def __init__(self):
+        self._script = None
+        self._client = None
+
+    def hit(self, key: str, emission: float, tolerance: float) -> Optional[Decision]:
+        """Decision from Redis, or None if Redis is unavailable"""
+        client = get_redis_client()
+        if client is None:
+            return None
+        try:
+            if self._script is None or self._client is not client:
+                self._script = client.register_script(GCRA_SCRIPT)
+                self._client = client
+            allowed, remaining, retry_after = self._script(keys=[f"ratelimit:{key}"], args=[emission, tolerance])
+        except Exception as e:
+            print(f"Rate limit Redis error, using local limits: {e}")
+            report_redis_failure()
+            return None
+        return Decision(bool(allowed), int(remaining), float(retry_after))
+
+
+memory_store = MemoryStore()
+redis_store = RedisStore()
+
+
+def client_ip(request: Request) -> str:
+    if settings.rate_limit_trust_forwarded_for:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+class RateLimit:
+    """
+    Route dependency enforcing one limit, e.g.
+
+        @router.post("/token", dependencies=[Depends(RateLimit("login", "ip"))])
+
+    `key` is "ip", "user" (JWT subject, falling back to the IP for anonymous
+    requests) or "ip+user". The rate comes from settings.rate_limit_<rule>.
+    """
+
+    def __init__(self, rule: str, key: str = "ip"):
+        self.rule = rule
+        self.key = key
+
+    def _identity(self, request: Request) -> str:
+        if self.key == "ip":
+            return client_ip(request)
+        subject = bearer_subject(request)
+        if self.key == "user":
+            return f"user:{subject}" if subject else client_ip(request)
+        return f"{client_ip(request)}|{subject or '-'}"
+
+    async def __call__(self, request: Request) -> None:
+        if not settings.rate_limit_enabled:
+            return
+        count, period = parse_rate(getattr(settings, f"rate_limit_{self.rule}"))
+        emission = period / count
+        key = f"{self.rule}:{self._identity(request)}"
+
+        decision = None
+        if settings.rate_limit_backend == "redis":
+            decision = redis_store.hit(key, emission, period)
+        if decision is None:
+            decision = memory_store.hit(key, emission, period)
+
+        if not decision.allowed:
+            rate_limited_total.inc(rule=self.rule)
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests, slow down",
+                headers={"Retry-After": str(max(1, math.ceil(decision.retry_after)))},
+            )
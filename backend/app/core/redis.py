@@ -0,0 +1,49 @@
+"""
+Shared Redis client
+Created lazily on first use instead of at import, and gated by the last
+health check so a Redis outage does not cost a failed connect per call.
+"""
+from typing import Optional
+
+from app.core.config import settings
+
+_client = None
+_healthy = True
+
+
+def _create_client():
+    global _client
+    if _client is None:
+        import redis
+        _client = redis.from_url(
+            settings.redis_url,
+            decode_responses=True,
+            socket_connect_timeout=settings.redis_timeout_seconds,
+            socket_timeout=settings.redis_timeout_seconds,
+        )
+    return _client
+
+
+def get_redis_client() -> Optional["redis.Redis"]:
+    """The shared client, or None if Redis is not configured or currently unhealthy"""
+    if not settings.redis_url or not _healthy:
+        return None
+    return _create_client()
+
+
+def ping_redis() -> bool:
+    """Health check (blocking); also re-enables the client once Redis is back"""
+    global _healthy
+    if not settings.redis_url:
+        return False
+    try:
+        _healthy = bool(_create_client().ping())
+    except Exception:
+        _healthy = False
+    return _healthy
+
+
+def report_redis_failure() -> None:
+    """Stop handing out the client until the next successful health check"""
+    global _healthy
+    _healthy = False
@@ -0,0 +1,245 @@
+"""
+Token revocation
+Access tokens are short-lived JWTs with a jti, checked without touching the
+database. Revoked keys ("jti:<id>" for one token, "user:<name>" for every
+token a user holds) live in Redis with a TTL of one access token lifetime,
+after which the tokens they cover have expired anyway, and each worker
+mirrors them in a Bloom filter. Almost every request is a filter miss and
+costs a few hashes; a hit (a revoked token, or a rare false positive) is
+confirmed against Redis.
+
+Revocations are published on a Redis channel so other workers add them
+within a moment, and the filter is rebuilt from Redis periodically, which
+also drops expired keys. Without Redis configured the revoked keys are kept
+in process and only this worker sees them. When a configured Redis is
+unreachable, a filter hit that this worker can't confirm counts as revoked,
+and the filter is only added to until Redis can be read again.
+"""
+import asyncio
+import hashlib
+import math
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+from app.core.config import settings
+from app.core.metrics import Counter, Gauge
+from app.core.redis import get_redis_client, report_redis_failure
+
+KEY_PREFIX = "auth:revoked:"
+CHANNEL = "auth:revocations"
+# revoked_at for a filter hit that can't be confirmed: every token it covers is refused
+UNCONFIRMED = math.inf
+
+token_revocation_checks_total = Counter(
+    "token_revocation_checks_total", "Revocation lookups by outcome", ("result",)
+)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (double hashing on one blake2b digest)"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str) -> Iterable[int]:
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return ((first + index * second) % self.size for index in range(self.hashes))
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationList:
+    def __init__(self):
+        self.filter = self._new_filter()
+        # key -> (revoked_at, expires_at); the source of truth when Redis is off
+        self._local: Dict[str, tuple] = {}
+        self._user_handlers: List[Callable[[str], Awaitable[None]]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _new_filter() -> BloomFilter:
+        return BloomFilter(settings.revocation_filter_capacity, settings.revocation_filter_error_rate)
+
+    @staticmethod
+    def ttl() -> int:
+        return settings.access_token_expire_minutes * 60
+
+    def on_user_revoked(self, handler: Callable[[str], Awaitable[None]]) -> None:
+        """Call handler(username) on every worker when all of a user's tokens are revoked"""
+        self._user_handlers.append(handler)
+
+    # Writes
+
+    def _revoke(self, key: str) -> None:
+        now = time.time()
+        self.filter.add(key)
+        self._local[key] = (now, now + self.ttl())
+        redis_client = get_redis_client()
+        if redis_client:
+            try:
+                pipe = redis_client.pipeline()
+                pipe.set(KEY_PREFIX + key, now, ex=self.ttl())
+                pipe.publish(CHANNEL, key)
+                pipe.execute()
+            except Exception as e:
+                print(f"Token revocation publish error: {e}")
+                report_redis_failure()
+
+    def revoke_token(self, jti: str) -> None:
+        self._revoke(f"jti:{jti}")
+
+    async def revoke_user(self, username: str) -> None:
+        """Revoke every access token issued to a user so far"""
+        self._revoke(f"user:{username}")
+        await self._user_revoked(username)
+
+    async def _user_revoked(self, username: str) -> None:
+        for handler in self._user_handlers:
+            try:
+                await handler(username)
+            except Exception as e:
+                print(f"Revocation handler error: {e}")
+
+    # Checks
+
+    def _revoked_at(self, key: str) -> Optional[float]:
+        """Confirm a filter hit; None means not revoked (a false positive)"""
+        redis_client = get_redis_client()
+        if redis_client:
+            try:
+                value = redis_client.get(KEY_PREFIX + key)
+                return float(value) if value is not None else None
+            except Exception:
+                report_redis_failure()
+                # Can't confirm: treat the hit as revoked rather than let a revoked token through
+                return UNCONFIRMED
+        entry = self._local.get(key)
+        if entry is not None and entry[1] >= time.time():
+            return entry[0]
+        if settings.redis_url and entry is None:
+            # Redis is down and _local only has this worker's revocations: the
+            # hit may come from another worker, so fail closed here too
+            return UNCONFIRMED
+        return None
+
+    def is_revoked(self, jti: str, username: str, issued_at: float) -> bool:
+        """Whether an access token was revoked, by id or by a revoke-all for its user"""
+        hit = False
+        key = f"jti:{jti}"
+        if key in self.filter:
+            hit = True
+            if self._revoked_at(key) is not None:
+                token_revocation_checks_total.inc(result="revoked")
+                return True
+        key = f"user:{username}"
+        if key in self.filter:
+            hit = True
+            revoked_at = self._revoked_at(key)
+            if revoked_at is not None and issued_at < revoked_at:
+                token_revocation_checks_total.inc(result="revoked")
+                return True
+        token_revocation_checks_total.inc(result="false_positive" if hit else "miss")
+        return False
+
+    # Sync
+
+    def _load_redis(self) -> List[str]:
+        """Every revoked key still live in Redis (runs in a thread)"""
+        redis_client = get_redis_client()
+        prefix = len(KEY_PREFIX)
+        return [key[prefix:] for key in redis_client.scan_iter(match=KEY_PREFIX + "*", count=1000)]
+
+    async def rebuild(self) -> None:
+        """Rebuild the filter from the live keys, dropping expired ones"""
+        now = time.time()
+        self._local = {key: entry for key, entry in self._local.items() if entry[1] > now}
+        keys = list(self._local)
+        if settings.redis_url and not get_redis_client():
+            # Rebuilding from _local alone would drop what other workers revoked
+            return
+        if get_redis_client():
+            try:
+                keys = await asyncio.to_thread(self._load_redis)
+            except Exception as e:
+                print(f"Token revocation sync error: {e}")
+                report_redis_failure()
+                return
+        rebuilt = self._new_filter()
+        for key in keys:
+            rebuilt.add(key)
+        # Keys added while Redis was being read are still in the old filter
+        for key in self._local:
+            rebuilt.add(key)
+        self.filter = rebuilt
+
+    async def _listen(self) -> None:
+        import redis.asyncio as aioredis
+
+        while True:
+            if get_redis_client() is None:
+                await self.rebuild()
+                await asyncio.sleep(settings.revocation_sync_interval_seconds)
+                continue
+            client = aioredis.from_url(settings.redis_url, decode_responses=True)
+            pubsub = client.pubsub()
+            try:
+                await pubsub.subscribe(CHANNEL)
+                # Catch up on anything published while we weren't subscribed
+                await self.rebuild()
+                next_rebuild = time.monotonic() + settings.revocation_sync_interval_seconds
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is not None and message["type"] == "message":
+                        key = message["data"]
+                        if key not in self._local:
+                            self.filter.add(key)
+                            if key.startswith("user:"):
+                                await self._user_revoked(key[len("user:"):])
+                    if time.monotonic() >= next_rebuild:
+                        await self.rebuild()
+                        next_rebuild = time.monotonic() + settings.revocation_sync_interval_seconds
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Token revocation listener error, resubscribing: {e}")
+                report_redis_failure()
+                await asyncio.sleep(1.0)
+            finally:
+                try:
+                    await pubsub.aclose()
+                    await client.aclose()
+                except Exception:
+                    pass
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Global revocation list instance
+token_revocations = RevocationList()
+
+Gauge(
+    "token_revocation_filter_keys", "Keys in this worker's revocation filter",
+    callback=lambda: {(): token_revocations.filter.count}
+)
@@ -1,18 +1,22 @@
-from datetime import datetime, timedelta
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import update
 from sqlalchemy.orm import Session
 
 from app.core.config import settings
-from app.db.session import get_db
+from app.core.revocation import token_revocations
+from app.models.refresh_token import RefreshToken
 from app.models.user import User
-from app.schemas.user import TokenData
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token", auto_error=False)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -25,51 +29,133 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+@dataclass(frozen=True)
+class CurrentUser:
+    """The caller, read from access token claims (no database row behind it)"""
+    id: int
+    username: str
+    is_admin: bool
+    token_id: str
+    issued_at: float
+    is_trusted: bool = False
+    is_active: bool = True
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
-    """Create a JWT access token"""
+    """Create a JWT access token (with a jti so it can be revoked)"""
     to_encode = data.copy()
+    now = datetime.now(timezone.utc)
     if expires_delta:
-        expire = datetime.utcnow() + expires_delta
+        expire = now + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(minutes=settings.access_token_expire_minutes)
-    to_encode.update({"exp": expire})
+        expire = now + timedelta(minutes=settings.access_token_expire_minutes)
+    # Fractional iat: a token issued just after a revoke-all in the same second stays valid
+    to_encode.update({"exp": expire, "iat": now.timestamp(), "jti": uuid.uuid4().hex, "type": "access"})
     encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
     return encoded_jwt
 
 
-async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-) -> User:
-    """Get the current authenticated user from JWT token"""
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
+def create_refresh_token(db: Session, user: User, family_id: Optional[str] = None) -> str:
+    """Create a refresh token and record it (caller commits)"""
+    jti = uuid.uuid4().hex
+    expire = datetime.now(timezone.utc) + timedelta(days=settings.refresh_token_expire_days)
+    db.add(RefreshToken(jti=jti, user_id=user.id, family_id=family_id or jti, expires_at=expire))
+    return jwt.encode(
+        {"sub": user.username, "exp": expire, "jti": jti, "type": "refresh"},
+        settings.secret_key,
+        algorithm=settings.algorithm
     )
+
+
+def issue_tokens(db: Session, user: User, family_id: Optional[str] = None) -> dict:
+    """Access + refresh token pair for a user (caller commits)"""
+    access_token = create_access_token(data={"sub": user.username, "uid": user.id, "adm": user.is_admin, "trs": user.is_trusted})
+    return {
+        "access_token": access_token,
+        "refresh_token": create_refresh_token(db, user, family_id),
+        "token_type": "bearer",
+        "expires_in": settings.access_token_expire_minutes * 60,
+    }
+
+
+def decode_access_token(token: str) -> Optional[CurrentUser]:
+    """Verify an access token: signature, expiry, type and revocation (no database lookup)"""
     try:
         payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        token_data = TokenData(username=username)
     except JWTError:
-        raise credentials_exception
-    
-    user = db.query(User).filter(User.username == token_data.username).first()
+        return None
+    if payload.get("type") != "access" or not payload.get("sub") or not payload.get("jti"):
+        return None
+    user = CurrentUser(
+        id=payload.get("uid"),
+        username=payload["sub"],
+        is_admin=bool(payload.get("adm")),
+        token_id=payload["jti"],
+        issued_at=float(payload.get("iat", 0)),
+        is_trusted=bool(payload.get("trs")),
+    )
+    if user.id is None or token_revocations.is_revoked(user.token_id, user.username, user.issued_at):
+        return None
+    return user
+
+
+def decode_refresh_token(token: str) -> Optional[dict]:
+    try:
+        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+    except JWTError:
+        return None
+    if payload.get("type") != "refresh" or not payload.get("jti"):
+        return None
+    return payload
+
+
+async def revoke_user_tokens(db: Session, user: User) -> None:
+    """Sign a user out everywhere: revoke their refresh tokens and every access token issued so far"""
+    db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.user_id == user.id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=datetime.now(timezone.utc))
+    )
+    db.commit()
+    await token_revocations.revoke_user(user.username)
+
+
+async def get_current_user(
+    token: str = Depends(oauth2_scheme)
+) -> CurrentUser:
+    """Get the current authenticated user from the access token"""
+    user = decode_access_token(token)
     if user is None:
-        raise credentials_exception
-    if not user.is_active:
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="User account is inactive"
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
         )
     return user
 
 
+async def get_optional_user(
+    token: Optional[str] = Depends(optional_oauth2_scheme)
+) -> Optional[CurrentUser]:
+    """The caller if a valid access token was sent (public reads that members also use)"""
+    return decode_access_token(token) if token else None
+
+
 async def get_current_active_user(
-    current_user: User = Depends(get_current_user)
-) -> User:
+    current_user: CurrentUser = Depends(get_current_user)
+) -> CurrentUser:
     """Get current active user (wrapper for clarity)"""
     return current_user
 
+
+
+async def get_current_admin_user(
+    current_user: CurrentUser = Depends(get_current_user)
+) -> CurrentUser:
+    """Require an admin account"""
+    if not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+    return current_user
@@ -0,0 +1,47 @@
+"""
+JSON serialization
+orjson for everything the app encodes itself (WebSocket frames, Redis
+payloads, cached pages) and prebuilt pydantic TypeAdapters for list
+responses, which validate ORM rows and dump JSON bytes in one pass through
+pydantic-core instead of FastAPI's validate -> to_python -> json.dumps.
+"""
+from typing import Any, Iterable, List
+
+import orjson
+from fastapi import Response
+from fastapi.responses import ORJSONResponse
+from pydantic import TypeAdapter
+
+from app.schemas.message import MessageResponse
+from app.schemas.read_marker import UnreadCount
+
+__all__ = [
+    "ORJSONResponse",
+    "dumps",
+    "dumps_text",
+    "loads",
+    "json_list_response",
+    "message_list_adapter",
+    "unread_list_adapter",
+]
+
+message_list_adapter = TypeAdapter(List[MessageResponse])
+unread_list_adapter = TypeAdapter(List[UnreadCount])
+
+
+def dumps(obj: Any) -> bytes:
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+
+def dumps_text(obj: Any) -> str:
+    """Encode a WebSocket frame once; the str can be sent to any number of sockets"""
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+loads = orjson.loads
+
+
+def json_list_response(adapter: TypeAdapter, items: Iterable[Any]) -> Response:
+    """Validate ORM rows against a list adapter and return the JSON bytes directly"""
+    body = adapter.dump_json(adapter.validate_python(items, from_attributes=True))
+    return Response(content=body, media_type="application/json")
@@ -0,0 +1,180 @@
+"""
+Background task executor
+Side effects that don't have to finish before the sender sees their echo
+(unread pushes, mention indexing, the cross-worker Redis publish) go to
+named queues instead of running inline in a socket's receive loop, so a
+slow dependency backs up one queue rather than stalling sockets.
+
+Each queue is a bounded priority queue (lower number first, FIFO within a
+priority) worked by its own number of tasks; a queue with concurrency 1
+runs its jobs in submission order. Submitting never waits: when a queue is
+full the job is dropped and counted. A job that raises is retried up to
+`retries` times with exponential backoff and jitter, at the back of the
+queue (so it loses its place in the order). On shutdown the executor stops
+taking new jobs and drains what is queued, for at most
+task_shutdown_timeout_seconds.
+"""
+import asyncio
+import inspect
+import itertools
+import random
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.metrics import Counter, Gauge, Histogram
+
+tasks_total = Counter("tasks_total", "Background jobs by queue and outcome", ("queue", "result"))
+task_seconds = Histogram("task_seconds", "Background job run time", ("queue",))
+task_wait_seconds = Histogram("task_wait_seconds", "Time a background job waited in its queue", ("queue",))
+
+
+class TaskQueue:
+    def __init__(self, name: str, concurrency: int, size: int):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.size = size
+        # Jobs submitted and not finished (queued, running or waiting to retry)
+        self.pending = 0
+        self.running = 0
+        self.closed = False
+        self._seq = itertools.count()
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._workers: List[asyncio.Task] = []
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def submit(self, fn: Callable[..., Any], *args, priority: int = 0, retries: int = 0) -> bool:
+        """Queue fn(*args) (a coroutine function or plain callable); False if it was dropped"""
+        if self.closed:
+            tasks_total.inc(queue=self.name, result="dropped")
+            return False
+        if not self._workers or self._workers[0].done():
+            # First job (or the previous event loop is gone, e.g. in scripts)
+            self._queue = asyncio.PriorityQueue(maxsize=self.size)
+            self.pending = 0
+            self._workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+        return self._put((priority, next(self._seq), time.monotonic(), 0, retries, fn, args))
+
+    def _put(self, job: tuple) -> bool:
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            tasks_total.inc(queue=self.name, result="dropped")
+            return False
+        self.pending += 1
+        return True
+
+    def _requeue(self, job: tuple) -> None:
+        if not self._workers:
+            return  # Shut down meanwhile; drain() counted it as dropped
+        self.pending -= 1
+        priority, _, _, attempt, retries, fn, args = job
+        self._put((priority, next(self._seq), time.monotonic(), attempt, retries, fn, args))
+
+    async def _work(self) -> None:
+        while True:
+            job = await self._queue.get()
+            priority, seq, queued_at, attempt, retries, fn, args = job
+            task_wait_seconds.observe(time.monotonic() - queued_at, queue=self.name)
+            self.running += 1
+            start = time.perf_counter()
+            try:
+                result = fn(*args)
+                if inspect.isawaitable(result):
+                    await result
+                tasks_total.inc(queue=self.name, result="ok")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if attempt < retries:
+                    tasks_total.inc(queue=self.name, result="retried")
+                    delay = min(settings.task_retry_max_seconds, settings.task_retry_base_seconds * 2 ** attempt)
+                    job = (priority, seq, queued_at, attempt + 1, retries, fn, args)
+                    asyncio.get_running_loop().call_later(random.uniform(delay / 2, delay), self._requeue, job)
+                    # Still pending until the retry has run
+                    self.pending += 1
+                else:
+                    tasks_total.inc(queue=self.name, result="failed")
+                    print(f"Background job {self.name}/{getattr(fn, '__qualname__', fn)} failed: {e}")
+            finally:
+                self.running -= 1
+                self.pending -= 1
+                task_seconds.observe(time.perf_counter() - start, queue=self.name)
+                self._queue.task_done()
+
+    async def drain(self, deadline: float) -> None:
+        """Stop taking jobs, wait (until the monotonic deadline) for the queued ones, then stop the workers"""
+        self.closed = True
+        while self.pending and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        for worker in self._workers:
+            worker.cancel()
+        for worker in self._workers:
+            try:
+                await worker
+            except asyncio.CancelledError:
+                pass
+        self._workers = []
+        if self.pending:
+            tasks_total.inc(self.pending, queue=self.name, result="dropped")
+            print(f"Background queue {self.name}: {self.pending} jobs dropped at shutdown")
+            self.pending = 0
+
+    def report(self) -> dict:
+        return {
+            "queued": self.depth,
+            "running": self.running,
+            "pending": self.pending,
+            "concurrency": self.concurrency,
+            "size": self.size,
+        }
+
+
+class TaskExecutor:
+    """Named background queues shared by the whole worker"""
+
+    def __init__(self):
+        self.queues: Dict[str, TaskQueue] = {}
+
+    def queue(self, name: str, concurrency: Optional[int] = None, size: Optional[int] = None) -> TaskQueue:
+        """Get a queue, creating it on first use"""
+        queue = self.queues.get(name)
+        if queue is None:
+            queue = self.queues[name] = TaskQueue(
+                name,
+                concurrency if concurrency is not None else settings.task_queue_concurrency,
+                size if size is not None else settings.task_queue_size,
+            )
+        return queue
+
+    def submit(self, name: str, fn: Callable[..., Any], *args, priority: int = 0, retries: int = 0) -> bool:
+        return self.queue(name).submit(fn, *args, priority=priority, retries=retries)
+
+    def start(self) -> None:
+        """Take jobs again (workers start with the first job of each queue)"""
+        for queue in self.queues.values():
+            queue.closed = False
+
+    async def stop(self, timeout: Optional[float] = None) -> None:
+        """Drain every queue, sharing one deadline"""
+        deadline = time.monotonic() + (settings.task_shutdown_timeout_seconds if timeout is None else timeout)
+        await asyncio.gather(*(queue.drain(deadline) for queue in self.queues.values()))
+
+    def report(self) -> dict:
+        return {name: queue.report() for name, queue in self.queues.items()}
+
+
+# Global task executor instance
+executor = TaskExecutor()
+
+Gauge(
+    "task_queue_depth", "Jobs waiting in a background queue", ("queue",),
+    callback=lambda: {(name,): queue.depth for name, queue in executor.queues.items()}
+)
+Gauge(
+    "task_queue_running", "Jobs running from a background queue", ("queue",),
+    callback=lambda: {(name,): queue.running for name, queue in executor.queues.items()}
+)
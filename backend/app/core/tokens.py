@@ -0,0 +1,23 @@
+"""
+Token helpers
+Reading the JWT subject of a request without touching the database, for
+decisions made before authentication proper (rate limiting, replica
+routing). Depends only on settings so it can be imported from app.db.
+"""
+from typing import Optional
+
+from fastapi import Request
+from jose import JWTError, jwt
+
+from app.core.config import settings
+
+
+def bearer_subject(request: Request) -> Optional[str]:
+    """JWT subject from the Authorization header (signature checked, no database lookup)"""
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm]).get("sub")
+    except JWTError:
+        return None
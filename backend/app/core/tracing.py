@@ -0,0 +1,252 @@
+"""
+Trace sampling
+Lightweight spans for the chat send path. A trace is started for each chat
+frame a socket receives and sampled at the head (settings.trace_sample_rate),
+so an unsampled message costs one random() call and a context-variable read
+per instrumented step. The current span lives in a context variable: code
+further down the call (moderation, commit, fan-out, relay publish) opens
+child spans with `span(name)` without being handed anything, and threads
+started with asyncio.to_thread inherit it.
+
+Finished traces are queued and written by a background task to a JSONL
+file (one span per line) and/or POSTed as OTLP/HTTP JSON to
+trace_otlp_endpoint, e.g. scripts.trace_collector or a real collector on
+:4318. The trace id is included in the broadcast frame, so a slow message
+seen in a client can be looked up end to end.
+"""
+import asyncio
+import os
+import random
+import time
+import urllib.request
+from collections import deque
+from contextvars import ContextVar
+from typing import Deque, List, Optional
+
+from app.core.config import WORKER_ID, settings
+from app.core.metrics import Counter
+from app.core.serialization import dumps_text
+
+traces_exported_total = Counter("traces_exported_total", "Sampled traces exported, by outcome", ("result",))
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], attributes: dict):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+
+    @property
+    def trace_id(self) -> str:
+        return self.trace.trace_id
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def record(self) -> dict:
+        end_ns = self.end_ns or time.time_ns()
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_id,
+            "name": self.name,
+            "worker_id": WORKER_ID,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": end_ns,
+            "duration_ms": round((end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+        }
+
+
+class Trace:
+    __slots__ = ("trace_id", "spans")
+
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans: List[Span] = []
+
+
+_current: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class _SpanContext:
+    """Context manager for one span; enters as the current span"""
+    __slots__ = ("span", "token", "tracer")
+
+    def __init__(self, span: Span, tracer: Optional["Tracer"] = None):
+        self.span = span
+        self.tracer = tracer
+        self.token = None
+
+    def __enter__(self) -> Span:
+        self.token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.span.end_ns = time.time_ns()
+        if exc_type is not None:
+            self.span.attributes["error"] = exc_type.__name__
+        _current.reset(self.token)
+        if self.tracer is not None:
+            # Root span: the whole trace is done
+            self.tracer.finish(self.span.trace)
+
+
+class _NoSpan:
+    """Shared no-op context for unsampled work"""
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        return None
+
+
+NO_SPAN = _NoSpan()
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def span(name: str, **attributes):
+    """Child span of the current span (no-op outside a sampled trace)"""
+    parent = _current.get()
+    if parent is None:
+        return NO_SPAN
+    child = Span(parent.trace, name, parent.span_id, attributes)
+    parent.trace.spans.append(child)
+    return _SpanContext(child)
+
+
+def span_between(name: str, start_ns: int, end_ns: int, **attributes) -> None:
+    """Record an already finished step as a child of the current span"""
+    parent = _current.get()
+    if parent is None:
+        return
+    child = Span(parent.trace, name, parent.span_id, attributes)
+    child.start_ns, child.end_ns = start_ns, end_ns
+    parent.trace.spans.append(child)
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_payload(records: List[dict]) -> dict:
+    """OTLP/HTTP JSON body (ExportTraceServiceRequest) for flat span records"""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [
+                {"key": "service.name", "value": {"stringValue": "whatyousayin"}},
+                {"key": "service.instance.id", "value": {"stringValue": WORKER_ID}},
+            ]},
+            "scopeSpans": [{
+                "scope": {"name": "app.core.tracing"},
+                "spans": [{
+                    "traceId": record["trace_id"],
+                    "spanId": record["span_id"],
+                    "parentSpanId": record["parent_span_id"] or "",
+                    "name": record["name"],
+                    "kind": 1,
+                    "startTimeUnixNano": str(record["start_time_unix_nano"]),
+                    "endTimeUnixNano": str(record["end_time_unix_nano"]),
+                    "attributes": [
+                        {"key": key, "value": _otlp_value(value)} for key, value in record["attributes"].items()
+                    ],
+                } for record in records],
+            }],
+        }]
+    }
+
+
+class Tracer:
+    def __init__(self):
+        self._finished: Deque[Trace] = deque()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return settings.trace_sample_rate > 0 and bool(settings.trace_export_path or settings.trace_otlp_endpoint)
+
+    def trace(self, name: str, start_ns: Optional[int] = None, **attributes):
+        """Root span of a new trace if this one is sampled, else a no-op"""
+        if not self.enabled or random.random() >= settings.trace_sample_rate:
+            return NO_SPAN
+        trace = Trace()
+        root = Span(trace, name, None, attributes)
+        if start_ns is not None:
+            root.start_ns = start_ns
+        trace.spans.append(root)
+        return _SpanContext(root, self)
+
+    def finish(self, trace: Trace) -> None:
+        if len(self._finished) >= settings.trace_queue_size:
+            traces_exported_total.inc(result="dropped")
+            return
+        self._finished.append(trace)
+
+    # Export
+
+    def _write(self, records: List[dict]) -> None:
+        if settings.trace_export_path:
+            with open(settings.trace_export_path, "a", encoding="utf-8") as handle:
+                handle.writelines(dumps_text(record) + "\n" for record in records)
+        if settings.trace_otlp_endpoint:
+            request = urllib.request.Request(
+                settings.trace_otlp_endpoint,
+                data=dumps_text(otlp_payload(records)).encode(),
+                headers={"Content-Type": "application/json"},
+                method="POST",
+            )
+            with urllib.request.urlopen(request, timeout=5):
+                pass
+
+    async def flush(self) -> None:
+        if not self._finished:
+            return
+        traces = list(self._finished)
+        self._finished.clear()
+        records = [span.record() for trace in traces for span in trace.spans]
+        try:
+            await asyncio.to_thread(self._write, records)
+            traces_exported_total.inc(len(traces), result="exported")
+        except Exception as e:
+            traces_exported_total.inc(len(traces), result="failed")
+            print(f"Trace export error: {e}")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.trace_flush_interval_seconds)
+            await self.flush()
+
+    def start(self) -> None:
+        if self._task is None and self.enabled:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+# Global tracer instance
+tracer = Tracer()
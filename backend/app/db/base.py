@@ -4,6 +4,16 @@ from app.db.session import Base
 from app.models.user import User
 from app.models.room import Room
 from app.models.message import Message
+from app.models.read_marker import ReadMarker
+from app.models.retention_checkpoint import RetentionCheckpoint
+from app.models.refresh_token import RefreshToken
+from app.models.moderation_audit import ModerationAudit
+from app.models.room_activity import RoomActivity
+from app.models.mention import Mention
+from app.models.room_member import RoomMember
 
-__all__ = ["Base", "User", "Room", "Message"]
+__all__ = [
+    "Base", "User", "Room", "Message", "ReadMarker", "RetentionCheckpoint", "RefreshToken", "ModerationAudit",
+    "RoomActivity", "Mention", "RoomMember"
+]
 
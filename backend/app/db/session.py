@@ -1,6 +1,14 @@
-from sqlalchemy import create_engine
+import asyncio
+import time
+from typing import Dict, List, Optional
+
+from fastapi import Request
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker, declarative_base
 from app.core.config import settings
+from app.core.metrics import Counter, Gauge
+from app.core.tokens import bearer_subject
 
 engine = create_engine(
     settings.database_url,
@@ -8,10 +16,132 @@ engine = create_engine(
     echo=False  # Set to True for SQL query logging
 )
 
+# Read replicas (engines connect lazily, so importing this stays offline)
+replica_engines = [
+    create_engine(url.strip(), pool_pre_ping=True, echo=False)
+    for url in settings.database_replica_urls.split(",")
+    if url.strip()
+]
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+db_reads_total = Counter("db_reads_total", "Read-only sessions by target", ("target",))
+
+# Seconds the replica is behind; 0 when fully replayed or not a standby
+POSTGRES_LAG_SQL = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() THEN 0 "
+    "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+class Replica:
+    def __init__(self, replica_engine):
+        self.engine = replica_engine
+        self.name = replica_engine.url.render_as_string(hide_password=True)
+        self.healthy = False
+        self.lag: Optional[float] = None
+
+    def check(self) -> None:
+        """Measure replication lag (blocking)"""
+        try:
+            with self.engine.connect() as conn:
+                if self.engine.dialect.name == "postgresql":
+                    self.lag = float(conn.execute(POSTGRES_LAG_SQL).scalar() or 0)
+                else:
+                    # Other backends (e.g. a SQLite copy in development) report no lag
+                    conn.execute(text("SELECT 1"))
+                    self.lag = 0.0
+            if not self.healthy:
+                print(f"Replica {self.name} is up")
+            self.healthy = True
+        except Exception as e:
+            if self.healthy:
+                print(f"Replica {self.name} is down: {e}")
+            self.healthy = False
+            self.lag = None
+
+
+class ReplicaRouter:
+    """
+    Picks a session target for reads.
+
+    Replicas are used round-robin while healthy and within
+    replica_max_lag_seconds; otherwise, and for users who wrote within
+    read_your_writes_seconds, reads go to the primary.
+    """
+
+    def __init__(self, engines):
+        self.replicas = [Replica(replica_engine) for replica_engine in engines]
+        self._next = 0
+        # username -> monotonic time of their last write
+        self._writes: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def note_write(self, username: str) -> None:
+        now = time.monotonic()
+        self._writes[username] = now
+        if len(self._writes) > 10000:
+            cutoff = now - settings.read_your_writes_seconds
+            self._writes = {user: at for user, at in self._writes.items() if at > cutoff}
+
+    def recently_wrote(self, username: str) -> bool:
+        at = self._writes.get(username)
+        return at is not None and time.monotonic() - at < settings.read_your_writes_seconds
+
+    def usable(self) -> List[Replica]:
+        return [
+            replica for replica in self.replicas
+            if replica.healthy and replica.lag is not None and replica.lag <= settings.replica_max_lag_seconds
+        ]
+
+    def pick(self) -> Optional[Replica]:
+        replicas = self.usable()
+        if not replicas:
+            return None
+        self._next = (self._next + 1) % len(replicas)
+        return replicas[self._next]
+
+    def mark_down(self, replica: Replica) -> None:
+        """A query failed on this replica; skip it until the next check"""
+        replica.healthy = False
+
+    def check(self) -> None:
+        for replica in self.replicas:
+            replica.check()
+
+    async def _monitor(self) -> None:
+        while True:
+            await asyncio.to_thread(self.check)
+            await asyncio.sleep(settings.replica_check_interval_seconds)
+
+    def start(self) -> None:
+        if self.replicas and self._task is None:
+            self._task = asyncio.create_task(self._monitor())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def report(self) -> List[dict]:
+        return [{"name": replica.name, "healthy": replica.healthy, "lag_seconds": replica.lag} for replica in self.replicas]
+
+
+# Global replica router instance
+replica_router = ReplicaRouter(replica_engines)
+
+Gauge(
+    "db_replica_lag_seconds", "Replication lag at the last check", ("replica",),
+    callback=lambda: {(replica.name,): replica.lag for replica in replica_router.replicas if replica.lag is not None}
+)
+
 
 def get_db():
     """Dependency for getting database session"""
@@ -21,3 +151,27 @@ def get_db():
     finally:
         db.close()
 
+
+def get_read_db(request: Request):
+    """Dependency for read-only queries: a replica session when one is fresh enough, else the primary"""
+    replica = None
+    if replica_router.replicas:
+        username = bearer_subject(request)
+        if username and replica_router.recently_wrote(username):
+            db_reads_total.inc(target="primary_read_your_writes")
+        else:
+            replica = replica_router.pick()
+    if replica is None:
+        db_reads_total.inc(target="primary")
+        db = SessionLocal()
+    else:
+        db_reads_total.inc(target="replica")
+        db = SessionLocal(bind=replica.engine)
+    try:
+        yield db
+    except OperationalError:
+        if replica is not None:
+            replica_router.mark_down(replica)
+        raise
+    finally:
+        db.close()
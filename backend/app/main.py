@@ -1,16 +1,100 @@
-from fastapi import FastAPI
+import asyncio
+import signal
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from app.core import diagnostics
 from app.core.config import settings
-from app.db.session import engine
-from app.db.base import Base
+from app.core.metrics import CONTENT_TYPE, MetricsMiddleware, registry
+from app.core.revocation import token_revocations
+from app.core.serialization import ORJSONResponse
+from app.core.tasks import executor
+from app.core.tracing import tracer
+from app.db import base  # noqa: F401 - registers every model before first use
+from app.db.session import SessionLocal, engine, replica_engines, replica_router
+from app.core.health import dependency_health
+from app.services.activity import room_activity
+from app.services.deferred_moderation import deferred_moderation
+from app.services.mentions import mention_index
+from app.services.read_markers import read_markers
+from app.services.retention import retention_job
+from app.services.room_access import room_access
+from app.services.room_directory import room_directory
+from app.websocket.affinity import room_affinity
+from app.websocket.drain import drain
+from app.websocket.manager import manager
+
+
+def install_drain_signal() -> None:
+    """Start a drain on the configured signal (e.g. kill -USR1 <pid> before a deploy)"""
+    signum = getattr(signal, settings.drain_signal, None) if settings.drain_signal else None
+    if signum is None:
+        return
+    try:
+        asyncio.get_running_loop().add_signal_handler(signum, drain.start)
+    except (NotImplementedError, RuntimeError, ValueError):
+        # Not supported on this platform / not in the main thread
+        pass
+
+
+# Signing a user out everywhere also closes their open sockets
+token_revocations.on_user_revoked(manager.close_user)
+# Removing someone from a private room closes their sockets in it on every worker
+room_access.on_member_removed(manager.close_room_user)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Startup and shutdown (schema is managed by Alembic, see MIGRATIONS.md)"""
+    diagnostics.install(engine, SessionLocal, replica_engines)
+    diagnostics.loop_monitor.start()
+    await dependency_health.startup()
+    replica_router.start()
+    executor.start()
+    token_revocations.start()
+    room_access.start()
+    read_markers.start()
+    room_directory.start()
+    manager.start()
+    room_affinity.start()
+    retention_job.start()
+    deferred_moderation.start()
+    room_activity.start()
+    mention_index.start()
+    tracer.start()
+    install_drain_signal()
+    yield
+    if manager.websocket_rooms:
+        drain.start()
+        try:
+            await drain.wait(timeout=settings.drain_shutdown_timeout_seconds)
+        except asyncio.TimeoutError:
+            pass
+    # Queued side effects (unread pushes, mentions, relay) before their services stop
+    await executor.stop()
+    await deferred_moderation.stop()
+    await room_activity.stop()
+    await mention_index.stop()
+    await retention_job.stop()
+    await room_affinity.stop()
+    await manager.stop()
+    await room_directory.stop()
+    await read_markers.stop()
+    await room_access.stop()
+    await token_revocations.stop()
+    await replica_router.stop()
+    await tracer.stop()
+    await dependency_health.shutdown()
+    await diagnostics.loop_monitor.stop()
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
 
 app = FastAPI(
     title="What You Sayin' API",
     description="Bahamian Chat Platform API",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -26,25 +110,45 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request metrics (outermost, so CORS and routing time is included)
+app.add_middleware(MetricsMiddleware)
+
 # Include routers
-from app.api.routes import auth, users, rooms, messages, websocket
+from app.api.routes import admin, auth, users, rooms, messages, websocket
 
 app.include_router(auth.router, prefix="/api/auth", tags=["authentication"])
 app.include_router(users.router, prefix="/api/users", tags=["users"])
 app.include_router(rooms.router, prefix="/api/rooms", tags=["rooms"])
 app.include_router(messages.router, prefix="/api", tags=["messages"])
 app.include_router(websocket.router, prefix="/ws", tags=["websocket"])
+app.include_router(admin.router, prefix="/api/admin", tags=["admin"])
 
 
 @app.get("/health")
 async def health_check():
     return {
-        "status": "healthy",
+        "status": "healthy" if dependency_health.ready else "degraded",
         "message": "What You Sayin' API is running",
-        "version": "1.0.0"
+        "version": "1.0.0",
+        **dependency_health.report(),
+        "replicas": replica_router.report()
     }
 
 
+@app.get("/health/ready")
+async def readiness_check(response: Response):
+    """Readiness gate for load balancers: 503 until the database is reachable, and while draining"""
+    if not dependency_health.ready or drain.draining:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {**dependency_health.report(), "draining": drain.draining}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
+
+
 @app.get("/")
 async def root():
     return {
@@ -52,4 +156,3 @@ async def root():
         "docs": "/docs",
         "health": "/health"
     }
-
@@ -0,0 +1,16 @@
+from sqlalchemy import Column, Integer, ForeignKey, Index
+from app.db.base import Base
+
+
+class Mention(Base):
+    """A user @mentioned in a message (see app.services.mentions)"""
+    __tablename__ = "mentions"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    # Not a foreign key: retention removes these rows along with the message
+    message_id = Column(Integer, primary_key=True)
+
+    __table_args__ = (
+        # Cleanup when messages are purged
+        Index("ix_mentions_message_id", "message_id"),
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, Index, text
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.db.base import Base
@@ -11,13 +11,44 @@ class Message(Base):
     content = Column(Text, nullable=False)
     room_id = Column(Integer, ForeignKey("rooms.id"), nullable=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    # Author profile as of the insert, so pages need no users join (see app.services.authors)
+    author_username = Column(String, nullable=True)
+    author_avatar_url = Column(String, nullable=True)
     recipient_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
     reply_to_id = Column(Integer, ForeignKey("messages.id"), nullable=True)
+    # First message of the reply chain (NULL on roots); see app.services.threads
+    thread_root_id = Column(Integer, ForeignKey("messages.id"), nullable=True)
+    # Replies anywhere under this message, kept on roots only
+    reply_count = Column(Integer, nullable=False, default=0, server_default="0")
+    # Per-room monotonic sequence number (see app.services.read_markers)
+    seq = Column(Integer, nullable=True)
+    # Sender-chosen id that makes resends idempotent (see app.services.dedup)
+    client_msg_id = Column(String(64), nullable=True)
+    # Set when the content was removed but the row kept as a thread root (see app.services.retention)
+    deleted_at = Column(DateTime(timezone=True), nullable=True)
+    # Delivered before moderation and not checked yet (see app.services.deferred_moderation)
+    pending_moderation = Column(Boolean, default=False, server_default="0", nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=True)
 
+    __table_args__ = (
+        Index("ix_messages_room_id_seq", "room_id", "seq", unique=True),
+        # Retention keyset (see app.services.retention)
+        Index("ix_messages_room_id_id", "room_id", "id"),
+        Index("ix_messages_thread_root_id_id", "thread_root_id", "id"),
+        Index("ix_messages_user_id_client_msg_id", "user_id", "client_msg_id", unique=True),
+        Index(
+            "ix_messages_pending_moderation", "id",
+            postgresql_where=text("pending_moderation"), sqlite_where=text("pending_moderation")
+        ),
+    )
+
     # Relationships
     user = relationship("User", foreign_keys=[user_id], backref="sent_messages")
     recipient = relationship("User", foreign_keys=[recipient_id], backref="received_messages")
     room = relationship("Room", backref="messages")
-    reply_to = relationship("Message", remote_side=[id], backref="replies")
+    reply_to = relationship("Message", remote_side=[id], foreign_keys=[reply_to_id], backref="replies")
 
+    @property
+    def author(self) -> dict:
+        """The author snapshot in the shape of MessageAuthor"""
+        return {"id": self.user_id, "username": self.author_username, "avatar_url": self.author_avatar_url}
@@ -0,0 +1,21 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy.sql import func
+from app.db.base import Base
+
+
+class ModerationAudit(Base):
+    __tablename__ = "moderation_audit"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # Not a foreign key: the entry outlives the message (retention, deletes)
+    message_id = Column(Integer, nullable=False, index=True)
+    room_id = Column(Integer, nullable=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    action = Column(String(16), nullable=False)
+    reason = Column(String, nullable=True)
+    # What was delivered, kept for review after the message itself is cleared
+    content = Column(Text, nullable=False)
+    # Other sockets in the room when it was delivered, and how long it was visible
+    recipients = Column(Integer, nullable=False, default=0)
+    exposure_ms = Column(Integer, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=True)
@@ -0,0 +1,13 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey
+from sqlalchemy.sql import func
+from app.db.base import Base
+
+
+class ReadMarker(Base):
+    __tablename__ = "read_markers"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    room_id = Column(Integer, ForeignKey("rooms.id"), primary_key=True, index=True)
+    last_read_id = Column(Integer, nullable=False)
+    last_read_seq = Column(Integer, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
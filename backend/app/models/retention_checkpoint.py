@@ -0,0 +1,14 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey
+from sqlalchemy.sql import func
+from app.db.base import Base
+
+
+class RetentionCheckpoint(Base):
+    __tablename__ = "retention_checkpoints"
+
+    room_id = Column(Integer, ForeignKey("rooms.id"), primary_key=True)
+    # Messages up to this room sequence number have been purged (or tombstoned)
+    purged_through_seq = Column(Integer, nullable=False, default=0, server_default="0")
+    purged_through_id = Column(Integer, nullable=False, default=0, server_default="0")
+    purged_total = Column(Integer, nullable=False, default=0, server_default="0")
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
@@ -12,6 +12,14 @@ class Room(Base):
     description = Column(String, nullable=True)
     is_public = Column(Boolean, default=True, nullable=False)
     created_by = Column(Integer, ForeignKey("users.id"), nullable=False)
+    # Last sequence number handed out to a message in this room
+    message_seq = Column(Integer, default=0, server_default="0", nullable=False)
+    # Delete messages older than this many days (NULL uses settings.retention_default_days)
+    retention_days = Column(Integer, nullable=True)
+    # Deliver every message first and moderate it afterwards (see app.services.deferred_moderation)
+    deliver_first = Column(Boolean, default=False, server_default="0", nullable=False)
+    # Most sockets open at once (NULL uses settings.ws_max_connections_per_room)
+    max_connections = Column(Integer, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
     # Relationships
@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index, LargeBinary
+from app.db.base import Base
+
+
+class RoomActivity(Base):
+    """Pre-aggregated room activity per minute and per hour (see app.services.activity)"""
+    __tablename__ = "room_activity"
+
+    room_id = Column(Integer, ForeignKey("rooms.id"), primary_key=True)
+    # "minute" or "hour"
+    period = Column(String(8), primary_key=True)
+    bucket_start = Column(DateTime(timezone=True), primary_key=True)
+    messages = Column(Integer, nullable=False, default=0, server_default="0")
+    # HyperLogLog sketch of the senders (app.services.hll)
+    users = Column(LargeBinary, nullable=False)
+
+    __table_args__ = (
+        # Cross-room reports and pruning old minute rows
+        Index("ix_room_activity_period_bucket_start", "period", "bucket_start"),
+    )
@@ -0,0 +1,17 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, Index
+from sqlalchemy.sql import func
+from app.db.base import Base
+
+
+class RoomMember(Base):
+    """A user allowed into a private room (see app.services.room_access)"""
+    __tablename__ = "room_members"
+
+    room_id = Column(Integer, ForeignKey("rooms.id"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        # A user's private rooms
+        Index("ix_room_members_user_id", "user_id"),
+    )
@@ -0,0 +1,35 @@
+from pydantic import BaseModel
+from typing import List
+from datetime import datetime
+
+
+class ActivityPoint(BaseModel):
+    bucket_start: datetime
+    messages: int
+    active_users: int
+
+
+class PeakHour(BaseModel):
+    # Hour of day, UTC
+    hour: int
+    messages: int
+
+
+class RoomActivityReport(BaseModel):
+    room_id: int
+    period: str
+    since: datetime
+    until: datetime
+    messages: int
+    # Distinct senders over the whole range (HyperLogLog estimate)
+    active_users: int
+    messages_per_minute: float
+    peak_messages_per_minute: float
+    peak_hours: List[PeakHour]
+    series: List[ActivityPoint]
+
+
+class RoomActivitySummary(BaseModel):
+    room_id: int
+    messages: int
+    active_users: int
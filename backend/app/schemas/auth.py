@@ -12,3 +12,13 @@ class RegisterRequest(BaseModel):
     email: Optional[EmailStr] = None
     password: str
 
+
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
+    # Revoke every session of the user, not just this one
+    everywhere: bool = False
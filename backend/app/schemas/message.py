@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import List, Optional
 from datetime import datetime
 from app.schemas.user import UserResponse
 
@@ -9,17 +9,29 @@ class MessageBase(BaseModel):
     reply_to_id: Optional[int] = None
     recipient_id: Optional[int] = None
     room_id: Optional[int] = None
+    client_msg_id: Optional[str] = Field(None, max_length=64)
 
 
 class MessageCreate(MessageBase):
     pass
 
 
+class MessageAuthor(BaseModel):
+    """Author snapshot stored on the message (see app.services.authors)"""
+    id: int
+    username: Optional[str] = None
+    avatar_url: Optional[str] = None
+
+
 class MessageResponse(MessageBase):
     id: int
     user_id: int
+    seq: Optional[int] = None
+    thread_root_id: Optional[int] = None
+    reply_count: int = 0
     created_at: datetime
-    user: Optional[UserResponse] = None
+    deleted_at: Optional[datetime] = None
+    user: Optional[MessageAuthor] = Field(None, validation_alias="author")
     reply_to: Optional['MessageResponse'] = None
     recipient: Optional[UserResponse] = None
 
@@ -30,3 +42,30 @@ class MessageResponse(MessageBase):
 # Update forward reference
 MessageResponse.model_rebuild()
 
+
+class ThreadMessageResponse(MessageBase):
+    """Flat message for thread pages (reply_to_id instead of the nested reply_to chain)"""
+    id: int
+    user_id: int
+    seq: Optional[int] = None
+    thread_root_id: Optional[int] = None
+    reply_count: int = 0
+    created_at: datetime
+    deleted_at: Optional[datetime] = None
+    user: Optional[MessageAuthor] = Field(None, validation_alias="author")
+
+    class Config:
+        from_attributes = True
+
+
+class ThreadResponse(BaseModel):
+    root: ThreadMessageResponse
+    replies: List[ThreadMessageResponse]
+    reply_count: int
+    next_after_id: Optional[int] = None
+
+
+
+class MentionInboxResponse(BaseModel):
+    mentions: List[ThreadMessageResponse]
+    next_before_id: Optional[int] = None
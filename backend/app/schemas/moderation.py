@@ -0,0 +1,35 @@
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import datetime
+
+
+class UserTrustUpdate(BaseModel):
+    is_trusted: bool
+
+
+class RoomModerationUpdate(BaseModel):
+    deliver_first: bool
+
+
+class ModerationAuditResponse(BaseModel):
+    id: int
+    message_id: int
+    room_id: Optional[int] = None
+    user_id: int
+    action: str
+    reason: Optional[str] = None
+    content: str
+    recipients: int
+    exposure_ms: Optional[int] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class ModerationReport(BaseModel):
+    queued: int
+    flagged: int
+    flagged_seen: int
+    seen_before_retraction_rate: float
+    recent: List[ModerationAuditResponse]
@@ -0,0 +1,13 @@
+from pydantic import BaseModel
+
+
+class ReadMarkerUpdate(BaseModel):
+    message_id: int
+
+
+class UnreadCount(BaseModel):
+    room_id: int
+    last_read_id: int
+    last_read_seq: int
+    head_seq: int
+    unread: int
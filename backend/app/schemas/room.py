@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional
 from datetime import datetime
 from app.schemas.user import UserResponse
@@ -8,17 +8,44 @@ class RoomBase(BaseModel):
     name: str
     description: Optional[str] = None
     is_public: bool = True
+    # Days to keep messages (0 keeps them forever, None uses the server default)
+    retention_days: Optional[int] = Field(None, ge=0)
+    # Most sockets open at once (None uses the server default)
+    max_connections: Optional[int] = Field(None, ge=1)
 
 
 class RoomCreate(RoomBase):
     pass
 
 
+class RoomRetentionUpdate(BaseModel):
+    retention_days: Optional[int] = Field(None, ge=0)
+
+
+class RoomCapacityUpdate(BaseModel):
+    max_connections: Optional[int] = Field(None, ge=1)
+
+
+class RoomMemberAdd(BaseModel):
+    username: str
+
+
+class RoomMemberResponse(BaseModel):
+    user_id: int
+    username: str
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
 class RoomResponse(RoomBase):
     id: int
     created_by: int
     created_at: datetime
     creator: Optional[UserResponse] = None
+    occupancy: int = 0
+    deliver_first: bool = False
 
     class Config:
         from_attributes = True
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from typing import Optional
 from datetime import datetime
 
@@ -12,11 +12,16 @@ class UserCreate(UserBase):
     password: str
 
 
+class UserUpdate(BaseModel):
+    avatar_url: Optional[str] = Field(None, max_length=2048, pattern=r"^https?://")
+
+
 class UserResponse(UserBase):
     id: int
     avatar_url: Optional[str] = None
     is_active: bool
     is_admin: bool
+    is_trusted: bool = False
     created_at: datetime
 
     class Config:
@@ -25,7 +30,9 @@ class UserResponse(UserBase):
 
 class Token(BaseModel):
     access_token: str
+    refresh_token: str
     token_type: str
+    expires_in: int
 
 
 class TokenData(BaseModel):
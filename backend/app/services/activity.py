@@ -0,0 +1,284 @@
+"""
+Room activity rollups
+Messages per minute and per hour and distinct senders per room, kept in
+room_activity so analytics never scan messages. The send path calls
+record(), which only bumps an in-memory counter and adds the sender to a
+set for the current minute; every rollup_flush_interval_seconds the pending
+minutes (and the hours they fall in) are merged into the table: message
+counts are added, sender sets become HyperLogLog sketches (app.services.hll)
+merged register-wise with what is stored. Every worker flushes its own
+counters; rows are locked in key order while merging, so concurrent flushes
+add up instead of overwriting each other.
+
+Minute rows are pruned after rollup_minute_retention_days; hour rows are
+kept. History from before the pipeline existed comes from
+scripts.backfill_room_activity, which writes through the same merge.
+
+The sketches need NumPy, which is imported on first flush or report
+rather than with the app.
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, bindparam, delete, func, select, tuple_, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import Counter
+from app.db.session import SessionLocal
+from app.models.room_activity import RoomActivity
+
+if TYPE_CHECKING:
+    from app.services.hll import HyperLogLog
+
+MINUTE = "minute"
+HOUR = "hour"
+PERIOD_SECONDS = {MINUTE: 60, HOUR: 3600}
+
+# (room_id, period, bucket_start)
+RollupKey = Tuple[int, str, datetime]
+
+rollup_flushes_total = Counter("rollup_flushes_total", "Room activity rollup flushes, by outcome", ("result",))
+
+activity = RoomActivity.__table__
+
+UPDATE_ROLLUP = (
+    update(activity)
+    .where(
+        activity.c.room_id == bindparam("b_room_id"),
+        activity.c.period == bindparam("b_period"),
+        activity.c.bucket_start == bindparam("b_bucket_start"),
+    )
+    .values(messages=bindparam("b_messages"), users=bindparam("b_users"))
+)
+
+
+def bucket_start(timestamp: float, period: str) -> datetime:
+    seconds = PERIOD_SECONDS[period]
+    return datetime.fromtimestamp(timestamp - timestamp % seconds, tz=timezone.utc)
+
+
+def as_utc(value: datetime) -> datetime:
+    """SQLite hands timestamps back without a zone; they are UTC"""
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def write_rollups(db: Session, rows: Dict[RollupKey, Tuple[int, "HyperLogLog"]], replace: bool = False) -> None:
+    """
+    Merge counts and sketches into room_activity (caller commits).
+
+    With replace=True the stored values are overwritten instead (used by the
+    backfill for buckets it recomputes from scratch).
+    """
+    if not rows:
+        return
+    from app.services.hll import HyperLogLog
+
+    keys = sorted(rows)
+    if db.bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    # Make sure every row exists, then lock them all in key order and merge
+    db.execute(
+        insert(RoomActivity).on_conflict_do_nothing(),
+        [{"room_id": room_id, "period": period, "bucket_start": start, "messages": 0, "users": b""}
+         for room_id, period, start in keys]
+    )
+    stored = {}
+    if not replace:
+        for row in db.execute(
+            select(activity.c.room_id, activity.c.period, activity.c.bucket_start, activity.c.messages, activity.c.users)
+            .where(tuple_(activity.c.room_id, activity.c.period, activity.c.bucket_start).in_(keys))
+            .order_by(activity.c.room_id, activity.c.period, activity.c.bucket_start)
+            .with_for_update()
+        ):
+            stored[(row.room_id, row.period, as_utc(row.bucket_start))] = (row.messages, row.users)
+
+    params = []
+    for key in keys:
+        messages, sketch = rows[key]
+        if key in stored:
+            stored_messages, stored_users = stored[key]
+            merged = HyperLogLog.from_bytes(stored_users)
+            merged.merge(sketch)
+            messages, sketch = messages + stored_messages, merged
+        room_id, period, start = key
+        params.append({
+            "b_room_id": room_id, "b_period": period, "b_bucket_start": start,
+            "b_messages": messages, "b_users": sketch.to_bytes(),
+        })
+    db.execute(UPDATE_ROLLUP, params)
+
+
+def prune_minutes(db: Session, before: datetime) -> int:
+    return db.execute(
+        delete(RoomActivity).where(RoomActivity.period == MINUTE, RoomActivity.bucket_start < before)
+    ).rowcount
+
+
+def _write(rows: Dict[RollupKey, Tuple[int, "HyperLogLog"]], prune_before: Optional[datetime]) -> None:
+    db = SessionLocal()
+    try:
+        # One transaction, so a failed flush can be retried without counting twice
+        batch_size = 500
+        keys = list(rows)
+        for index in range(0, len(keys), batch_size):
+            write_rollups(db, {key: rows[key] for key in keys[index:index + batch_size]})
+        db.commit()
+        if prune_before is not None:
+            prune_minutes(db, prune_before)
+            db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+class ActivityRollup:
+    """Per-worker activity counters, flushed into room_activity in the background"""
+
+    def __init__(self):
+        # (room_id, minute start in epoch seconds) -> [messages, sender ids]
+        self.pending: Dict[Tuple[int, int], list] = {}
+        self._pruned_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, room_id: int, user_id: int) -> None:
+        """Count a delivered room message (called from the send path)"""
+        now = time.time()
+        key = (room_id, int(now - now % 60))
+        entry = self.pending.get(key)
+        if entry is None:
+            entry = self.pending[key] = [0, set()]
+        entry[0] += 1
+        entry[1].add(user_id)
+
+    def _rows(self, batch: Dict[Tuple[int, int], list]) -> Dict[RollupKey, Tuple[int, "HyperLogLog"]]:
+        """Minute entries plus the hour rows they add up to"""
+        from app.services.hll import HyperLogLog
+
+        hours: Dict[Tuple[int, int], list] = {}
+        rows = {}
+        for (room_id, minute), (messages, users) in batch.items():
+            rows[(room_id, MINUTE, bucket_start(minute, MINUTE))] = (messages, HyperLogLog.of(users))
+            hour = hours.setdefault((room_id, minute - minute % 3600), [0, set()])
+            hour[0] += messages
+            hour[1] |= users
+        for (room_id, hour), (messages, users) in hours.items():
+            rows[(room_id, HOUR, bucket_start(hour, HOUR))] = (messages, HyperLogLog.of(users))
+        return rows
+
+    async def flush(self) -> int:
+        prune_before = None
+        if settings.rollup_minute_retention_days and time.monotonic() - self._pruned_at > 3600:
+            prune_before = datetime.now(timezone.utc) - timedelta(days=settings.rollup_minute_retention_days)
+        if not self.pending and prune_before is None:
+            return 0
+        batch, self.pending = self.pending, {}
+        try:
+            await asyncio.to_thread(_write, self._rows(batch), prune_before)
+        except Exception as e:
+            # Put the counts back; they are merged into the next flush
+            for key, (messages, users) in batch.items():
+                entry = self.pending.setdefault(key, [0, set()])
+                entry[0] += messages
+                entry[1] |= users
+            rollup_flushes_total.inc(result="failed")
+            print(f"Activity rollup flush error: {e}")
+            return 0
+        if prune_before is not None:
+            self._pruned_at = time.monotonic()
+        rollup_flushes_total.inc(result="ok")
+        return len(batch)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.rollup_flush_interval_seconds)
+            await self.flush()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+# Reports (rollups only)
+
+def _range_filter(period: str, since: datetime, until: datetime):
+    return and_(RoomActivity.period == period, RoomActivity.bucket_start >= since, RoomActivity.bucket_start < until)
+
+
+def room_report(db: Session, room_id: int, period: str, since: datetime, until: datetime) -> dict:
+    """Series, totals, distinct senders and peak hours for one room"""
+    from app.services.hll import HyperLogLog
+
+    rows = db.query(RoomActivity.bucket_start, RoomActivity.messages, RoomActivity.users).filter(
+        RoomActivity.room_id == room_id, _range_filter(period, since, until)
+    ).order_by(RoomActivity.bucket_start).all()
+
+    users = HyperLogLog()
+    series = []
+    by_hour_of_day = [0] * 24
+    for start, messages, sketch_bytes in rows:
+        sketch = HyperLogLog.from_bytes(sketch_bytes)
+        users.merge(sketch)
+        start = as_utc(start)
+        by_hour_of_day[start.hour] += messages
+        series.append({"bucket_start": start, "messages": messages, "active_users": sketch.count()})
+
+    total = sum(point["messages"] for point in series)
+    minutes = max(1.0, (until - since).total_seconds() / 60)
+    busiest = sorted(range(24), key=lambda hour: by_hour_of_day[hour], reverse=True)
+    return {
+        "room_id": room_id,
+        "period": period,
+        "since": since,
+        "until": until,
+        "messages": total,
+        "active_users": users.count(),
+        "messages_per_minute": round(total / minutes, 3),
+        "peak_messages_per_minute": round(
+            max((point["messages"] for point in series), default=0) * 60 / PERIOD_SECONDS[period], 3
+        ),
+        "peak_hours": [
+            {"hour": hour, "messages": by_hour_of_day[hour]} for hour in busiest[:3] if by_hour_of_day[hour]
+        ],
+        "series": series,
+    }
+
+
+def top_rooms(db: Session, since: datetime, until: datetime, limit: int) -> List[dict]:
+    """Busiest rooms by messages over the range, with distinct senders (hour rows)"""
+    totals = db.query(RoomActivity.room_id, func.sum(RoomActivity.messages).label("messages")).filter(
+        _range_filter(HOUR, since, until)
+    ).group_by(RoomActivity.room_id).order_by(func.sum(RoomActivity.messages).desc()).limit(limit).all()
+    if not totals:
+        return []
+    from app.services.hll import HyperLogLog
+
+    sketches: Dict[int, HyperLogLog] = {room_id: HyperLogLog() for room_id, _ in totals}
+    for room_id, sketch_bytes in db.query(RoomActivity.room_id, RoomActivity.users).filter(
+        RoomActivity.room_id.in_(list(sketches)), _range_filter(HOUR, since, until)
+    ):
+        sketches[room_id].merge(HyperLogLog.from_bytes(sketch_bytes))
+    return [
+        {"room_id": room_id, "messages": int(messages), "active_users": sketches[room_id].count()}
+        for room_id, messages in totals
+    ]
+
+
+# Global activity rollup instance
+room_activity = ActivityRollup()
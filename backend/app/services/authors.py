@@ -0,0 +1,136 @@
+"""
+Author snapshots
+Messages carry their author's username and avatar_url as of the insert
+(messages.author_username / author_avatar_url), so history pages, threads,
+the mention inbox and broadcast frames are built from message rows alone.
+
+New messages take the snapshot from a per-worker LRU of user_id ->
+profile: one primary key lookup on a miss, trusted for
+author_cache_ttl_seconds. A profile change refreshes this worker's entry
+and queues the user on the "authors" background queue (app.core.tasks):
+each job takes every user changed since the last one and rewrites their
+messages author_propagation_batch_size rows per transaction, touching only
+rows whose snapshot differs. Each user is propagated a second time once
+the cache TTL has passed, which catches messages other workers wrote from
+a profile they had cached before the change.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Optional, Set, Tuple
+
+from sqlalchemy import or_, select, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import Counter
+from app.core.tasks import executor
+from app.db.session import SessionLocal
+from app.models.message import Message
+from app.models.user import User
+
+author_snapshots_rewritten_total = Counter(
+    "author_snapshots_rewritten_total", "Messages whose author snapshot was rewritten after a profile change"
+)
+
+# (username, avatar_url)
+Profile = Tuple[Optional[str], Optional[str]]
+
+
+def propagate_profile(user_id: int, batch_size: int) -> int:
+    """Bring the snapshot on a user's messages up to their current profile (runs in a thread)"""
+    db = SessionLocal()
+    try:
+        profile = db.query(User.username, User.avatar_url).filter(User.id == user_id).first()
+        if profile is None:
+            return 0
+        username, avatar_url = profile
+        stale = (
+            select(Message.id)
+            .where(
+                Message.user_id == user_id,
+                or_(
+                    Message.author_username.is_distinct_from(username),
+                    Message.author_avatar_url.is_distinct_from(avatar_url),
+                ),
+            )
+            .limit(batch_size)
+        )
+        total = 0
+        while True:
+            ids = db.execute(stale).scalars().all()
+            if not ids:
+                break
+            db.execute(
+                update(Message)
+                .where(Message.id.in_(ids))
+                .values(author_username=username, author_avatar_url=avatar_url)
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            total += len(ids)
+            if len(ids) < batch_size:
+                break
+        return total
+    finally:
+        db.close()
+
+
+class AuthorProfiles:
+    """Profiles for new messages, and propagation of profile changes to old ones"""
+
+    def __init__(self):
+        self._cache: "OrderedDict[int, Tuple[Profile, float]]" = OrderedDict()
+        # Users whose messages need a new snapshot
+        self.pending: Set[int] = set()
+        self._queued = False
+        self._queue = executor.queue("authors", concurrency=1)
+
+    def get(self, db: Session, user_id: int) -> Profile:
+        entry = self._cache.get(user_id)
+        if entry is not None and time.monotonic() - entry[1] <= settings.author_cache_ttl_seconds:
+            self._cache.move_to_end(user_id)
+            return entry[0]
+        row = db.query(User.username, User.avatar_url).filter(User.id == user_id).first()
+        profile = (row.username, row.avatar_url) if row else (None, None)
+        self._put(user_id, profile)
+        return profile
+
+    def _put(self, user_id: int, profile: Profile) -> None:
+        self._cache[user_id] = (profile, time.monotonic())
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > settings.author_cache_size:
+            self._cache.popitem(last=False)
+
+    def stamp(self, db: Session, message: Message) -> None:
+        """Set the author snapshot on a new message"""
+        message.author_username, message.author_avatar_url = self.get(db, message.user_id)
+
+    def changed(self, user: User) -> None:
+        """A user's profile was committed: use it from now on and rewrite their messages"""
+        self._put(user.id, (user.username, user.avatar_url))
+        self._schedule(user.id)
+        asyncio.get_running_loop().call_later(settings.author_cache_ttl_seconds + 1, self._schedule, user.id)
+
+    def _schedule(self, user_id: int) -> None:
+        self.pending.add(user_id)
+        if not self._queued:
+            self._queued = self._queue.submit(self._propagate, retries=3)
+
+    async def _propagate(self) -> None:
+        self._queued = False
+        batch, self.pending = self.pending, set()
+        remaining = set(batch)
+        try:
+            for user_id in batch:
+                rewritten = await asyncio.to_thread(propagate_profile, user_id, settings.author_propagation_batch_size)
+                author_snapshots_rewritten_total.inc(rewritten)
+                remaining.discard(user_id)
+        except Exception:
+            # Retried by the queue together with anything changed meanwhile
+            self.pending |= remaining
+            raise
+
+
+# Global author profiles instance
+author_profiles = AuthorProfiles()
@@ -0,0 +1,98 @@
+"""
+Idempotent sends
+Clients tag each send with a client_msg_id and resend it freely after a
+dropped connection. A bounded LRU of recent (user, client_msg_id) ->
+message id answers repeats in O(1) without a query; the unique index on
+messages (user_id, client_msg_id) catches what the cache can't see (other
+workers, evicted entries), in which case the insert is rolled back - the
+room sequence number with it, so sequences stay gap-free - and the stored
+message is returned instead.
+"""
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import Counter
+from app.core.tracing import span
+from app.models.message import Message
+
+duplicate_sends_total = Counter("duplicate_sends_total", "Resent messages answered with the stored copy", ("source",))
+
+
+class DedupCache:
+    """LRU of (user_id, client_msg_id) -> (message_id, stored_at), bounded in size and age"""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple[int, str], Tuple[int, float]]" = OrderedDict()
+
+    def get(self, user_id: int, client_msg_id: str) -> Optional[int]:
+        key = (user_id, client_msg_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        message_id, stored_at = entry
+        if time.monotonic() - stored_at > self.ttl_seconds:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return message_id
+
+    def put(self, user_id: int, client_msg_id: str, message_id: int) -> None:
+        key = (user_id, client_msg_id)
+        self._entries[key] = (message_id, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+message_dedup = DedupCache(settings.dedup_cache_size, settings.dedup_ttl_seconds)
+
+
+def find_duplicate(db: Session, user_id: int, client_msg_id: Optional[str]) -> Optional[Message]:
+    """The message already stored for this send, if the cache knows about it"""
+    if not client_msg_id:
+        return None
+    message_id = message_dedup.get(user_id, client_msg_id)
+    if message_id is None:
+        return None
+    return db.get(Message, message_id)
+
+
+def commit_message(db: Session, message: Message) -> Tuple[Message, bool]:
+    """
+    Commit a pending message.
+
+    Returns (message, True) for a new message, or (stored message, False)
+    when the unique index shows this client_msg_id was already stored.
+    """
+    try:
+        with span("db.insert"):
+            db.flush()
+        with span("db.commit"):
+            db.commit()
+    except IntegrityError:
+        db.rollback()
+        if not message.client_msg_id:
+            raise
+        existing = db.query(Message).filter(
+            Message.user_id == message.user_id,
+            Message.client_msg_id == message.client_msg_id
+        ).first()
+        if existing is None:
+            raise
+        message_dedup.put(existing.user_id, existing.client_msg_id, existing.id)
+        return existing, False
+    with span("db.refresh"):
+        db.refresh(message)
+    if message.client_msg_id:
+        message_dedup.put(message.user_id, message.client_msg_id, message.id)
+    return message, True
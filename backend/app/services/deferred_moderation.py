@@ -0,0 +1,283 @@
+"""
+Deliver-first moderation
+For trusted users and rooms that opt in, a message only goes through the
+local checks (length, word filter) before it is stored and broadcast; the
+remote classifier runs afterwards on a small pool of background workers.
+A message the classifier flags is retracted: its content is cleared
+(deleted_at set, like a retention tombstone), the room gets a
+message_removed event and the delivered text is kept in moderation_audit
+together with how many people had it on screen and for how long.
+
+Messages waiting for the classifier carry pending_moderation = true, so a
+restart picks them up again instead of letting them through unchecked.
+Checked-clean messages are unmarked in batches. If the queue is full the
+caller moderates synchronously as before.
+"""
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import List, NamedTuple, Optional
+
+from sqlalchemy import func, update
+
+from app.core.config import settings
+from app.core.metrics import Counter, Histogram, moderation_errors_total
+from app.db.session import SessionLocal
+from app.models.message import Message
+from app.models.moderation_audit import ModerationAudit
+from app.models.room import Room
+from app.services.moderation import classify, has_classifier
+from app.services.room_directory import room_directory
+from app.websocket.manager import manager
+
+moderation_deferred_total = Counter(
+    "moderation_deferred_total", "Messages delivered before moderation, by outcome", ("outcome",)
+)
+moderation_retracted_seen_total = Counter(
+    "moderation_retracted_seen_total", "Retracted messages that had reached at least one other socket"
+)
+moderation_retraction_exposure_seconds = Histogram(
+    "moderation_retraction_exposure_seconds", "Time a retracted message was visible",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+)
+
+
+class PendingCheck(NamedTuple):
+    message_id: int
+    room_id: Optional[int]
+    user_id: int
+    content: str
+    delivered_at: float
+    recipients: int
+
+
+def deliver_first(room: Room, is_trusted: bool) -> bool:
+    """Whether messages from this user in this room skip the wait for the classifier"""
+    if not settings.moderation_deliver_first or not has_classifier():
+        return False
+    return bool(room.deliver_first or is_trusted)
+
+
+def room_audience(room_id: Optional[int]) -> int:
+    """Other sockets in the room right now (all workers when occupancy is known)"""
+    if room_id is None:
+        return 0
+    sockets = max(manager.get_room_connection_count(room_id), room_directory.occupancy.get(room_id, 0))
+    return max(0, sockets - 1)
+
+
+class DeferredModeration:
+    def __init__(self):
+        self.queue: Optional[asyncio.Queue] = None
+        self._cleared: List[int] = []
+        self._workers: List[asyncio.Task] = []
+        self.flagged = 0
+        self.flagged_seen = 0
+
+    def report(self) -> dict:
+        return {
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "flagged": self.flagged,
+            "flagged_seen": self.flagged_seen,
+            # Share of retracted messages someone else had already received
+            "seen_before_retraction_rate": round(self.flagged_seen / self.flagged, 4) if self.flagged else 0.0,
+        }
+
+    def submit(self, message: Message) -> bool:
+        """Queue a stored, already broadcast message for the classifier; False if the queue is full"""
+        if self.queue is None:
+            return False
+        check = PendingCheck(
+            message.id, message.room_id, message.user_id, message.content, time.time(), room_audience(message.room_id)
+        )
+        try:
+            self.queue.put_nowait(check)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    def has_capacity(self) -> bool:
+        return self.queue is not None and not self.queue.full()
+
+    async def after_delivery(self, message: Message) -> None:
+        """Hand a delivered message to the classifier, checking it inline if the queue filled up meanwhile"""
+        if not self.submit(message):
+            await self._check(PendingCheck(
+                message.id, message.room_id, message.user_id, message.content, time.time(),
+                room_audience(message.room_id)
+            ))
+
+    # Outcomes
+
+    def _clear(self, message_ids: List[int]) -> None:
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(Message).where(Message.id.in_(message_ids)).values(pending_moderation=False)
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def _retract(self, check: PendingCheck, reason: str) -> Optional[int]:
+        """Clear the message and write the audit entry; returns exposure in ms (None if already handled)"""
+        exposure_ms = int((time.time() - check.delivered_at) * 1000)
+        db = SessionLocal()
+        try:
+            retracted = db.execute(
+                update(Message)
+                .where(Message.id == check.message_id, Message.pending_moderation == True)
+                .values(content="", deleted_at=datetime.now(timezone.utc), pending_moderation=False)
+            ).rowcount
+            if not retracted:
+                # Deleted meanwhile, or another worker got to it first (recovery after a restart)
+                db.rollback()
+                return None
+            db.add(ModerationAudit(
+                message_id=check.message_id,
+                room_id=check.room_id,
+                user_id=check.user_id,
+                action="retracted",
+                reason=reason,
+                content=check.content,
+                recipients=check.recipients,
+                exposure_ms=exposure_ms,
+            ))
+            db.commit()
+        finally:
+            db.close()
+        return exposure_ms
+
+    async def _check(self, check: PendingCheck) -> None:
+        try:
+            is_safe, reason = await asyncio.to_thread(classify, check.content)
+        except Exception as e:
+            # Same fallback as the synchronous path: the local checks already passed
+            moderation_errors_total.inc(backend="openai")
+            moderation_deferred_total.inc(outcome="error")
+            print(f"Deferred moderation error for message {check.message_id}: {e}")
+            is_safe, reason = True, ""
+        if is_safe:
+            moderation_deferred_total.inc(outcome="clean")
+            self._cleared.append(check.message_id)
+            return
+
+        reason = reason or "Content violates community guidelines"
+        exposure_ms = await asyncio.to_thread(self._retract, check, reason)
+        if exposure_ms is None:
+            return
+        moderation_deferred_total.inc(outcome="retracted")
+        moderation_retraction_exposure_seconds.observe(exposure_ms / 1000)
+        self.flagged += 1
+        if check.recipients:
+            self.flagged_seen += 1
+            moderation_retracted_seen_total.inc()
+        if check.room_id is not None:
+            await manager.broadcast_to_room({
+                "type": "message_removed",
+                "id": check.message_id,
+                "room_id": check.room_id,
+                "reason": reason,
+            }, check.room_id)
+
+    async def _work(self) -> None:
+        while True:
+            check = await self.queue.get()
+            try:
+                await self._check(check)
+            except Exception as e:
+                print(f"Deferred moderation failed for message {check.message_id}: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def _flush_cleared(self) -> None:
+        while True:
+            await asyncio.sleep(1.0)
+            await self._flush()
+
+    async def _flush(self) -> None:
+        if not self._cleared:
+            return
+        cleared, self._cleared = self._cleared, []
+        try:
+            await asyncio.to_thread(self._clear, cleared)
+        except Exception as e:
+            print(f"Deferred moderation flush error: {e}")
+            self._cleared.extend(cleared)
+
+    def _last_message_id(self) -> int:
+        db = SessionLocal()
+        try:
+            return db.query(func.max(Message.id)).scalar() or 0
+        finally:
+            db.close()
+
+    def _load_pending(self, after_id: int, up_to: int) -> List[Message]:
+        db = SessionLocal()
+        try:
+            return (
+                db.query(Message)
+                .filter(Message.pending_moderation == True, Message.id > after_id, Message.id <= up_to)
+                .order_by(Message.id)
+                .limit(settings.moderation_queue_size)
+                .all()
+            )
+        finally:
+            db.close()
+
+    async def _recover(self) -> None:
+        """Re-queue messages left pending by a previous process"""
+        # A page at a time; put() waits for room, so a backlog larger than the
+        # queue (or one sharing it with live traffic) feeds in as workers free up.
+        # Messages stored after this point were submitted by this process already.
+        try:
+            up_to = await asyncio.to_thread(self._last_message_id)
+        except Exception as e:
+            print(f"Deferred moderation recovery error: {e}")
+            return
+        after_id = 0
+        recovered = 0
+        while True:
+            try:
+                pending = await asyncio.to_thread(self._load_pending, after_id, up_to)
+            except Exception as e:
+                print(f"Deferred moderation recovery error: {e}")
+                break
+            if not pending:
+                break
+            for message in pending:
+                await self.queue.put(PendingCheck(
+                    message.id, message.room_id, message.user_id, message.content,
+                    message.created_at.timestamp(), 0
+                ))
+            recovered += len(pending)
+            after_id = pending[-1].id
+        if recovered:
+            print(f"Deferred moderation: re-queued {recovered} pending messages")
+
+    def start(self) -> None:
+        if self._workers or not has_classifier():
+            return
+        self.queue = asyncio.Queue(maxsize=settings.moderation_queue_size)
+        self._workers = [asyncio.create_task(self._work()) for _ in range(settings.moderation_workers)]
+        self._workers.append(asyncio.create_task(self._flush_cleared()))
+        self._workers.append(asyncio.create_task(self._recover()))
+
+    async def stop(self) -> None:
+        if not self._workers:
+            return
+        # Give queued checks a moment; anything left stays pending for the next start
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=settings.drain_inflight_timeout_seconds)
+        except asyncio.TimeoutError:
+            pass
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        await self._flush()
+        self.queue = None
+
+
+# Global deferred moderation instance
+deferred_moderation = DeferredModeration()
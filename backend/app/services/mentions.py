@@ -0,0 +1,242 @@
+"""
+@mentions
+Messages are scanned once when they are sent, on the "mentions" background
+queue (app.core.tasks) so a lookup never holds up the sender's socket: one
+compiled pattern pulls the @name tokens out of the content, and each is
+looked up in this worker's map of known usernames. The map is loaded in
+the background at startup; names it does not know yet (users registered on
+another worker) are looked up in one query, and names that match nobody
+are remembered for mention_unknown_ttl_seconds so repeated @typos don't hit
+the database.
+
+Each mentioned user gets a narrow (user_id, message_id) row in mentions,
+inserted in batches by a background flush, and a "mention" frame on their
+/ws/system sockets on every worker. In a private room only members count
+as mentioned (app.services.room_access), and the inbox leaves out private
+rooms the user has since left. The inbox reads newest first with a message
+id keyset on the primary key.
+"""
+import asyncio
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import exists, or_
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import Counter
+from app.core.tasks import executor
+from app.db.session import SessionLocal
+from app.models.mention import Mention
+from app.models.message import Message
+from app.models.room import Room
+from app.models.room_member import RoomMember
+from app.models.user import User
+from app.services.room_access import room_access
+from app.websocket.manager import manager
+
+# "@name" not preceded by a word character or another "@" (emails, "@@")
+MENTION_PATTERN = re.compile(r"(?<![\w@])@([^\s@]+)")
+# Stripped when the token as written is not a username ("@alice," / "(@bob)")
+TRAILING_PUNCTUATION = ".,;:!?)]}'\""
+
+mentions_total = Counter("mentions_total", "Users mentioned in sent messages")
+
+
+def _insert_mentions(rows: List[dict]) -> None:
+    db = SessionLocal()
+    try:
+        if db.bind.dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        db.execute(insert(Mention).on_conflict_do_nothing(), rows)
+        db.commit()
+    finally:
+        db.close()
+
+
+class MentionIndex:
+    """Username matcher, batched index writes and live mention push"""
+
+    def __init__(self):
+        # username -> user_id for active users
+        self.known: Dict[str, int] = {}
+        # username -> monotonic expiry, for @names that matched nobody
+        self._unknown: Dict[str, float] = {}
+        # Index rows not yet written
+        self.pending: List[dict] = []
+        self._flush_requested = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._queue = executor.queue("mentions", concurrency=2)
+
+    # Matching
+
+    def add_user(self, username: str, user_id: int) -> None:
+        """Make a new user mentionable right away on this worker"""
+        self.known[username] = user_id
+        self._unknown.pop(username, None)
+
+    def _load(self) -> None:
+        db = SessionLocal()
+        try:
+            for user_id, username in db.query(User.id, User.username).filter(User.is_active.is_(True)):
+                self.known.setdefault(username, user_id)
+        finally:
+            db.close()
+
+    def _lookup(self, names: List[str]) -> List[Tuple[int, str]]:
+        """Active users among names (runs in a thread)"""
+        db = SessionLocal()
+        try:
+            return db.query(User.id, User.username).filter(User.username.in_(names), User.is_active.is_(True)).all()
+        finally:
+            db.close()
+
+    async def _complete(self, names: List[str]) -> None:
+        """Fill in the known map from the database (names not found are cached as unknown)"""
+        now = time.monotonic()
+        missing = [name for name in names if name not in self.known and self._unknown.get(name, 0) <= now]
+        if not missing:
+            return
+        for user_id, username in await asyncio.to_thread(self._lookup, missing):
+            self.add_user(username, user_id)
+        if len(self._unknown) > 10000:
+            self._unknown.clear()
+        expires = now + settings.mention_unknown_ttl_seconds
+        for name in missing:
+            if name not in self.known:
+                self._unknown[name] = expires
+
+    async def parse(self, content: str, author_id: int) -> Dict[int, str]:
+        """Users mentioned in a message (user_id -> username), excluding the author"""
+        tokens = MENTION_PATTERN.findall(content)
+        if not tokens:
+            return {}
+        forms: List[Tuple[str, str]] = [(token, token.rstrip(TRAILING_PUNCTUATION)) for token in tokens]
+        await self._complete(list({name for pair in forms for name in pair if name}))
+
+        mentioned: Dict[int, str] = {}
+        for exact, stripped in forms:
+            name = exact if exact in self.known else stripped
+            user_id = self.known.get(name)
+            if user_id is None or user_id == author_id:
+                continue
+            mentioned[user_id] = name
+            if len(mentioned) >= settings.mention_max_per_message:
+                break
+        return mentioned
+
+    # Index and push
+
+    def submit(self, message: Message) -> None:
+        """Hand a committed message to the background queue (a cheap no-op without an "@")"""
+        if "@" not in message.content:
+            return
+        # Plain values: the ORM object belongs to the caller's session
+        self._queue.submit(self.process, {
+            "type": "mention",
+            "id": message.id,
+            "content": message.content,
+            "room_id": message.room_id,
+            "user_id": message.user_id,
+            "username": message.author_username,
+            "avatar_url": message.author_avatar_url,
+            "thread_root_id": message.thread_root_id,
+            "seq": message.seq,
+            "created_at": message.created_at.isoformat(),
+        }, retries=2)
+
+    async def process(self, frame: dict) -> Dict[int, str]:
+        """Parse a message, queue its index rows and notify the mentioned users"""
+        mentioned = await self.parse(frame["content"], frame["user_id"])
+        if mentioned and frame["room_id"] is not None:
+            members = await room_access.members_async(frame["room_id"])
+            if members is not None:
+                mentioned = {user_id: name for user_id, name in mentioned.items() if user_id in members}
+        if not mentioned:
+            return mentioned
+        mentions_total.inc(len(mentioned))
+        self.pending.extend({"user_id": user_id, "message_id": frame["id"]} for user_id in mentioned)
+        if len(self.pending) >= settings.mention_flush_batch_size:
+            self._flush_requested.set()
+        # Nothing below may raise: a retry of this job would queue the rows and
+        # push to the users who already got the frame a second time
+        for username in mentioned.values():
+            try:
+                await manager.notify_user(username, frame)
+            except Exception as e:
+                print(f"Mention push error for {username}: {e}")
+        return mentioned
+
+    def inbox(self, db: Session, user_id: int, before_id: Optional[int], limit: int) -> Tuple[List[Message], Optional[int]]:
+        """One keyset page of messages mentioning a user, newest first, and the cursor for the next page"""
+        query = (
+            db.query(Message)
+            .join(Mention, Mention.message_id == Message.id)
+            .outerjoin(Room, Room.id == Message.room_id)
+            .filter(
+                Mention.user_id == user_id,
+                or_(
+                    Room.id.is_(None),
+                    Room.is_public == True,
+                    exists().where(RoomMember.room_id == Message.room_id, RoomMember.user_id == user_id),
+                ),
+            )
+        )
+        if before_id is not None:
+            query = query.filter(Mention.message_id < before_id)
+        messages = query.order_by(Mention.message_id.desc()).limit(limit + 1).all()
+        if len(messages) > limit:
+            messages = messages[:limit]
+            return messages, messages[-1].id
+        return messages, None
+
+    # Flushing
+
+    async def flush(self) -> int:
+        if not self.pending:
+            return 0
+        batch, self.pending = self.pending, []
+        try:
+            await asyncio.to_thread(_insert_mentions, batch)
+        except Exception as e:
+            self.pending[:0] = batch
+            print(f"Mention flush error: {e}")
+            return 0
+        return len(batch)
+
+    async def _run(self) -> None:
+        try:
+            await asyncio.to_thread(self._load)
+        except Exception as e:
+            # Names are still resolved from the database as they come up
+            print(f"Mention username load error: {e}")
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self._flush_requested.wait(), timeout=settings.mention_flush_interval_seconds
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            await self.flush()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+# Global mention index instance
+mention_index = MentionIndex()
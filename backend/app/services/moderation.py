@@ -1,16 +1,46 @@
 """
 Content moderation service
-Uses OpenAI Moderation API with fallback to basic word filter
+Uses OpenAI Moderation API with fallback to basic word filter; a local
+pre-classifier settles the clear-cut messages first
 """
-from typing import List, Tuple
+import os
+from typing import List, Optional, Tuple
 import re
-from openai import OpenAI
 from app.core.config import settings
+from app.core.metrics import moderation_errors_total, moderation_prefilter_total, moderation_seconds
+from app.core.tracing import span
 
-# Initialize OpenAI client if API key is available
-openai_client = None
-if settings.openai_api_key:
-    openai_client = OpenAI(api_key=settings.openai_api_key)
+# OpenAI client, created on first use (the openai package is slow to import)
+_openai_client = None
+
+
+def get_openai_client():
+    """Return the OpenAI client, or None if no API key is configured"""
+    global _openai_client
+    if _openai_client is None and settings.openai_api_key:
+        from openai import OpenAI
+        _openai_client = OpenAI(api_key=settings.openai_api_key)
+    return _openai_client
+
+
+# Local pre-classifier, loaded on first use (NumPy import and weights file)
+_prefilter = None
+_prefilter_loaded = False
+
+
+def get_prefilter():
+    """Return the pre-classifier model, or None if no weights file is configured"""
+    global _prefilter, _prefilter_loaded
+    if not _prefilter_loaded:
+        _prefilter_loaded = True
+        path = settings.moderation_prefilter_path
+        if path and os.path.exists(path):
+            try:
+                from app.services.prefilter import HashedNgramModel
+                _prefilter = HashedNgramModel.load(path)
+            except Exception as e:
+                print(f"Moderation pre-classifier not loaded from {path}: {e}")
+    return _prefilter
 
 # Basic profanity filter (fallback)
 BLACKLISTED_WORDS = [
@@ -23,12 +53,13 @@ BAHAMIAN_SLANG_ALLOWED = [
 ]
 
 
-def moderate_content(content: str) -> Tuple[bool, str]:
+def quick_check(content: str) -> Tuple[bool, str]:
     """
-    Moderate message content using OpenAI or fallback filter
+    Local checks only (length and word filter), cheap enough to run before
+    delivery even when the classifier runs afterwards
     
     Returns:
-        (is_safe, reason) - True if content is safe, False with reason if not
+        (is_safe, reason)
     """
     if not content or len(content.strip()) == 0:
         return False, "Empty message"
@@ -37,17 +68,7 @@ def moderate_content(content: str) -> Tuple[bool, str]:
     if len(content) > 10000:  # 10k character limit
         return False, "Message too long"
     
-    # Try OpenAI moderation if available
-    if openai_client:
-        try:
-            is_safe, reason = moderate_with_openai_sync(content)
-            if not is_safe:
-                return False, reason
-        except Exception as e:
-            # Log error and fall back to basic filter
-            print(f"OpenAI moderation error: {e}")
-    
-    # Basic word filter (case-insensitive) as fallback
+    # Basic word filter (case-insensitive)
     content_lower = content.lower()
     for word in BLACKLISTED_WORDS:
         if word in content_lower:
@@ -56,6 +77,77 @@ def moderate_content(content: str) -> Tuple[bool, str]:
     return True, ""
 
 
+def has_classifier() -> bool:
+    """Whether moderation calls out to a remote classifier (and is worth deferring)"""
+    return bool(settings.openai_api_key)
+
+
+def prefilter_verdict(content: str) -> Optional[Tuple[bool, str]]:
+    """
+    Local pre-classifier decision, or None when the score falls in the
+    uncertainty band (or there is no model) and the remote classifier decides
+    
+    Returns:
+        (is_safe, reason) or None
+    """
+    model = get_prefilter()
+    if model is None:
+        return None
+    with moderation_seconds.time(backend="prefilter"), span("moderation.prefilter") as traced:
+        score = model.score(content)
+        if traced is not None:
+            traced.set(score=round(score, 4))
+    if score < settings.moderation_prefilter_allow_below:
+        moderation_prefilter_total.inc(decision="allow")
+        return True, ""
+    if score >= settings.moderation_prefilter_block_above:
+        moderation_prefilter_total.inc(decision="block")
+        return False, "Content violates community guidelines"
+    moderation_prefilter_total.inc(decision="escalate")
+    return None
+
+
+def classify(content: str) -> Tuple[bool, str]:
+    """
+    Pre-classifier, then the remote classifier for uncertain messages;
+    remote errors propagate so callers pick the fallback
+    
+    Returns:
+        (is_safe, reason)
+    """
+    if not has_classifier():
+        return True, ""
+    verdict = prefilter_verdict(content)
+    if verdict is not None:
+        return verdict
+    with moderation_seconds.time(backend="openai"), span("moderation.remote"):
+        return moderate_with_openai_sync(content)
+
+
+def moderate_content(content: str) -> Tuple[bool, str]:
+    """
+    Moderate message content using OpenAI or fallback filter
+    
+    Returns:
+        (is_safe, reason) - True if content is safe, False with reason if not
+    """
+    is_safe, reason = quick_check(content)
+    if not is_safe:
+        return False, reason
+    
+    # Try OpenAI moderation if available
+    try:
+        is_safe, reason = classify(content)
+        if not is_safe:
+            return False, reason
+    except Exception as e:
+        # Log error and fall back to the basic filter (already passed)
+        moderation_errors_total.inc(backend="openai")
+        print(f"OpenAI moderation error: {e}")
+    
+    return True, ""
+
+
 def moderate_with_openai_sync(content: str) -> Tuple[bool, str]:
     """
     Use OpenAI moderation API to check content (synchronous version)
@@ -63,6 +155,7 @@ def moderate_with_openai_sync(content: str) -> Tuple[bool, str]:
     Returns:
         (is_safe, reason)
     """
+    openai_client = get_openai_client()
     if not openai_client:
         return True, ""
     
@@ -0,0 +1,137 @@
+"""
+Local moderation pre-classifier
+A hashed n-gram logistic regression in NumPy that scores a message before
+anything is sent to the remote classifier. The text is lowercased, padded
+with spaces and cut into byte n-grams (2-5 by default); each n-gram is
+FNV-1a hashed into one of 2**bits weights, and the score is the sigmoid of
+the bias plus the length-normalised sum of those weights. Scoring a chat
+message is a handful of vectorised operations (tens of microseconds).
+
+Weights are trained from labelled exports with
+scripts.train_moderation_prefilter and stored as float16 in a compressed
+.npz file, so the model ships as a small file next to the code.
+"""
+import math
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+FNV_OFFSET = np.uint32(2166136261)
+FNV_PRIME = np.uint32(16777619)
+FORMAT_VERSION = 1
+
+
+def ngram_buckets(text: str, bits: int, min_n: int, max_n: int) -> np.ndarray:
+    """Hashed bucket of every byte n-gram (min_n..max_n) in the padded, lowercased text"""
+    data = np.frombuffer(f" {text.lower()} ".encode("utf-8", "ignore"), dtype=np.uint8).astype(np.uint32)
+    hashes = np.full(len(data), FNV_OFFSET, dtype=np.uint32)
+    parts = []
+    # After step n, hashes[i] is FNV-1a over data[i:i + n]
+    for n in range(1, max_n + 1):
+        count = len(data) - n + 1
+        if count <= 0:
+            break
+        hashes = (hashes[:count] ^ data[n - 1:]) * FNV_PRIME
+        if n >= min_n:
+            parts.append(hashes)
+    if not parts:
+        return np.empty(0, dtype=np.int64)
+    hashed = np.concatenate(parts)
+    # Fold the high bits in before masking; FNV's low bits mix poorly
+    return ((hashed ^ (hashed >> np.uint32(bits))) & np.uint32((1 << bits) - 1)).astype(np.int64)
+
+
+class HashedNgramModel:
+    def __init__(self, weights: np.ndarray, bias: float, bits: int, min_n: int = 2, max_n: int = 5):
+        self.weights = weights.astype(np.float32)
+        self.bias = float(bias)
+        self.bits = bits
+        self.min_n = min_n
+        self.max_n = max_n
+
+    @classmethod
+    def empty(cls, bits: int = 18, min_n: int = 2, max_n: int = 5) -> "HashedNgramModel":
+        return cls(np.zeros(1 << bits, dtype=np.float32), 0.0, bits, min_n, max_n)
+
+    def buckets(self, text: str) -> np.ndarray:
+        return ngram_buckets(text, self.bits, self.min_n, self.max_n)
+
+    def score(self, text: str) -> float:
+        """Probability that the remote classifier would flag the text"""
+        buckets = self.buckets(text)
+        logit = self.bias
+        if buckets.size:
+            logit += float(self.weights[buckets].sum()) / math.sqrt(buckets.size)
+        # Clamp so exp() can't overflow on extreme weights
+        return 1.0 / (1.0 + math.exp(-max(-30.0, min(30.0, logit))))
+
+    def save(self, path: str) -> None:
+        np.savez_compressed(
+            path,
+            weights=self.weights.astype(np.float16),
+            bias=np.float32(self.bias),
+            config=np.array([FORMAT_VERSION, self.bits, self.min_n, self.max_n], dtype=np.int32),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "HashedNgramModel":
+        with np.load(path) as data:
+            version, bits, min_n, max_n = (int(value) for value in data["config"])
+            if version != FORMAT_VERSION:
+                raise ValueError(f"Unsupported pre-classifier format {version} in {path}")
+            return cls(data["weights"], float(data["bias"]), bits, min_n, max_n)
+
+
+def train(
+    texts: Sequence[str],
+    labels: Sequence[int],
+    bits: int = 18,
+    min_n: int = 2,
+    max_n: int = 5,
+    epochs: int = 5,
+    batch_size: int = 256,
+    learning_rate: float = 0.5,
+    l2: float = 1e-6,
+    seed: int = 0,
+    model: Optional[HashedNgramModel] = None,
+) -> HashedNgramModel:
+    """
+    Fit the model with mini-batch AdaGrad on the sparse hashed features.
+
+    Pass `model` to continue training existing weights (same bits and n-gram
+    range).
+    """
+    model = model or HashedNgramModel.empty(bits, min_n, max_n)
+    rows: List[np.ndarray] = [model.buckets(text) for text in texts]
+    lengths = np.array([row.size for row in rows], dtype=np.int64)
+    scales = 1.0 / np.sqrt(np.maximum(lengths, 1))
+    targets = np.asarray(labels, dtype=np.float64)
+
+    weights = model.weights.astype(np.float64)
+    bias = model.bias
+    accumulated = np.zeros_like(weights)
+    bias_accumulated = 0.0
+    rng = np.random.default_rng(seed)
+
+    for _ in range(epochs):
+        order = rng.permutation(len(rows))
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            counts = lengths[batch]
+            indices = np.concatenate([rows[index] for index in batch])
+            values = np.repeat(scales[batch], counts)
+            row_of = np.repeat(np.arange(len(batch)), counts)
+
+            logits = bias + np.bincount(row_of, weights=weights[indices] * values, minlength=len(batch))
+            errors = 1.0 / (1.0 + np.exp(-np.clip(logits, -30.0, 30.0))) - targets[batch]
+
+            touched, inverse = np.unique(indices, return_inverse=True)
+            gradient = np.bincount(inverse, weights=errors[row_of] * values) / len(batch) + l2 * weights[touched]
+            accumulated[touched] += gradient ** 2
+            weights[touched] -= learning_rate * gradient / (np.sqrt(accumulated[touched]) + 1e-8)
+
+            bias_gradient = float(errors.mean())
+            bias_accumulated += bias_gradient ** 2
+            bias -= learning_rate * bias_gradient / (math.sqrt(bias_accumulated) + 1e-8)
+
+    return HashedNgramModel(weights, bias, model.bits, model.min_n, model.max_n)
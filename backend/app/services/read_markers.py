@@ -0,0 +1,266 @@
+"""
+Read markers and unread counts
+Stores one (user, room) -> last read message entry and derives unread counts
+from per-room message sequence numbers, so nothing is counted per message.
+Marker writes are coalesced in memory and flushed to the database in batches.
+
+Watchers live on the worker holding their /ws/system socket, so each new
+head is also relayed (channel head:{room_id}) to the workers watching the
+room, which push unread deltas to their own watchers.
+"""
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.serialization import dumps_text, loads
+from app.core.tasks import executor
+from app.db.session import SessionLocal
+from app.models.read_marker import ReadMarker
+from app.models.room import Room
+from app.websocket.manager import manager
+
+
+def next_room_seq(db: Session, room_id: int) -> int:
+    """
+    Allocate the next sequence number for a room.
+
+    Runs in the caller's transaction, so the counter only moves forward when
+    the message insert commits and the sequence stays gap-free.
+    """
+    return db.execute(
+        update(Room)
+        .where(Room.id == room_id)
+        .values(message_seq=Room.message_seq + 1)
+        .returning(Room.message_seq)
+    ).scalar_one()
+
+
+def _upsert_markers(rows: List[dict]) -> None:
+    """Write a batch of markers, never moving an existing marker backwards"""
+    db = SessionLocal()
+    try:
+        if db.bind.dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(ReadMarker)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ReadMarker.user_id, ReadMarker.room_id],
+            set_={
+                "last_read_id": stmt.excluded.last_read_id,
+                "last_read_seq": stmt.excluded.last_read_seq,
+            },
+            where=ReadMarker.last_read_seq < stmt.excluded.last_read_seq,
+        )
+        db.execute(stmt, rows)
+        db.commit()
+    finally:
+        db.close()
+
+
+class ReadMarkerStore:
+    """Per-worker read marker cache with write coalescing and unread push"""
+
+    def __init__(self):
+        # (user_id, room_id) -> (last_read_id, last_read_seq) for loaded users
+        self.markers: Dict[Tuple[int, int], Tuple[int, int]] = {}
+        # Marker updates not yet written to the database (latest wins)
+        self.pending: Dict[Tuple[int, int], Tuple[int, int]] = {}
+        # room_id -> (head_seq, loaded_at)
+        self.heads: Dict[int, Tuple[int, float]] = {}
+        # room_id -> {username: user_id} for users with an open system socket
+        self.watchers: Dict[int, Dict[str, int]] = {}
+        self._flush_requested = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        # Unread pushes leave the send path; one job at a time keeps them in order
+        self._queue = executor.queue("unread", concurrency=1)
+
+    # Room heads
+
+    def note_message(self, room_id: int, seq: int) -> None:
+        """Record a newly committed message as the room head"""
+        current = self.heads.get(room_id)
+        if current is None or seq > current[0]:
+            self.heads[room_id] = (seq, time.monotonic())
+
+    def get_heads(self, db: Session, room_ids: List[int]) -> Dict[int, int]:
+        """Head sequence per room, reloading entries older than the TTL in one query"""
+        now = time.monotonic()
+        ttl = settings.unread_head_ttl_seconds
+        stale = [room_id for room_id in room_ids
+                 if room_id not in self.heads or now - self.heads[room_id][1] > ttl]
+        if stale:
+            for room_id, message_seq in db.query(Room.id, Room.message_seq).filter(Room.id.in_(stale)):
+                self.heads[room_id] = (message_seq, now)
+        return {room_id: self.heads[room_id][0] for room_id in room_ids if room_id in self.heads}
+
+    # Markers
+
+    def get_marker(self, user_id: int, room_id: int) -> Optional[Tuple[int, int]]:
+        key = (user_id, room_id)
+        return self.pending.get(key) or self.markers.get(key)
+
+    def load_user(self, db: Session, user_id: int) -> Dict[int, Tuple[int, int]]:
+        """Load a user's markers from the database, merged with unflushed updates"""
+        result = {}
+        rows = db.query(ReadMarker.room_id, ReadMarker.last_read_id, ReadMarker.last_read_seq).filter(
+            ReadMarker.user_id == user_id
+        )
+        for room_id, last_read_id, last_read_seq in rows:
+            result[room_id] = (last_read_id, last_read_seq)
+        for (pending_user, room_id), marker in self.pending.items():
+            if pending_user == user_id and marker[1] > result.get(room_id, (0, 0))[1]:
+                result[room_id] = marker
+        return result
+
+    def mark_read(self, user_id: int, room_id: int, message_id: int, seq: int, username: Optional[str] = None) -> bool:
+        """Move a marker forward; returns False if it was already at or past seq"""
+        current = self.get_marker(user_id, room_id)
+        if current is not None and current[1] >= seq:
+            return False
+        self.pending[(user_id, room_id)] = (message_id, seq)
+        # Only users with a system socket keep markers cached and get deltas
+        if username is not None and manager.has_system_connection(username):
+            self._add_watcher(room_id, username, user_id)
+            self.markers[(user_id, room_id)] = (message_id, seq)
+        if len(self.pending) >= settings.read_marker_flush_batch_size:
+            self._flush_requested.set()
+        return True
+
+    def get_unread(self, db: Session, user_id: int) -> List[dict]:
+        """Unread state for every room the user has a marker in"""
+        markers = self.load_user(db, user_id)
+        heads = self.get_heads(db, list(markers.keys()))
+        return [
+            {
+                "room_id": room_id,
+                "last_read_id": last_read_id,
+                "last_read_seq": last_read_seq,
+                "head_seq": heads.get(room_id, last_read_seq),
+                "unread": max(0, heads.get(room_id, last_read_seq) - last_read_seq),
+            }
+            for room_id, (last_read_id, last_read_seq) in markers.items()
+        ]
+
+    # Live push over /ws/system
+
+    def watch(self, db: Session, username: str, user_id: int) -> List[dict]:
+        """Subscribe a system socket user to unread deltas and return their current state"""
+        unread = self.get_unread(db, user_id)
+        for entry in unread:
+            self._add_watcher(entry["room_id"], username, user_id)
+            self.markers[(user_id, entry["room_id"])] = (entry["last_read_id"], entry["last_read_seq"])
+        return unread
+
+    def unwatch(self, username: str) -> None:
+        for room_id in list(self.watchers):
+            watchers = self.watchers[room_id]
+            user_id = watchers.pop(username, None)
+            if user_id is not None:
+                self.markers.pop((user_id, room_id), None)
+            if not watchers:
+                del self.watchers[room_id]
+                manager.relay.head_unwatched(room_id)
+
+    def _add_watcher(self, room_id: int, username: str, user_id: int) -> None:
+        if room_id not in self.watchers:
+            self.watchers[room_id] = {}
+            manager.relay.head_watched(room_id)
+        self.watchers[room_id][username] = user_id
+
+    def message_committed(self, room_id: int, seq: int, sender: Optional[Tuple[str, int, int]] = None) -> None:
+        """
+        Advance the room head after a message commits.
+
+        The sender (username, user_id, message_id) has implicitly read their
+        own message. Unread deltas are pushed from the background queue, here
+        and on the workers watching the room.
+        """
+        self._advance(room_id, seq, sender)
+        self._queue.submit(self._push_unread, room_id, seq)
+        manager.relay.publish_head(room_id, dumps_text({"seq": seq, "sender": sender}))
+
+    def _advance(self, room_id: int, seq: int, sender: Optional[Tuple[str, int, int]]) -> None:
+        self.note_message(room_id, seq)
+        if sender is not None:
+            username, user_id, message_id = sender
+            self.mark_read(user_id, room_id, message_id, seq, username=username)
+
+    async def _apply_head(self, room_id: int, payload: str) -> None:
+        """A message committed on another worker: update the head and push to local watchers"""
+        head = loads(payload)
+        seq = head["seq"]
+        self.note_message(room_id, seq)
+        if head["sender"] is not None:
+            # The sender's marker is written by their worker; only our cached copy moves
+            _, user_id, message_id = head["sender"]
+            marker = self.markers.get((user_id, room_id))
+            if marker is not None and marker[1] < seq:
+                self.markers[(user_id, room_id)] = (message_id, seq)
+        self._queue.submit(self._push_unread, room_id, seq)
+
+    async def _push_unread(self, room_id: int, seq: int) -> None:
+        for username, user_id in list(self.watchers.get(room_id, {}).items()):
+            marker = self.get_marker(user_id, room_id)
+            last_read_seq = marker[1] if marker else 0
+            await manager.send_to_user(username, {
+                "type": "unread",
+                "room_id": room_id,
+                "head_seq": seq,
+                "unread": max(0, seq - last_read_seq),
+            })
+
+    # Flushing
+
+    async def flush(self) -> int:
+        if not self.pending:
+            return 0
+        batch, self.pending = self.pending, {}
+        rows = [
+            {"user_id": user_id, "room_id": room_id, "last_read_id": last_read_id, "last_read_seq": last_read_seq}
+            for (user_id, room_id), (last_read_id, last_read_seq) in batch.items()
+        ]
+        try:
+            await asyncio.to_thread(_upsert_markers, rows)
+        except Exception as e:
+            # Put the batch back unless a newer update arrived meanwhile
+            for key, marker in batch.items():
+                if key not in self.pending:
+                    self.pending[key] = marker
+            print(f"Read marker flush error: {e}")
+            return 0
+        return len(rows)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self._flush_requested.wait(), timeout=settings.read_marker_flush_interval_seconds
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            await self.flush()
+
+    def start(self) -> None:
+        manager.relay.on_head(self._apply_head)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+# Global read marker store instance
+read_markers = ReadMarkerStore()
@@ -0,0 +1,350 @@
+"""
+Message retention
+Deletes room messages older than the room's retention_days (or
+settings.retention_default_days) in small batches instead of one big
+DELETE. Each room is walked in id order with a keyset on the (room_id, id)
+index, one short transaction per batch, and the position is checkpointed in
+retention_checkpoints so a run resumes where the last one stopped. (Not
+seq: messages from before per-room sequence numbers have none.)
+
+Replies keep working when their parents go: a surviving reply that pointed
+at a purged message is re-pointed at its thread root, and a root that still
+has live replies is tombstoned (content cleared, deleted_at set) instead of
+deleted. Root reply counts are decremented as replies are purged, and a
+tombstone is deleted once its last reply is gone.
+"""
+import asyncio
+import time
+from collections import Counter as Tally
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+from sqlalchemy import bindparam, delete, func, or_, select, text, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from app.core.config import WORKER_ID, settings
+from app.core.metrics import Counter
+from app.core.redis import get_redis_client
+from app.db.session import SessionLocal, engine, replica_router
+from app.models.mention import Mention
+from app.models.message import Message
+from app.models.retention_checkpoint import RetentionCheckpoint
+from app.models.room import Room
+from app.websocket.manager import manager
+
+LOCK_KEY = "retention:lock"
+# pg_try_advisory_lock key standing in for LOCK_KEY when Redis is down
+ADVISORY_LOCK_ID = 7_301_001
+
+retention_purged_total = Counter(
+    "retention_purged_total", "Messages removed by the retention job", ("action",)
+)
+
+messages = Message.__table__
+
+DECREMENT_REPLIES = (
+    update(messages)
+    .where(messages.c.id == bindparam("root_id"))
+    .values(reply_count=messages.c.reply_count - bindparam("purged"))
+)
+
+
+def retention_policies(db: Session) -> List[Tuple[int, int]]:
+    """(room id, retention days) for every room with something to purge"""
+    days = func.coalesce(Room.retention_days, settings.retention_default_days)
+    return [(room_id, room_days) for room_id, room_days in db.query(Room.id, days).filter(days > 0).order_by(Room.id)]
+
+
+def purge_batch(
+    db: Session, room_id: int, cutoff: datetime, after_id: int, batch_size: int
+) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Purge the next batch of expired messages in a room (caller commits).
+
+    Returns (last seq, last id, deleted, tombstoned), or None when nothing
+    after `after_id` is older than `cutoff`.
+    """
+    rows = db.execute(
+        select(
+            messages.c.id, messages.c.seq, messages.c.reply_to_id, messages.c.thread_root_id,
+            messages.c.reply_count, (messages.c.created_at < cutoff).label("expired"),
+        )
+        .where(messages.c.room_id == room_id, messages.c.id > after_id)
+        .order_by(messages.c.id)
+        .limit(batch_size)
+    ).all()
+    # Stop at the first message that is still within retention: ids follow
+    # insert order, so everything after it is newer too
+    batch = []
+    for row in rows:
+        if not row.expired:
+            break
+        batch.append(row)
+    if not batch:
+        return None
+
+    ids = [row.id for row in batch]
+    purged_replies = Tally(row.thread_root_id for row in batch if row.thread_root_id is not None)
+    tombstones = [
+        row.id for row in batch
+        if row.reply_to_id is None and row.reply_count - purged_replies.get(row.id, 0) > 0
+    ]
+    doomed = sorted(set(ids) - set(tombstones))
+    # Roots that stay (outside the batch or tombstoned) lose the replies purged here
+    surviving_roots = {root_id: count for root_id, count in purged_replies.items() if root_id not in doomed}
+
+    if surviving_roots:
+        db.execute(DECREMENT_REPLIES, [{"root_id": root_id, "purged": count} for root_id, count in surviving_roots.items()])
+    # Surviving replies whose parent goes hang off the thread root instead
+    db.execute(
+        update(messages)
+        .where(messages.c.reply_to_id.in_(ids), messages.c.id.notin_(ids))
+        .values(reply_to_id=messages.c.thread_root_id)
+    )
+    if doomed:
+        # Anything still pointing at a deleted row (replies written before thread roots were backfilled)
+        db.execute(
+            update(messages)
+            .where(or_(messages.c.reply_to_id.in_(doomed), messages.c.thread_root_id.in_(doomed)),
+                   messages.c.id.notin_(ids))
+            .values(reply_to_id=None, thread_root_id=None)
+        )
+    if tombstones:
+        db.execute(
+            update(messages).where(messages.c.id.in_(tombstones)).values(content="", deleted_at=func.now())
+        )
+    deleted = 0
+    if doomed:
+        db.execute(delete(Mention).where(Mention.message_id.in_(doomed)))
+        deleted += db.execute(delete(messages).where(messages.c.id.in_(doomed))).rowcount
+    outside_roots = [root_id for root_id in surviving_roots if root_id not in tombstones]
+    if outside_roots:
+        # Tombstones from earlier batches whose last reply just went
+        deleted += db.execute(
+            delete(messages).where(
+                messages.c.id.in_(outside_roots),
+                messages.c.deleted_at.isnot(None),
+                messages.c.reply_count <= 0,
+            )
+        ).rowcount
+        db.execute(
+            delete(Mention).where(
+                Mention.message_id.in_(outside_roots),
+                ~select(messages.c.id).where(messages.c.id == Mention.message_id).exists(),
+            )
+        )
+
+    through_id = batch[-1].id
+    checkpoint = db.get(RetentionCheckpoint, room_id)
+    if checkpoint is None:
+        checkpoint = RetentionCheckpoint(room_id=room_id, purged_through_seq=0, purged_total=0)
+        db.add(checkpoint)
+    # Older messages may have no seq; keep the last one seen
+    seqs = [row.seq for row in batch if row.seq is not None]
+    if seqs:
+        checkpoint.purged_through_seq = seqs[-1]
+    through_seq = checkpoint.purged_through_seq
+    checkpoint.purged_through_id = through_id
+    checkpoint.purged_total = (checkpoint.purged_total or 0) + deleted
+    return through_seq, through_id, deleted, len(tombstones)
+
+
+def purge_room_step(room_id: int, days: int, batch_size: int) -> Optional[Tuple[int, int, int, int]]:
+    """One batch for a room in its own session and transaction (runs in a thread)"""
+    db = SessionLocal()
+    try:
+        checkpoint = db.get(RetentionCheckpoint, room_id)
+        after_id = checkpoint.purged_through_id if checkpoint else 0
+        cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+        result = purge_batch(db, room_id, cutoff, after_id, batch_size)
+        db.commit()
+        return result
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _load_policies() -> List[Tuple[int, int]]:
+    db = SessionLocal()
+    try:
+        return retention_policies(db)
+    finally:
+        db.close()
+
+
+class RetentionJob:
+    """Background purge with progress reporting; one worker runs it at a time"""
+
+    def __init__(self):
+        self.running = False
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.room_id: Optional[int] = None
+        self.rooms_done = 0
+        self.rooms_total = 0
+        self.batches = 0
+        self.deleted = 0
+        self.tombstoned = 0
+        self.last_error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+        self._run: Optional[asyncio.Task] = None
+        # Connection holding the advisory lock while a run goes without Redis
+        self._lock_conn: Optional[Connection] = None
+
+    def report(self) -> dict:
+        elapsed = 0.0
+        if self.started_at is not None:
+            elapsed = (self.finished_at or time.monotonic()) - self.started_at
+        return {
+            "running": self.running,
+            "room_id": self.room_id,
+            "rooms_done": self.rooms_done,
+            "rooms_total": self.rooms_total,
+            "batches": self.batches,
+            "deleted": self.deleted,
+            "tombstoned": self.tombstoned,
+            "elapsed_seconds": round(elapsed, 3),
+            "rows_per_second": round((self.deleted + self.tombstoned) / elapsed, 1) if elapsed else 0.0,
+            "last_error": self.last_error,
+        }
+
+    def _lock(self) -> bool:
+        """Take (or extend) the cluster-wide lock; in the database when Redis is unavailable"""
+        redis_client = get_redis_client()
+        if not redis_client:
+            return self._db_lock()
+        ttl = max(60, int(settings.retention_interval_seconds))
+        try:
+            if redis_client.set(LOCK_KEY, WORKER_ID, nx=True, ex=ttl):
+                return True
+            if redis_client.get(LOCK_KEY) == WORKER_ID:
+                redis_client.expire(LOCK_KEY, ttl)
+                return True
+        except Exception as e:
+            print(f"Retention lock error: {e}")
+        return False
+
+    def _db_lock(self) -> bool:
+        """Session-level Postgres advisory lock, held on its own connection until _unlock"""
+        if self._lock_conn is not None:
+            return True
+        if engine.dialect.name != "postgresql":
+            # SQLite is single-process development only
+            return True
+        try:
+            conn = engine.connect()
+        except Exception as e:
+            print(f"Retention lock error: {e}")
+            return False
+        try:
+            locked = conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": ADVISORY_LOCK_ID}).scalar()
+            # The lock outlives the transaction; don't sit idle in one
+            conn.commit()
+        except Exception as e:
+            print(f"Retention lock error: {e}")
+            locked = False
+        if locked:
+            self._lock_conn = conn
+        else:
+            conn.close()
+        return bool(locked)
+
+    def _unlock(self) -> None:
+        redis_client = get_redis_client()
+        if redis_client:
+            try:
+                if redis_client.get(LOCK_KEY) == WORKER_ID:
+                    redis_client.delete(LOCK_KEY)
+            except Exception:
+                pass
+        conn, self._lock_conn = self._lock_conn, None
+        if conn is not None:
+            try:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": ADVISORY_LOCK_ID})
+                conn.commit()
+                conn.close()
+            except Exception:
+                # Never hand a pooled connection back still holding the lock
+                conn.invalidate()
+
+    async def _throttle(self) -> None:
+        await asyncio.sleep(settings.retention_batch_pause_seconds)
+        # Deletes replicate too: give lagging replicas time to catch up
+        while replica_router.replicas and not replica_router.usable():
+            await asyncio.sleep(settings.replica_check_interval_seconds)
+
+    async def run_once(self) -> None:
+        """Purge every room with a retention policy"""
+        if not await asyncio.to_thread(self._lock):
+            return
+        self.running = True
+        self.started_at, self.finished_at = time.monotonic(), None
+        self.rooms_done = self.batches = self.deleted = self.tombstoned = 0
+        self.last_error = None
+        try:
+            policies = await asyncio.to_thread(_load_policies)
+            self.rooms_total = len(policies)
+            for room_id, days in policies:
+                self.room_id = room_id
+                through_id = None
+                while True:
+                    result = await asyncio.to_thread(purge_room_step, room_id, days, settings.retention_batch_size)
+                    if result is None:
+                        break
+                    _, through_id, deleted, tombstoned = result
+                    self.batches += 1
+                    self.deleted += deleted
+                    self.tombstoned += tombstoned
+                    retention_purged_total.inc(deleted, action="deleted")
+                    retention_purged_total.inc(tombstoned, action="tombstoned")
+                    if not await asyncio.to_thread(self._lock):
+                        return
+                    await self._throttle()
+                if through_id is not None:
+                    # Open clients drop their copies of the purged history
+                    await manager.broadcast_to_room(
+                        {"type": "history_purged", "room_id": room_id, "through_id": through_id}, room_id
+                    )
+                self.rooms_done += 1
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"Retention run failed: {e}")
+        finally:
+            self.running = False
+            self.room_id = None
+            self.finished_at = time.monotonic()
+            await asyncio.to_thread(self._unlock)
+
+    def trigger(self) -> bool:
+        """Start a run now; False if one is already running on this worker"""
+        if self.running or (self._run is not None and not self._run.done()):
+            return False
+        self._run = asyncio.create_task(self.run_once())
+        return True
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(settings.retention_interval_seconds)
+            if self.trigger():
+                await self._run
+
+    def start(self) -> None:
+        if self._task is None and settings.retention_interval_seconds > 0:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        for task in (self._task, self._run):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._run = None
+
+
+# Global retention job instance
+retention_job = RetentionJob()
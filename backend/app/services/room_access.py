@@ -0,0 +1,201 @@
+"""
+Private room access
+Public rooms are open to everyone; a private room admits the users listed
+in room_members. Each worker caches room_id -> member ids (None for a
+public room), loaded with one query the first time a room is checked, so
+the checks on the send path, history reads and mention delivery are a
+dict and a set lookup.
+
+Joins and leaves update this worker's copy and are published on a Redis
+channel; other workers apply them to their copies and, for a removal,
+close the member's sockets in that room. Entries are reloaded after
+room_acl_ttl_seconds, and the whole cache is dropped whenever the
+subscription is (re)established, which covers changes published while a
+worker wasn't listening. Without Redis, other workers see a change within
+the TTL.
+"""
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.config import WORKER_ID, settings
+from app.core.metrics import Counter
+from app.core.redis import get_redis_client, report_redis_failure
+from app.core.serialization import dumps_text, loads
+from app.db.session import SessionLocal
+from app.models.room import Room
+from app.models.room_member import RoomMember
+
+CHANNEL = "rooms:acl"
+SEPARATOR = "\n"
+
+room_acl_lookups_total = Counter("room_acl_lookups_total", "Room membership lookups by cache outcome", ("result",))
+
+# Member ids of a private room, None for a public room
+Members = Optional[Set[int]]
+
+
+def load_members(db: Session, room_id: int) -> Tuple[bool, Members]:
+    """(whether the room exists, its members)"""
+    is_public = db.query(Room.is_public).filter(Room.id == room_id).scalar()
+    if is_public is None:
+        return False, set()
+    if is_public:
+        return True, None
+    return True, {user_id for (user_id,) in db.query(RoomMember.user_id).filter(RoomMember.room_id == room_id)}
+
+
+def _load_members(room_id: int) -> Tuple[bool, Members]:
+    db = SessionLocal()
+    try:
+        return load_members(db, room_id)
+    finally:
+        db.close()
+
+
+class RoomAccess:
+    """Per-worker room membership cache, kept in sync through Redis"""
+
+    def __init__(self):
+        # room_id -> (members, loaded_at)
+        self._rooms: Dict[int, Tuple[Members, float]] = {}
+        self._removed_handlers: List[Callable[[int, str], Awaitable[None]]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def on_member_removed(self, handler: Callable[[int, str], Awaitable[None]]) -> None:
+        """Call handler(room_id, username) on every worker when someone is removed from a private room"""
+        self._removed_handlers.append(handler)
+
+    # Checks
+
+    def _cached(self, room_id: int) -> Optional[Tuple[Members, float]]:
+        entry = self._rooms.get(room_id)
+        if entry is not None and time.monotonic() - entry[1] <= settings.room_acl_ttl_seconds:
+            room_acl_lookups_total.inc(result="hit")
+            return entry
+        room_acl_lookups_total.inc(result="miss")
+        return None
+
+    def _store(self, room_id: int, found: bool, members: Members) -> Members:
+        # Unknown rooms aren't cached: the id may be created later
+        if found:
+            if len(self._rooms) >= settings.room_acl_cache_size:
+                self._rooms.clear()
+            self._rooms[room_id] = (members, time.monotonic())
+        return members
+
+    def members(self, db: Session, room_id: int) -> Members:
+        entry = self._cached(room_id)
+        if entry is not None:
+            return entry[0]
+        return self._store(room_id, *load_members(db, room_id))
+
+    async def members_async(self, room_id: int) -> Members:
+        """Like members(), loading in a thread with its own session (background jobs)"""
+        entry = self._cached(room_id)
+        if entry is not None:
+            return entry[0]
+        return self._store(room_id, *await asyncio.to_thread(_load_members, room_id))
+
+    def allowed(self, db: Session, room_id: int, user_id: int) -> bool:
+        members = self.members(db, room_id)
+        return members is None or user_id in members
+
+    def can_access(self, db: Session, room: Room, user_id: Optional[int]) -> bool:
+        """For handlers that already loaded the room (anonymous callers only get public rooms)"""
+        if room.is_public:
+            return True
+        return user_id is not None and user_id in self.members(db, room.id)
+
+    # Changes (after the room_members row is committed)
+
+    def _apply(self, room_id: int, user_id: int, member: bool) -> None:
+        entry = self._rooms.get(room_id)
+        if entry is not None and entry[0] is not None:
+            if member:
+                entry[0].add(user_id)
+            else:
+                entry[0].discard(user_id)
+
+    def _publish(self, room_id: int, user_id: int, username: str, member: bool) -> None:
+        redis_client = get_redis_client()
+        if not redis_client:
+            return
+        change = {"room_id": room_id, "user_id": user_id, "username": username, "member": member}
+        try:
+            redis_client.publish(CHANNEL, f"{WORKER_ID}{SEPARATOR}{dumps_text(change)}")
+        except Exception as e:
+            print(f"Room ACL publish error: {e}")
+            report_redis_failure()
+
+    def member_added(self, room_id: int, user_id: int, username: str) -> None:
+        self._apply(room_id, user_id, True)
+        self._publish(room_id, user_id, username, True)
+
+    async def member_removed(self, room_id: int, user_id: int, username: str) -> None:
+        self._apply(room_id, user_id, False)
+        self._publish(room_id, user_id, username, False)
+        await self._member_removed(room_id, username)
+
+    async def _member_removed(self, room_id: int, username: str) -> None:
+        for handler in self._removed_handlers:
+            try:
+                await handler(room_id, username)
+            except Exception as e:
+                print(f"Room ACL handler error: {e}")
+
+    async def _listen(self) -> None:
+        import redis.asyncio as aioredis
+
+        while True:
+            if get_redis_client() is None:
+                await asyncio.sleep(settings.health_check_interval_seconds)
+                continue
+            client = aioredis.from_url(settings.redis_url, decode_responses=True)
+            pubsub = client.pubsub()
+            try:
+                await pubsub.subscribe(CHANNEL)
+                # Changes published while we weren't subscribed are lost: reload everything
+                self._rooms.clear()
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is None or message["type"] != "message":
+                        continue
+                    origin, _, payload = message["data"].partition(SEPARATOR)
+                    if origin == WORKER_ID:
+                        continue
+                    change = loads(payload)
+                    self._apply(change["room_id"], change["user_id"], change["member"])
+                    if not change["member"]:
+                        await self._member_removed(change["room_id"], change["username"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Room ACL listener error, resubscribing: {e}")
+                report_redis_failure()
+                await asyncio.sleep(1.0)
+            finally:
+                try:
+                    await pubsub.aclose()
+                    await client.aclose()
+                except Exception:
+                    pass
+
+    def start(self) -> None:
+        if self._task is None and settings.redis_url:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Global room access instance
+room_access = RoomAccess()
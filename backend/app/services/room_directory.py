@@ -0,0 +1,171 @@
+"""
+Room directory cache
+Keeps the public room list in memory with a version number, serves it with
+precomputed response bytes, and merges in live occupancy that is aggregated
+across workers through Redis and refreshed in the background. Each worker
+rewrites its whole count map on every refresh, so it never expires while
+the worker is alive.
+
+ETags are a hash of the page bytes: the version counters are per worker,
+so they can't tell whether two workers serve the same body.
+"""
+import asyncio
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session, joinedload
+
+from app.core.config import WORKER_ID, settings
+from app.models.room import Room
+from app.schemas.room import RoomResponse
+from app.core.redis import get_redis_client
+from app.core.serialization import dumps
+from app.websocket.manager import manager
+
+WORKERS_KEY = "occupancy:workers"
+VERSION_KEY = "rooms:directory_version"
+
+
+class RoomDirectory:
+    """Versioned in-memory copy of the public room list"""
+
+    def __init__(self):
+        self.version = 0
+        self.rooms: Optional[List[dict]] = None
+        # Aggregated occupancy across workers, room_id -> sockets
+        self.occupancy: Dict[int, int] = {}
+        self.occupancy_version = 0
+        self._remote_version: Optional[int] = None
+        # (skip, limit) -> (response bytes, etag) for the current versions
+        self._pages: Dict[Tuple[int, int], Tuple[bytes, str]] = {}
+        self._pages_version: Optional[Tuple[int, int]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def invalidate(self) -> None:
+        """Drop the cached list (called after create_room) and tell other workers"""
+        self.version += 1
+        self.rooms = None
+        self._pages.clear()
+        redis_client = get_redis_client()
+        if redis_client:
+            try:
+                self._remote_version = redis_client.incr(VERSION_KEY)
+            except Exception as e:
+                print(f"Room directory invalidation publish error: {e}")
+
+    def load(self, db: Session) -> List[dict]:
+        if self.rooms is None:
+            rooms = (
+                db.query(Room)
+                .options(joinedload(Room.creator))
+                .filter(Room.is_public == True)
+                .order_by(Room.id)
+                .all()
+            )
+            self.rooms = [RoomResponse.model_validate(room).model_dump(mode="json") for room in rooms]
+        return self.rooms
+
+    def render(self, db: Session, skip: int, limit: int) -> Tuple[bytes, str]:
+        """Serialized page and its etag, built at most once per version"""
+        version = (self.version, self.occupancy_version)
+        if self._pages_version != version:
+            self._pages.clear()
+            self._pages_version = version
+        key = (skip, limit)
+        if key not in self._pages:
+            if len(self._pages) >= 32:
+                self._pages.clear()
+            page = self.load(db)[skip:skip + limit]
+            body = dumps([dict(room, occupancy=self.occupancy.get(room["id"], 0)) for room in page])
+            self._pages[key] = (body, f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"')
+        return self._pages[key]
+
+    # Occupancy
+
+    def _set_occupancy(self, occupancy: Dict[int, int]) -> None:
+        if occupancy != self.occupancy:
+            self.occupancy = occupancy
+            self.occupancy_version += 1
+
+    def _sync_redis(self, local: Dict[int, int]) -> Tuple[Dict[int, int], Optional[int]]:
+        """Publish this worker's counts and read every worker's (runs in a thread)"""
+        redis_client = get_redis_client()
+        key = f"occupancy:{WORKER_ID}"
+        ttl = max(1, int(settings.room_occupancy_refresh_seconds * 3))
+        # Replace the whole map (MULTI/EXEC: readers never see it half written)
+        pipe = redis_client.pipeline()
+        pipe.delete(key)
+        if local:
+            pipe.hset(key, mapping=local)
+            pipe.expire(key, ttl)
+        pipe.sadd(WORKERS_KEY, WORKER_ID)
+        pipe.smembers(WORKERS_KEY)
+        pipe.get(VERSION_KEY)
+        results = pipe.execute()
+        workers, remote_version = results[-2], results[-1]
+
+        workers = list(workers)
+        totals: Dict[int, int] = {}
+        pipe = redis_client.pipeline()
+        for worker in workers:
+            pipe.hgetall(f"occupancy:{worker}")
+        for worker, counts in zip(workers, pipe.execute()):
+            if not counts:
+                # Hash expired: that worker is gone
+                redis_client.srem(WORKERS_KEY, worker)
+                continue
+            for room_id, count in counts.items():
+                totals[int(room_id)] = totals.get(int(room_id), 0) + int(count)
+        return totals, int(remote_version) if remote_version is not None else None
+
+    async def refresh(self) -> None:
+        """Publish local connection counts, then merge other workers"""
+        local = {
+            room_id: manager.get_room_connection_count(room_id)
+            for room_id in manager.active_connections
+            if room_id != 0
+        }
+
+        if get_redis_client():
+            try:
+                totals, remote_version = await asyncio.to_thread(self._sync_redis, local)
+                if remote_version is not None and remote_version != self._remote_version:
+                    if self._remote_version is not None:
+                        # Another worker created a room
+                        self.version += 1
+                        self.rooms = None
+                    self._remote_version = remote_version
+                self._set_occupancy(totals)
+                return
+            except Exception as e:
+                print(f"Room occupancy sync error: {e}")
+        self._set_occupancy(local)
+
+    async def _run(self) -> None:
+        while True:
+            await self.refresh()
+            await asyncio.sleep(settings.room_occupancy_refresh_seconds)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+# Global room directory instance
+room_directory = RoomDirectory()
@@ -0,0 +1,69 @@
+"""
+Threads
+Every reply stores the root of its chain in `thread_root_id`, set at insert
+time from the parent, so a whole thread is one indexed range scan on
+(thread_root_id, id) instead of walking `reply_to_id` one load at a time.
+Roots keep a `reply_count` that is bumped in the same transaction as the
+insert.
+"""
+from typing import List, Optional, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.models.message import Message
+
+
+def resolve_thread_root(db: Session, parent: Message) -> int:
+    """Root message id for a new reply to `parent`"""
+    if parent.reply_to_id is None:
+        return parent.id
+    if parent.thread_root_id is not None:
+        return parent.thread_root_id
+    # Reply written before thread roots existed and not backfilled yet: walk the chain
+    message_id, reply_to_id = parent.id, parent.reply_to_id
+    while reply_to_id is not None:
+        row = db.query(Message.id, Message.reply_to_id, Message.thread_root_id).filter(
+            Message.id == reply_to_id
+        ).first()
+        if row is None:
+            break
+        if row.thread_root_id is not None:
+            return row.thread_root_id
+        message_id, reply_to_id = row.id, row.reply_to_id
+    return message_id
+
+
+def attach_reply(db: Session, message: Message, parent: Message) -> None:
+    """Link a pending reply to its thread and count it on the root (caller commits)"""
+    message.reply_to_id = parent.id
+    message.thread_root_id = resolve_thread_root(db, parent)
+    db.execute(
+        update(Message)
+        .where(Message.id == message.thread_root_id)
+        .values(reply_count=Message.reply_count + 1)
+    )
+
+
+def get_thread_root(db: Session, message_id: int) -> Optional[Message]:
+    """The root of the thread a message belongs to (the message itself for roots)"""
+    message = db.query(Message).filter(Message.id == message_id).first()
+    if message is None or message.reply_to_id is None:
+        return message
+    root_id = resolve_thread_root(db, message)
+    return db.query(Message).filter(Message.id == root_id).first()
+
+
+def get_thread_page(db: Session, root_id: int, after_id: int, limit: int) -> Tuple[List[Message], Optional[int]]:
+    """One keyset page of replies in id order, and the cursor for the next page"""
+    replies = (
+        db.query(Message)
+        .filter(Message.thread_root_id == root_id, Message.id > after_id)
+        .order_by(Message.id)
+        .limit(limit + 1)
+        .all()
+    )
+    if len(replies) > limit:
+        replies = replies[:limit]
+        return replies, replies[-1].id
+    return replies, None
@@ -0,0 +1,185 @@
+"""
+Connection admission control
+Every new socket passes through here before it is accepted into a room:
+
+- Load shedding: while the event loop lags (smoothed drift over
+  ws_shed_loop_lag_ms) or resident memory is over ws_shed_memory_mb, new
+  sockets are turned away; existing ones are left alone.
+- Caps: sockets per worker, per user (on this worker) and per room
+  (room.max_connections, or ws_max_connections_per_room; counted across
+  workers when occupancy is known).
+- Queued admission: handshakes (room lookup, accept, initial frames) run at
+  most ws_admission_concurrency at a time, so a connect storm queues
+  instead of piling onto the database. The queue is bounded in length and
+  wait time.
+
+A rejected socket is accepted just long enough to receive a reconnect frame
+with a jittered delay_ms (the same frame a drain sends) and is closed with
+1013 Try Again Later and the reason.
+"""
+import asyncio
+import os
+import random
+import time
+from typing import Dict, Optional
+
+from fastapi import WebSocket, status
+
+from app.core.config import settings
+from app.core.diagnostics import loop_monitor
+from app.core.metrics import Counter, Gauge, Histogram
+from app.core.serialization import dumps_text
+from app.models.room import Room
+from app.services.room_directory import room_directory
+from app.websocket.manager import manager
+
+ws_admission_rejected_total = Counter(
+    "ws_admission_rejected_total", "Sockets turned away by admission control", ("reason",)
+)
+ws_admission_wait_seconds = Histogram(
+    "ws_admission_wait_seconds", "Time a new socket waited for a handshake slot",
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+
+
+def resident_memory_mb() -> float:
+    """Current resident set size of this process"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        # Not Linux: peak RSS is the best available (KiB on Linux, bytes on macOS)
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if peak > 1 << 32 else peak / 1024
+
+
+class AdmissionController:
+    def __init__(self):
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.admitting = 0
+        self.waiting = 0
+        # Per-user sockets between admit() and done(), so concurrent handshakes count toward the cap
+        self.in_flight: Dict[str, int] = {}
+        self.shedding = False
+        self._memory_mb = 0.0
+        self._memory_checked_at = 0.0
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(max(1, settings.ws_admission_concurrency))
+        return self._slots
+
+    def memory_mb(self) -> float:
+        # Re-read at most once a second; a storm would otherwise read it per socket
+        now = time.monotonic()
+        if now - self._memory_checked_at >= 1.0:
+            self._memory_mb = resident_memory_mb()
+            self._memory_checked_at = now
+        return self._memory_mb
+
+    def overload(self) -> Optional[str]:
+        """Why this worker should shed new sockets right now, if it should"""
+        reason = None
+        if settings.ws_shed_loop_lag_ms and loop_monitor.recent_lag * 1000 > settings.ws_shed_loop_lag_ms:
+            reason = "loop lag"
+        elif settings.ws_shed_memory_mb and self.memory_mb() > settings.ws_shed_memory_mb:
+            reason = "memory"
+        if (reason is not None) != self.shedding:
+            self.shedding = reason is not None
+            print(f"Admission: {'shedding new sockets (' + reason + ')' if reason else 'stopped shedding'}")
+        return reason
+
+    def check(self, username: str) -> Optional[str]:
+        """Reason to turn the socket away before it queues, or None"""
+        overload = self.overload()
+        if overload is not None:
+            return f"overloaded ({overload})"
+        limit = settings.ws_max_connections_per_worker
+        if limit and len(manager.websocket_rooms) + self.admitting + self.waiting >= limit:
+            return "worker full"
+        limit = settings.ws_max_connections_per_user
+        if limit and len(manager.user_connections.get(username, ())) + self.in_flight.get(username, 0) >= limit:
+            return "too many connections"
+        return None
+
+    def check_room(self, room: Room) -> Optional[str]:
+        limit = room.max_connections or settings.ws_max_connections_per_room
+        if not limit:
+            return None
+        sockets = max(manager.get_room_connection_count(room.id), room_directory.occupancy.get(room.id, 0))
+        return "room full" if sockets >= limit else None
+
+    async def admit(self, websocket: WebSocket, username: str) -> bool:
+        """
+        Check the caps and wait for a handshake slot. On False the socket has
+        already been rejected; on True the caller must call done() once the
+        socket is connected (or has failed).
+        """
+        reason = self.check(username)
+        if reason is None and self.waiting >= settings.ws_admission_queue_size:
+            reason = "busy"
+        if reason is not None:
+            await self.reject(websocket, reason)
+            return False
+
+        started = time.monotonic()
+        self.waiting += 1
+        self.in_flight[username] = self.in_flight.get(username, 0) + 1
+        try:
+            await asyncio.wait_for(self._semaphore().acquire(), timeout=settings.ws_admission_timeout_seconds)
+        except asyncio.TimeoutError:
+            self._release_user(username)
+            await self.reject(websocket, "busy")
+            return False
+        except BaseException:
+            self._release_user(username)
+            raise
+        finally:
+            self.waiting -= 1
+        self.admitting += 1
+        ws_admission_wait_seconds.observe(time.monotonic() - started)
+        return True
+
+    def done(self, username: str) -> None:
+        self.admitting -= 1
+        self._release_user(username)
+        self._semaphore().release()
+
+    def _release_user(self, username: str) -> None:
+        count = self.in_flight.get(username, 0) - 1
+        if count > 0:
+            self.in_flight[username] = count
+        else:
+            self.in_flight.pop(username, None)
+
+    async def reject(self, websocket: WebSocket, reason: str) -> None:
+        """Turn a socket away with a jittered retry hint"""
+        ws_admission_rejected_total.inc(reason=reason.split(" (")[0])
+        retry = settings.ws_admission_retry_seconds
+        await websocket.accept()
+        try:
+            await websocket.send_text(dumps_text({
+                "type": "reconnect",
+                "delay_ms": int(random.uniform(retry, retry * 3) * 1000),
+                "reason": reason,
+            }))
+        finally:
+            await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason=reason)
+
+    def report(self) -> dict:
+        return {
+            "connections": len(manager.websocket_rooms),
+            "admitting": self.admitting,
+            "waiting": self.waiting,
+            "shedding": self.shedding,
+            "loop_lag_ms": round(loop_monitor.recent_lag * 1000, 1),
+            "memory_mb": round(self.memory_mb(), 1),
+        }
+
+
+# Global admission controller instance
+admission = AdmissionController()
+
+Gauge("ws_admission_waiting", "Sockets queued for a handshake slot", callback=lambda: {(): admission.waiting})
+Gauge("ws_admission_shedding", "1 while this worker sheds new sockets", callback=lambda: {(): int(admission.shedding)})
@@ -0,0 +1,181 @@
+"""
+Room affinity
+Maps each room to one worker with a consistent-hash ring (many virtual
+nodes per worker), so all sockets of a room can live on the same process
+and broadcasts stay local instead of going through the relay. A worker
+joining or leaving only moves the rooms on its arcs (about 1/N of them).
+
+Members come from settings.ws_affinity_workers ("id=ws://host:port,...")
+or, when that is empty, from a Redis sorted set each worker heartbeats
+into. Clients ask the system socket for a room's endpoint; a room socket
+that lands on the wrong worker is still served (the relay keeps it in
+sync) and gets the right endpoint as a hint. When the ring changes, sockets
+in rooms that moved are told to reconnect to the new owner after a
+jittered delay.
+"""
+import asyncio
+import bisect
+import hashlib
+import random
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.core.config import WORKER_ID, settings
+from app.core.metrics import Counter, Gauge
+from app.core.redis import get_redis_client, report_redis_failure
+from app.websocket.manager import manager
+
+MEMBERS_KEY = "ws:workers"
+ENDPOINTS_KEY = "ws:endpoints"
+
+ws_misrouted_connections_total = Counter(
+    "ws_misrouted_connections_total", "Room sockets opened on a worker that doesn't own the room"
+)
+ws_rebalanced_connections_total = Counter(
+    "ws_rebalanced_connections_total", "Sockets told to move after a ring change"
+)
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent-hash ring of worker ids with virtual nodes"""
+
+    def __init__(self, nodes: Iterable[str], vnodes: int = 128):
+        self.nodes = sorted(set(nodes))
+        points: List[Tuple[int, str]] = sorted(
+            (_hash(f"{node}#{index}"), node) for node in self.nodes for index in range(vnodes)
+        )
+        self._hashes = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def owner(self, key: str) -> Optional[str]:
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._owners[index]
+
+
+def parse_workers(value: str) -> Dict[str, str]:
+    """Parse "id=ws://host:port,id2=ws://host2:port" into {worker id: endpoint}"""
+    workers = {}
+    for item in value.split(","):
+        worker_id, _, endpoint = item.strip().partition("=")
+        if worker_id and endpoint:
+            workers[worker_id.strip()] = endpoint.strip()
+    return workers
+
+
+class RoomAffinity:
+    def __init__(self):
+        # worker id -> public WebSocket endpoint
+        self.members: Dict[str, str] = {}
+        self.ring = HashRing([])
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(settings.ws_public_url or settings.ws_affinity_workers)
+
+    def owner(self, room_id: int) -> Optional[str]:
+        return self.ring.owner(f"room:{room_id}")
+
+    def is_local(self, room_id: int) -> bool:
+        owner = self.owner(room_id)
+        return owner is None or owner == WORKER_ID
+
+    def route(self, room_id: int) -> dict:
+        """room_route frame for a room (endpoint None means "any worker")"""
+        owner = self.owner(room_id)
+        return {
+            "type": "room_route",
+            "room_id": room_id,
+            "worker_id": owner,
+            "endpoint": self.members.get(owner) if owner else None,
+        }
+
+    def _heartbeat_redis(self) -> Dict[str, str]:
+        """Announce this worker and read the live members (runs in a thread)"""
+        redis_client = get_redis_client()
+        now = time.time()
+        pipe = redis_client.pipeline()
+        if settings.ws_public_url:
+            pipe.zadd(MEMBERS_KEY, {WORKER_ID: now})
+            pipe.hset(ENDPOINTS_KEY, WORKER_ID, settings.ws_public_url)
+        pipe.zremrangebyscore(MEMBERS_KEY, 0, now - settings.ws_affinity_member_ttl_seconds)
+        pipe.zrange(MEMBERS_KEY, 0, -1)
+        pipe.hgetall(ENDPOINTS_KEY)
+        results = pipe.execute()
+        live, endpoints = results[-2], results[-1]
+        return {worker_id: endpoints[worker_id] for worker_id in live if worker_id in endpoints}
+
+    async def refresh(self) -> None:
+        if settings.ws_affinity_workers:
+            members = parse_workers(settings.ws_affinity_workers)
+        elif get_redis_client():
+            try:
+                members = await asyncio.to_thread(self._heartbeat_redis)
+            except Exception as e:
+                print(f"Room affinity membership error: {e}")
+                report_redis_failure()
+                return
+        else:
+            members = {WORKER_ID: settings.ws_public_url}
+        if members != self.members:
+            previous = self.members
+            self.members = members
+            self.ring = HashRing(members, settings.ws_affinity_vnodes)
+            if previous:
+                print(f"Room affinity ring changed: {sorted(previous)} -> {sorted(members)}")
+                await self._rebalance()
+
+    async def _rebalance(self) -> None:
+        """Point sockets in rooms this worker no longer owns at the new owner, spread over a window"""
+        window = settings.ws_affinity_rebalance_window_seconds
+        for room_id in list(manager.active_connections):
+            if room_id == 0 or self.is_local(room_id):
+                continue
+            frame = self.route(room_id)
+            if not frame["endpoint"]:
+                continue
+            for websocket in list(manager.active_connections.get(room_id, ())):
+                ws_rebalanced_connections_total.inc()
+                await manager.send_personal_message(
+                    dict(frame, delay_ms=int(random.uniform(0, window) * 1000)), websocket
+                )
+
+    def _leave(self) -> None:
+        redis_client = get_redis_client()
+        if redis_client and settings.ws_public_url and not settings.ws_affinity_workers:
+            try:
+                redis_client.zrem(MEMBERS_KEY, WORKER_ID)
+            except Exception:
+                pass
+
+    async def _run(self) -> None:
+        while True:
+            await self.refresh()
+            await asyncio.sleep(settings.ws_affinity_refresh_seconds)
+
+    def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            # Leave the ring right away instead of waiting for the TTL
+            await asyncio.to_thread(self._leave)
+
+
+# Global room affinity instance
+room_affinity = RoomAffinity()
+
+Gauge("ws_affinity_workers", "Workers in the room affinity ring", callback=lambda: {(): len(room_affinity.members)})
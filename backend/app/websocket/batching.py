@@ -0,0 +1,114 @@
+"""
+Outbound frame batching
+Clients that connect with ?batch=1 get their outbound frames coalesced:
+whatever the server sends a batched socket (messages, typing, joins and
+leaves, personal frames) is queued, and every ws_batch_window_ms one
+flusher task sends each socket its queue as a single frame
+
+    {"type": "batch", "frames": [<frame>, <frame>, ...]}
+
+built by joining the already encoded frames, so nothing is re-encoded. A
+socket with a single queued frame gets that frame unwrapped. One task
+flushes every socket in order, so frames never overtake each other.
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from fastapi import WebSocket
+
+from app.core.config import settings
+from app.core.metrics import Counter, Histogram
+
+ws_batched_frames_total = Counter("ws_batched_frames_total", "Frames queued on batched sockets")
+ws_batch_sends_total = Counter("ws_batch_sends_total", "WebSocket sends made by the batch flusher")
+ws_batch_size = Histogram(
+    "ws_batch_size", "Frames per batched send",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+
+BATCH_PREFIX = '{"type":"batch","frames":['
+BATCH_SUFFIX = "]}"
+
+
+def encode_batch(payloads: List[str]) -> str:
+    if len(payloads) == 1:
+        return payloads[0]
+    return BATCH_PREFIX + ",".join(payloads) + BATCH_SUFFIX
+
+
+class FrameBatcher:
+    def __init__(self, send_failed: Callable[[WebSocket], Awaitable[None]]):
+        # Called for a socket whose batched send failed
+        self.send_failed = send_failed
+        # Batched socket -> encoded frames waiting for the next flush
+        self.pending: Dict[WebSocket, List[str]] = {}
+        self._dirty: Set[WebSocket] = set()
+        self._flusher: Optional[asyncio.Task] = None
+
+    def enable(self, websocket: WebSocket) -> None:
+        self.pending.setdefault(websocket, [])
+
+    def discard(self, websocket: WebSocket) -> None:
+        self.pending.pop(websocket, None)
+        self._dirty.discard(websocket)
+
+    def take(self, websocket: WebSocket) -> List[str]:
+        """Remove and return a socket's queued frames (to send them before a close)"""
+        self._dirty.discard(websocket)
+        queued = self.pending.get(websocket)
+        if not queued:
+            return []
+        self.pending[websocket] = []
+        return queued
+
+    def queue(self, websocket: WebSocket, payload: str) -> bool:
+        """Queue a frame for a batched socket; False if the socket sends directly"""
+        queued = self.pending.get(websocket)
+        if queued is None:
+            return False
+        queued.append(payload)
+        if len(queued) == 1:
+            # First frame since the last flush
+            self._dirty.add(websocket)
+            if self._flusher is None:
+                self._flusher = asyncio.create_task(self._flush_loop())
+        return True
+
+    async def _flush_loop(self) -> None:
+        try:
+            while self._dirty:
+                await asyncio.sleep(settings.ws_batch_window_ms / 1000)
+                await self._flush()
+        finally:
+            self._flusher = None
+
+    async def _flush(self) -> None:
+        limit = max(1, settings.ws_batch_max_frames)
+        dirty, self._dirty = self._dirty, set()
+        failed = []
+        for websocket in dirty:
+            queued = self.pending.get(websocket)
+            if not queued:
+                continue
+            self.pending[websocket] = []
+            ws_batched_frames_total.inc(len(queued))
+            try:
+                for index in range(0, len(queued), limit):
+                    chunk = queued[index:index + limit]
+                    ws_batch_size.observe(len(chunk))
+                    ws_batch_sends_total.inc()
+                    await websocket.send_text(encode_batch(chunk))
+            except Exception:
+                failed.append(websocket)
+        for websocket in failed:
+            await self.send_failed(websocket)
+
+    async def stop(self) -> None:
+        flusher = self._flusher
+        if flusher is not None:
+            flusher.cancel()
+            try:
+                await flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
@@ -0,0 +1,159 @@
+"""
+Graceful drain
+Before a worker restarts it stops accepting sockets, tells each client to
+reconnect after a jittered delay (with a cursor to resume history from) and
+closes connections in waves once in-flight message writes have finished,
+so clients don't all reconnect at the same instant.
+"""
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Iterable, Optional
+
+from fastapi import WebSocket, status
+
+from app.core.config import settings
+from app.core.metrics import Counter, Gauge
+from app.core.serialization import dumps_text
+from app.db.session import SessionLocal
+from app.models.room import Room
+from app.services.read_markers import read_markers
+from app.websocket.affinity import room_affinity
+from app.websocket.manager import manager
+
+ws_drained_connections_total = Counter("ws_drained_connections_total", "Sockets closed by a drain")
+
+
+def _load_heads(room_ids: Iterable[int]) -> Dict[int, int]:
+    """Committed head sequence per room (runs in a thread)"""
+    db = SessionLocal()
+    try:
+        return dict(db.query(Room.id, Room.message_seq).filter(Room.id.in_(list(room_ids))))
+    finally:
+        db.close()
+
+
+class DrainController:
+    def __init__(self):
+        self.draining = False
+        self.started_at: Optional[float] = None
+        self.closed = 0
+        self.total = 0
+        self._inflight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._task: Optional[asyncio.Task] = None
+
+    @asynccontextmanager
+    async def inflight(self):
+        """Wrap message persistence so a drain waits for it before closing sockets"""
+        self._inflight += 1
+        self._idle.clear()
+        try:
+            yield
+        finally:
+            self._inflight -= 1
+            if self._inflight == 0:
+                self._idle.set()
+
+    def reconnect_frame(self, websocket: WebSocket, window: float, heads: Dict[int, int]) -> dict:
+        """Reconnect instruction with a jittered delay spread over the drain window"""
+        room_id = manager.websocket_rooms.get(websocket)
+        frame = {
+            "type": "reconnect",
+            "delay_ms": int((settings.drain_reconnect_min_delay_seconds + random.uniform(0, window)) * 1000),
+        }
+        if room_id:
+            # Clients fetch history with after_seq=<last_seq> to catch up
+            frame["resume"] = {"room_id": room_id, "last_seq": heads.get(room_id)}
+        return frame
+
+    async def reject(self, websocket: WebSocket) -> None:
+        """Turn away a socket that arrives while draining"""
+        await websocket.accept()
+        try:
+            await websocket.send_text(dumps_text({
+                "type": "reconnect",
+                "delay_ms": int(random.uniform(
+                    settings.drain_reconnect_min_delay_seconds, settings.drain_reconnect_window_seconds
+                ) * 1000),
+            }))
+        finally:
+            await websocket.close(code=status.WS_1012_SERVICE_RESTART, reason="draining")
+
+    async def _close_wave(self, wave) -> None:
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=settings.drain_inflight_timeout_seconds)
+        except asyncio.TimeoutError:
+            print(f"Drain: closing with {self._inflight} message writes still in flight")
+        for websocket in wave:
+            if websocket not in manager.websocket_rooms:
+                continue
+            # Batched sockets still hold their reconnect frame
+            await manager.flush(websocket)
+            await manager.disconnect(websocket)
+            try:
+                await asyncio.wait_for(
+                    websocket.close(code=status.WS_1012_SERVICE_RESTART, reason="draining"), timeout=1.0
+                )
+            except Exception:
+                pass
+            self.closed += 1
+            ws_drained_connections_total.inc()
+
+    async def _drain(self) -> None:
+        # Leave the affinity ring first so reconnecting clients are routed elsewhere
+        await room_affinity.stop()
+        sockets = list(manager.websocket_rooms)
+        random.shuffle(sockets)
+        self.total = len(sockets)
+        window = settings.drain_reconnect_window_seconds
+
+        # Resume cursors for every room in one query (the head cache only knows recently active rooms)
+        room_ids = {manager.websocket_rooms.get(websocket) for websocket in sockets} - {None, 0}
+        try:
+            heads = await asyncio.to_thread(_load_heads, room_ids) if room_ids else {}
+        except Exception as e:
+            print(f"Drain: room heads not loaded, using cached ones: {e}")
+            heads = {room_id: head[0] for room_id, head in read_markers.heads.items()}
+
+        # Everyone learns about the restart up front, each with their own delay
+        for websocket in sockets:
+            await manager.send_personal_message(self.reconnect_frame(websocket, window, heads), websocket)
+
+        wave_size = max(1, settings.drain_wave_size)
+        for index in range(0, len(sockets), wave_size):
+            if index:
+                await asyncio.sleep(settings.drain_wave_interval_seconds)
+            await self._close_wave(sockets[index:index + wave_size])
+        print(f"Drain complete: closed {self.closed} of {self.total} sockets")
+
+    def start(self) -> None:
+        """Enter drain mode (idempotent)"""
+        if self.draining:
+            return
+        self.draining = True
+        self.started_at = time.time()
+        print("Drain started: refusing new sockets")
+        self._task = asyncio.create_task(self._drain())
+
+    async def wait(self, timeout: Optional[float] = None) -> None:
+        if self._task is not None:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout=timeout)
+
+    def report(self) -> dict:
+        return {
+            "draining": self.draining,
+            "started_at": self.started_at,
+            "closed": self.closed,
+            "total": self.total,
+            "remaining": len(manager.websocket_rooms),
+            "inflight": self._inflight,
+        }
+
+
+# Global drain controller instance
+drain = DrainController()
+
+Gauge("ws_draining", "1 while this worker is draining", callback=lambda: {(): int(drain.draining)})
@@ -1,14 +1,25 @@
-from typing import Dict, List, Set
-from fastapi import WebSocket
-import json
-import redis
+from typing import Dict, List, Optional, Set
+from fastapi import WebSocket, status
+import asyncio
+import math
+import time
 from app.core.config import settings
+from app.core.metrics import (
+    Counter,
+    Gauge,
+    ws_broadcast_recipients,
+    ws_broadcast_seconds,
+    ws_send_failures_total,
+)
+from app.core.serialization import dumps_text
+from app.core.tracing import current_span, span
+from app.websocket.batching import FrameBatcher, encode_batch
+from app.websocket.relay import RoomRelay
 
-# Initialize Redis client for pub/sub (for future scaling)
-try:
-    redis_client = redis.from_url(settings.redis_url, decode_responses=True)
-except:
-    redis_client = None
+ws_reaped_connections_total = Counter(
+    "ws_reaped_connections_total", "Connections removed by the server", ("reason",)
+)
+ws_pings_sent_total = Counter("ws_pings_sent_total", "Server heartbeat pings sent")
 
 
 class ConnectionManager:
@@ -19,22 +30,43 @@ class ConnectionManager:
         self.active_connections: Dict[int, Set[WebSocket]] = {}
         # WebSocket -> room_id
         self.websocket_rooms: Dict[WebSocket, int] = {}
+        # username -> Set[WebSocket] (presence)
+        self.user_connections: Dict[str, Set[WebSocket]] = {}
+        # WebSocket -> username
+        self.websocket_users: Dict[WebSocket, str] = {}
+        # WebSocket -> monotonic time of the last frame received
+        self.last_seen: Dict[WebSocket, float] = {}
+        # Timing wheel for the idle reaper: slot -> sockets due around then
+        self._wheel: List[Set[WebSocket]] = []
+        self._wheel_position = 0
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._reaper_task: Optional[asyncio.Task] = None
+        # Frames to and from other workers
+        self.relay = RoomRelay(self.deliver_local, self.deliver_user)
+        # Outbound coalescing for sockets that asked for it
+        self.batcher = FrameBatcher(self._batch_send_failed)
     
-    async def connect(self, websocket: WebSocket, room_id: int, username: str = None):
-        """Connect a WebSocket to a room"""
+    async def connect(self, websocket: WebSocket, room_id: int, username: str = None, batch: bool = False):
+        """Connect a WebSocket to a room (batch: coalesce its outbound frames)"""
         await websocket.accept()
+        if batch:
+            self.batcher.enable(websocket)
         
         if room_id not in self.active_connections:
             self.active_connections[room_id] = set()
+            if room_id:
+                self.relay.room_opened(room_id)
         
         self.active_connections[room_id].add(websocket)
         self.websocket_rooms[websocket] = room_id
+        self.touch(websocket)
+        self._schedule(websocket, settings.ws_idle_timeout_seconds)
 
         # Track user presence if username provided
         if username:
-            if not hasattr(self, 'user_connections'):
-                self.user_connections: Dict[str, Set[WebSocket]] = {}
-            
+            if room_id == 0 and not self.has_system_connection(username):
+                self.relay.user_opened(username)
+            self.websocket_users[websocket] = username
             if username not in self.user_connections:
                 self.user_connections[username] = set()
                 # Broadcast "user_online" event
@@ -46,19 +78,32 @@ class ConnectionManager:
             
             self.user_connections[username].add(websocket)
     
-    async def disconnect(self, websocket: WebSocket, username: str = None):
-        """Disconnect a WebSocket from its room"""
-        room_id = self.websocket_rooms.get(websocket)
-        if room_id and room_id in self.active_connections:
-            self.active_connections[room_id].discard(websocket)
-            if len(self.active_connections[room_id]) == 0:
+    async def disconnect(self, websocket: WebSocket, username: str = None) -> bool:
+        """
+        Disconnect a WebSocket from its room and presence indexes.
+
+        Safe to call more than once; returns True only for the call that
+        actually removed the socket.
+        """
+        room_id = self.websocket_rooms.pop(websocket, None)
+        if room_id is None:
+            return False
+        connections = self.active_connections.get(room_id)
+        if connections is not None:
+            connections.discard(websocket)
+            if len(connections) == 0:
                 del self.active_connections[room_id]
-        
-        self.websocket_rooms.pop(websocket, None)
+                if room_id:
+                    self.relay.room_closed(room_id)
+        self.last_seen.pop(websocket, None)
+        self.batcher.discard(websocket)
 
         # Handle presence
-        if username and hasattr(self, 'user_connections') and username in self.user_connections:
+        username = self.websocket_users.pop(websocket, None) or username
+        if username and username in self.user_connections:
             self.user_connections[username].discard(websocket)
+            if room_id == 0 and not self.has_system_connection(username):
+                self.relay.user_closed(username)
             if len(self.user_connections[username]) == 0:
                 del self.user_connections[username]
                 # Broadcast "user_offline" event
@@ -67,53 +112,222 @@ class ConnectionManager:
                     "status": "offline",
                     "username": username
                 })
+        return True
 
-    async def broadcast_global(self, message: dict):
-        """Broadcast to ALL connected clients"""
-        for connections in self.active_connections.values():
-            for connection in connections:
+    async def remove_connection(self, websocket: WebSocket, reason: str, code: int = status.WS_1001_GOING_AWAY):
+        """Server-side removal of a dead or idle socket: clean up indexes, notify the room, close"""
+        room_id = self.websocket_rooms.get(websocket)
+        username = self.websocket_users.get(websocket)
+        await self.flush(websocket)
+        if not await self.disconnect(websocket):
+            return
+        ws_reaped_connections_total.inc(reason=reason)
+        if room_id and username:
+            await self.broadcast_to_room({
+                "type": "user_left",
+                "username": username,
+                "room_id": room_id
+            }, room_id)
+        try:
+            await asyncio.wait_for(websocket.close(code=code, reason=reason), timeout=1.0)
+        except Exception:
+            # Peer is gone; the transport is torn down either way
+            pass
+
+    async def flush(self, websocket: WebSocket) -> None:
+        """Send a batched socket's queued frames now (before the server closes it)"""
+        queued = self.batcher.take(websocket)
+        if queued:
+            try:
+                await websocket.send_text(encode_batch(queued))
+            except Exception:
+                ws_send_failures_total.inc(kind="batch")
+
+    async def _batch_send_failed(self, websocket: WebSocket) -> None:
+        ws_send_failures_total.inc(kind="batch")
+        await self.remove_connection(websocket, "send_failed")
+
+    async def send_text(self, websocket: WebSocket, payload: str) -> None:
+        """Send an encoded frame, or queue it if the socket is batched"""
+        if not self.batcher.queue(websocket, payload):
+            await websocket.send_text(payload)
+
+    async def close_user(self, username: str) -> None:
+        """Close every socket a user has open here (their tokens were revoked)"""
+        for websocket in list(self.user_connections.get(username, ())):
+            await self.remove_connection(websocket, "revoked", code=status.WS_1008_POLICY_VIOLATION)
+
+    async def close_room_user(self, room_id: int, username: str) -> None:
+        """Close a user's sockets in one room here (they were removed from it)"""
+        for websocket in list(self.user_connections.get(username, ())):
+            if self.websocket_rooms.get(websocket) == room_id:
+                await self.remove_connection(websocket, "removed", code=status.WS_1008_POLICY_VIOLATION)
+
+    # Heartbeat and idle reaper
+
+    def touch(self, websocket: WebSocket) -> None:
+        """Record activity (any received frame counts, including pongs)"""
+        self.last_seen[websocket] = time.monotonic()
+
+    def _schedule(self, websocket: WebSocket, delay: float) -> None:
+        if not self._wheel:
+            return
+        ticks = max(1, math.ceil(delay / settings.ws_reaper_tick_seconds))
+        slot = (self._wheel_position + min(ticks, len(self._wheel) - 1)) % len(self._wheel)
+        self._wheel[slot].add(websocket)
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(settings.ws_ping_interval_seconds)
+            ping = dumps_text({"type": "ping", "ts": time.time()})
+            for websocket in list(self.websocket_rooms):
                 try:
-                    await connection.send_json(message)
-                except:
+                    await websocket.send_text(ping)
+                    ws_pings_sent_total.inc()
+                except Exception:
+                    ws_send_failures_total.inc(kind="ping")
+                    await self.remove_connection(websocket, "send_failed")
+
+    async def _reap(self) -> None:
+        """
+        Advance the timing wheel one slot per tick.
+
+        Each socket sits in the slot of its earliest possible expiry, so a
+        tick only looks at the sockets due now instead of scanning them all.
+        touch() never moves sockets; a socket that was active since it was
+        scheduled is simply rescheduled when its slot comes up.
+        """
+        tick = settings.ws_reaper_tick_seconds
+        timeout = settings.ws_idle_timeout_seconds
+        while True:
+            await asyncio.sleep(tick)
+            self._wheel_position = (self._wheel_position + 1) % len(self._wheel)
+            due, self._wheel[self._wheel_position] = self._wheel[self._wheel_position], set()
+            now = time.monotonic()
+            for websocket in due:
+                last_seen = self.last_seen.get(websocket)
+                if last_seen is None:
+                    continue  # Already disconnected
+                idle = now - last_seen
+                if idle >= timeout:
+                    await self.remove_connection(websocket, "idle_timeout", code=status.WS_1001_GOING_AWAY)
+                else:
+                    self._schedule(websocket, timeout - idle)
+
+    def start(self) -> None:
+        if self._reaper_task is not None:
+            return
+        slots = math.ceil(settings.ws_idle_timeout_seconds / settings.ws_reaper_tick_seconds) + 2
+        self._wheel = [set() for _ in range(slots)]
+        for websocket in self.websocket_rooms:
+            self._schedule(websocket, settings.ws_idle_timeout_seconds)
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
+        self._reaper_task = asyncio.create_task(self._reap())
+        self.relay.start()
+
+    async def stop(self) -> None:
+        for task in (self._heartbeat_task, self._reaper_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
                     pass
+        self._heartbeat_task = None
+        self._reaper_task = None
+        await self.batcher.stop()
+        await self.relay.stop()
+
+    async def broadcast_global(self, message: dict):
+        """Broadcast to ALL connected clients"""
+        payload = dumps_text(message)
+        for connection in list(self.websocket_rooms):
+            try:
+                await self.send_text(connection, payload)
+            except Exception:
+                ws_send_failures_total.inc(kind="global")
 
     async def get_online_users(self) -> List[str]:
-        if hasattr(self, 'user_connections'):
-            return list(self.user_connections.keys())
-        return []
+        return list(self.user_connections.keys())
 
     async def send_personal_message(self, message: dict, websocket: WebSocket):
         try:
-            await websocket.send_json(message)
+            await self.send_text(websocket, dumps_text(message))
         except RuntimeError:
             # Socket already closed or connection lost
-            pass
+            ws_send_failures_total.inc(kind="personal")
+
+    def has_system_connection(self, username: str) -> bool:
+        """Whether the user has a /ws/system socket on this worker"""
+        return any(self.websocket_rooms.get(ws) == 0 for ws in self.user_connections.get(username, ()))
+
+    async def send_to_user(self, username: str, message: dict, room_id: int = 0):
+        """Send to every socket a user has open in one room (default: the system room)"""
+        for connection in list(self.user_connections.get(username, ())):
+            if self.websocket_rooms.get(connection) == room_id:
+                await self.send_personal_message(message, connection)
+
+    async def notify_user(self, username: str, message: dict):
+        """Send to a user's system sockets on every worker"""
+        payload = dumps_text(message)
+        await self.deliver_user(username, payload)
+        self.relay.publish_user(username, payload)
+
+    async def deliver_user(self, username: str, payload: str):
+        """Hand an encoded frame to a user's system sockets on this worker"""
+        for connection in list(self.user_connections.get(username, ())):
+            if self.websocket_rooms.get(connection) == 0:
+                try:
+                    await self.send_text(connection, payload)
+                except Exception:
+                    ws_send_failures_total.inc(kind="personal")
 
     async def broadcast_to_room(self, message: dict, room_id: int, exclude: WebSocket = None):
-        """Broadcast a message to all connections in a room"""
-        if room_id not in self.active_connections:
-            return
-        
+        """Broadcast a message to all connections in a room, here and on other workers"""
+        # Encode once for every recipient and the Redis publish
+        with span("encode"):
+            payload = dumps_text(message)
+        if room_id in self.active_connections:
+            with span("fan_out") as fan_out:
+                recipients = await self._fan_out(room_id, payload, exclude)
+                if fan_out is not None:
+                    fan_out.set(recipients=recipients)
+        with span("relay_publish"):
+            self.relay.publish(room_id, payload)
+    
+    async def deliver_local(self, room_id: int, payload: str):
+        """Fan out an already encoded frame from another worker to this worker's sockets"""
+        if room_id in self.active_connections:
+            await self._fan_out(room_id, payload)
+    
+    async def _fan_out(self, room_id: int, payload: str, exclude: WebSocket = None) -> int:
+        start = time.perf_counter()
+        recipients = 0
         disconnected = []
-        for connection in self.active_connections[room_id]:
+        # Traced sends get a span each, up to a limit (big rooms would flood the trace)
+        traced = settings.trace_max_recipient_spans if current_span() is not None else 0
+        queue = self.batcher.queue
+        for connection in list(self.active_connections[room_id]):
             if connection == exclude:
                 continue
+            recipients += 1
             try:
-                await connection.send_json(message)
-            except:
+                if recipients <= traced:
+                    with span("send", recipient=self.websocket_users.get(connection, "")):
+                        await self.send_text(connection, payload)
+                elif not queue(connection, payload):
+                    await connection.send_text(payload)
+            except Exception:
                 # Connection is dead, mark for removal
+                ws_send_failures_total.inc(kind="room")
                 disconnected.append(connection)
+        ws_broadcast_seconds.observe(time.perf_counter() - start)
+        ws_broadcast_recipients.observe(recipients)
         
         # Clean up disconnected connections
         for connection in disconnected:
-            self.disconnect(connection)
-        
-        # Publish to Redis for multi-instance scaling (if Redis is available)
-        if redis_client:
-            try:
-                redis_client.publish(f"room:{room_id}", json.dumps(message))
-            except:
-                pass
+            await self.remove_connection(connection, "send_failed")
+        return recipients
     
     def get_room_connection_count(self, room_id: int) -> int:
         """Get the number of active connections in a room"""
@@ -123,3 +337,10 @@ class ConnectionManager:
 # Global connection manager instance
 manager = ConnectionManager()
 
+Gauge("ws_connections", "Open WebSockets on this worker",
+      callback=lambda: {(): len(manager.websocket_rooms)})
+Gauge("ws_rooms", "Rooms with at least one open WebSocket (including the system room)",
+      callback=lambda: {(): len(manager.active_connections)})
+Gauge("ws_online_users", "Users with at least one open WebSocket",
+      callback=lambda: {(): len(manager.user_connections)})
+
@@ -0,0 +1,203 @@
+"""
+Cross-worker room relay
+Every room broadcast is published to Redis channel room:{id}, tagged with
+the publishing worker. Each worker subscribes only to the rooms it has
+local sockets in and hands frames from other workers to its own sockets.
+With room affinity (app.websocket.affinity) most rooms live on one worker,
+so most publishes have no remote subscriber at all.
+
+Frames for one user's system sockets (mentions) go to channel user:{name};
+a worker subscribes to it while the user has a system socket there.
+New room heads for unread counts (app.services.read_markers) go to channel
+head:{id}, subscribed while a local system socket user watches the room.
+
+Publishing happens off the send path: frames are collected in an outbox
+and one job at a time on the "relay" background queue (app.core.tasks)
+sends everything collected so far in a single Redis pipeline from a
+thread, in order. A slow Redis delays the copies for other workers, not
+this worker's sockets.
+"""
+import asyncio
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+
+from app.core.config import WORKER_ID, settings
+from app.core.metrics import Counter, redis_publish_failures_total
+from app.core.redis import get_redis_client, report_redis_failure
+from app.core.tasks import executor
+
+relay_published_total = Counter("relay_published_total", "Room frames published for other workers")
+relay_received_total = Counter("relay_received_total", "Room frames received from other workers")
+
+SEPARATOR = "\n"
+
+
+class RoomRelay:
+    def __init__(
+        self,
+        deliver: Callable[[int, str], Awaitable[None]],
+        deliver_user: Optional[Callable[[str, str], Awaitable[None]]] = None
+    ):
+        # Called with (room_id, payload) for frames published by other workers
+        self.deliver = deliver
+        # Called with (username, payload) for user frames from other workers
+        self.deliver_user = deliver_user
+        # Rooms with local sockets, i.e. what we should be subscribed to
+        self.rooms: Set[int] = set()
+        # Users with a local system socket
+        self.users: Set[str] = set()
+        # Rooms whose head changes local system sockets watch, and their handler
+        self.heads: Set[int] = set()
+        self.deliver_head: Optional[Callable[[int, str], Awaitable[None]]] = None
+        self._subscribed: Set[str] = set()
+        # (channel, message) waiting for the next pipelined publish
+        self._outbox: List[Tuple[str, str]] = []
+        self._send_queued = False
+        # One job at a time keeps frames in publish order
+        self._queue = executor.queue("relay", concurrency=1)
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def publish(self, room_id: int, payload: str) -> None:
+        """Publish an encoded frame for other workers (no-op without Redis)"""
+        self._publish(f"room:{room_id}", payload)
+
+    def publish_user(self, username: str, payload: str) -> None:
+        """Publish an encoded frame for a user's system sockets on other workers"""
+        self._publish(f"user:{username}", payload)
+
+    def publish_head(self, room_id: int, payload: str) -> None:
+        """Publish an encoded room head change for workers watching the room"""
+        self._publish(f"head:{room_id}", payload)
+
+    def _publish(self, channel: str, payload: str) -> None:
+        if not get_redis_client():
+            return
+        if len(self._outbox) >= settings.task_queue_size:
+            # Redis can't keep up; drop rather than grow without bound
+            redis_publish_failures_total.inc()
+            return
+        self._outbox.append((channel, f"{WORKER_ID}{SEPARATOR}{payload}"))
+        if not self._send_queued:
+            self._send_queued = self._queue.submit(self._send_outbox)
+
+    def _send(self, redis_client, batch: List[Tuple[str, str]]) -> None:
+        pipeline = redis_client.pipeline(transaction=False)
+        for channel, message in batch:
+            pipeline.publish(channel, message)
+        pipeline.execute()
+
+    async def _send_outbox(self) -> None:
+        self._send_queued = False
+        batch, self._outbox = self._outbox, []
+        redis_client = get_redis_client()
+        if not batch or not redis_client:
+            return
+        try:
+            await asyncio.to_thread(self._send, redis_client, batch)
+            relay_published_total.inc(len(batch))
+        except Exception:
+            redis_publish_failures_total.inc(len(batch))
+            report_redis_failure()
+
+    def room_opened(self, room_id: int) -> None:
+        self.rooms.add(room_id)
+        self._changed.set()
+
+    def room_closed(self, room_id: int) -> None:
+        self.rooms.discard(room_id)
+        self._changed.set()
+
+    def user_opened(self, username: str) -> None:
+        if self.deliver_user is not None:
+            self.users.add(username)
+            self._changed.set()
+
+    def user_closed(self, username: str) -> None:
+        if username in self.users:
+            self.users.discard(username)
+            self._changed.set()
+
+    def on_head(self, handler: Callable[[int, str], Awaitable[None]]) -> None:
+        """Call handler(room_id, payload) for head changes published by other workers"""
+        self.deliver_head = handler
+
+    def head_watched(self, room_id: int) -> None:
+        if room_id not in self.heads:
+            self.heads.add(room_id)
+            self._changed.set()
+
+    def head_unwatched(self, room_id: int) -> None:
+        if room_id in self.heads:
+            self.heads.discard(room_id)
+            self._changed.set()
+
+    async def _sync_subscriptions(self, pubsub) -> None:
+        self._changed.clear()
+        wanted = {f"room:{room_id}" for room_id in self.rooms} | {f"user:{username}" for username in self.users}
+        if self.deliver_head is not None:
+            wanted |= {f"head:{room_id}" for room_id in self.heads}
+        added = wanted - self._subscribed
+        removed = self._subscribed - wanted
+        if added:
+            await pubsub.subscribe(*added)
+        if removed:
+            await pubsub.unsubscribe(*removed)
+        self._subscribed = wanted
+
+    async def _listen(self) -> None:
+        import redis.asyncio as aioredis
+
+        while True:
+            if get_redis_client() is None:
+                await asyncio.sleep(settings.health_check_interval_seconds)
+                continue
+            client = aioredis.from_url(settings.redis_url, decode_responses=True)
+            pubsub = client.pubsub()
+            self._subscribed = set()
+            try:
+                while True:
+                    if self._changed.is_set() or not self._subscribed:
+                        await self._sync_subscriptions(pubsub)
+                    if not self._subscribed:
+                        # Nothing to listen to until a room gets a local socket
+                        await self._changed.wait()
+                        continue
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is None or message["type"] != "message":
+                        continue
+                    origin, _, payload = message["data"].partition(SEPARATOR)
+                    if origin == WORKER_ID:
+                        continue
+                    relay_received_total.inc()
+                    kind, _, target = message["channel"].partition(":")
+                    if kind == "user":
+                        await self.deliver_user(target, payload)
+                    elif kind == "head":
+                        await self.deliver_head(int(target), payload)
+                    else:
+                        await self.deliver(int(target), payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Room relay error, resubscribing: {e}")
+                report_redis_failure()
+                await asyncio.sleep(1.0)
+            finally:
+                try:
+                    await pubsub.aclose()
+                    await client.aclose()
+                except Exception:
+                    pass
+
+    def start(self) -> None:
+        if self._task is None and settings.redis_url:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
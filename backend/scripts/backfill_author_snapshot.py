@@ -0,0 +1,55 @@
+"""
+Backfill author snapshots
+Fills messages.author_username / author_avatar_url for messages written
+before migration 0010 with their author's current profile.
+
+Messages are walked in id ranges of --batch-size, one transaction per
+range, so no statement touches more than one range of rows. Only rows with
+no snapshot yet are written: new messages set their own and profile
+changes rewrite theirs (app.services.authors). Safe to run while the app
+is serving and to re-run or resume with --after-id.
+
+Run with: python -m scripts.backfill_author_snapshot --batch-size 5000
+"""
+import argparse
+import time
+
+from sqlalchemy import create_engine, text
+
+from app.core.config import settings
+
+MAX_ID = text("SELECT COALESCE(MAX(id), 0) FROM messages")
+FILL_RANGE = text(
+    "UPDATE messages SET "
+    "author_username = (SELECT users.username FROM users WHERE users.id = messages.user_id), "
+    "author_avatar_url = (SELECT users.avatar_url FROM users WHERE users.id = messages.user_id) "
+    "WHERE id > :after_id AND id <= :through_id AND author_username IS NULL"
+)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backfill the author snapshot on existing messages")
+    parser.add_argument("--database-url", default=settings.database_url)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--after-id", type=int, default=0, help="Resume after this message id")
+    parser.add_argument("--sleep", type=float, default=0.0, help="Pause between batches to limit load")
+    args = parser.parse_args(argv)
+
+    engine = create_engine(args.database_url)
+    with engine.connect() as conn:
+        # Newer messages carry their own snapshot
+        max_id = conn.execute(MAX_ID).scalar()
+    after_id, total, start = args.after_id, 0, time.perf_counter()
+    while after_id < max_id:
+        through_id = min(after_id + args.batch_size, max_id)
+        with engine.begin() as conn:
+            total += conn.execute(FILL_RANGE, {"after_id": after_id, "through_id": through_id}).rowcount
+        after_id = through_id
+        print(f"Backfilled {total} messages (through message {after_id})")
+        if args.sleep:
+            time.sleep(args.sleep)
+    print(f"Done: {total} messages in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Backfill room activity rollups
+Rebuilds room_activity (see app.services.activity) from the messages table
+for history written before the rollup pipeline, or after a gap.
+
+History is walked in windows of --hours hours on the created_at index, one
+query and one transaction per window. Each window is aggregated with NumPy
+in a handful of array operations: bucket starts from the epoch timestamps,
+counts per (room, bucket) from one np.unique, and every sender sketch from
+one sort of (bucket, register, rank) triples. Buckets are whole minutes and
+hours inside the window, so they are written with replace semantics: the
+run is idempotent and can be resumed with --since.
+
+It stops at the start of the current hour by default, which the live
+pipeline is still filling. Minute rows are only written within
+rollup_minute_retention_days. Messages already removed by retention are
+gone from the rebuilt buckets too.
+
+Run with: python -m scripts.backfill_room_activity --hours 24
+"""
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Tuple
+
+import numpy as np
+from sqlalchemy import Integer, cast, create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.db import base  # noqa: F401 - registers every model
+from app.models.message import Message
+from app.services.activity import HOUR, MINUTE, PERIOD_SECONDS, RollupKey, as_utc, bucket_start, write_rollups
+from app.services.hll import DEFAULT_PRECISION, HyperLogLog, registers_for
+
+messages = Message.__table__
+
+
+def epoch_seconds(dialect: str):
+    """created_at as integer epoch seconds, computed by the database"""
+    if dialect == "postgresql":
+        return cast(func.extract("epoch", messages.c.created_at), Integer)
+    return cast(func.strftime("%s", messages.c.created_at), Integer)
+
+
+def aggregate(
+    room_ids: np.ndarray, user_ids: np.ndarray, timestamps: np.ndarray, period: str
+) -> Dict[RollupKey, Tuple[int, HyperLogLog]]:
+    """Message counts and sender sketches per (room, bucket) for one chunk"""
+    seconds = PERIOD_SECONDS[period]
+    buckets = timestamps - timestamps % seconds
+    # One int64 key per (room, bucket): bucket numbers fit in 32 bits
+    keys = (room_ids << 32) | (buckets // seconds)
+    groups, group_of, counts = np.unique(keys, return_inverse=True, return_counts=True)
+
+    # Highest rank per (group, register): sort by (group, register, rank), keep the last of each run
+    registers = 1 << DEFAULT_PRECISION
+    index, rank = registers_for(user_ids)
+    slot = group_of.astype(np.int64) * registers + index
+    order = np.lexsort((rank, slot))
+    slot, rank = slot[order], rank[order]
+    last = np.append(slot[1:] != slot[:-1], True)
+    slot, rank = slot[last], rank[last]
+    bounds = np.searchsorted(slot // registers, np.arange(len(groups) + 1))
+
+    rows = {}
+    for group, key in enumerate(groups.tolist()):
+        sketch = HyperLogLog()
+        entries = slice(bounds[group], bounds[group + 1])
+        sketch.registers[slot[entries] % registers] = rank[entries]
+        room_id, bucket = key >> 32, (key & 0xFFFFFFFF) * seconds
+        rows[(room_id, period, bucket_start(bucket, period))] = (int(counts[group]), sketch)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild room activity rollups from messages")
+    parser.add_argument("--database-url", default=settings.database_url)
+    parser.add_argument("--hours", type=int, default=24, help="Hours of history per window")
+    parser.add_argument("--since", type=datetime.fromisoformat,
+                        help="Start here (UTC, e.g. 2026-01-01T00:00) instead of the oldest message")
+    parser.add_argument("--until", type=datetime.fromisoformat,
+                        help="Stop here (UTC); defaults to the start of the current hour")
+    parser.add_argument("--sleep", type=float, default=0.0, help="Pause between windows to limit load")
+    args = parser.parse_args(argv)
+
+    engine = create_engine(args.database_url)
+    Session = sessionmaker(bind=engine)
+    epoch = epoch_seconds(engine.dialect.name)
+
+    until = as_utc(args.until) if args.until else bucket_start(time.time(), HOUR)
+    if args.since:
+        since = as_utc(args.since)
+    else:
+        with Session() as db:
+            oldest = db.execute(select(func.min(messages.c.created_at)).where(messages.c.room_id.isnot(None))).scalar()
+        if oldest is None:
+            print("No room messages to backfill")
+            return
+        since = as_utc(oldest)
+    since = bucket_start(since.timestamp(), HOUR)
+    minutes_from = datetime.now(timezone.utc) - timedelta(days=settings.rollup_minute_retention_days)
+    window = timedelta(hours=max(1, args.hours))
+
+    total = buckets = 0
+    start = time.perf_counter()
+    while since < until:
+        end = min(since + window, until)
+        with Session() as db:
+            # A second of slack either way: SQLite compares timestamps as text, and
+            # the exact window is applied to the epoch values below
+            rows = db.execute(
+                select(messages.c.room_id, messages.c.user_id, epoch)
+                .where(
+                    messages.c.room_id.isnot(None),
+                    messages.c.created_at >= since - timedelta(seconds=1),
+                    messages.c.created_at < end + timedelta(seconds=1),
+                )
+            ).all()
+            data = np.array(rows, dtype=np.int64).reshape(-1, 3)
+            data = data[(data[:, 2] >= since.timestamp()) & (data[:, 2] < end.timestamp())]
+            if len(data):
+                room_ids, user_ids, timestamps = data[:, 0], data[:, 1], data[:, 2]
+                rollups = aggregate(room_ids, user_ids, timestamps, HOUR)
+                if not settings.rollup_minute_retention_days or end > minutes_from:
+                    recent = timestamps >= minutes_from.timestamp() if settings.rollup_minute_retention_days else slice(None)
+                    rollups.update(aggregate(room_ids[recent], user_ids[recent], timestamps[recent], MINUTE))
+                keys = list(rollups)
+                for index in range(0, len(keys), 500):
+                    write_rollups(db, {key: rollups[key] for key in keys[index:index + 500]}, replace=True)
+                db.commit()
+                total += len(data)
+                buckets += len(rollups)
+        elapsed = time.perf_counter() - start
+        print(f"Through {end.isoformat()}: {total} messages into {buckets} buckets ({total / elapsed:,.0f} messages/s)")
+        since = end
+        if args.sleep:
+            time.sleep(args.sleep)
+    print(f"Done: {total} messages, {buckets} buckets in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
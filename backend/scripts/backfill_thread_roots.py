@@ -0,0 +1,85 @@
+"""
+Backfill thread roots
+Fills messages.thread_root_id for replies written before migration 0002
+and recomputes reply_count on the roots they belong to.
+
+Replies are walked in id order with keyset batches, one transaction per
+batch. A parent always has a smaller id than its replies, so by the time a
+batch is processed every parent outside it already has its root; parents
+inside the batch are resolved from the batch itself. Safe to run while the
+app is serving (new replies set their own root) and to re-run or resume
+with --after-id.
+
+Run with: python -m scripts.backfill_thread_roots --batch-size 5000
+"""
+import argparse
+import time
+
+from sqlalchemy import bindparam, create_engine, text
+
+from app.core.config import settings
+
+SELECT_BATCH = text(
+    "SELECT id, reply_to_id FROM messages "
+    "WHERE reply_to_id IS NOT NULL AND id > :after_id ORDER BY id LIMIT :limit"
+)
+SELECT_PARENTS = text(
+    "SELECT id, reply_to_id, thread_root_id FROM messages WHERE id IN :ids"
+).bindparams(bindparam("ids", expanding=True))
+UPDATE_ROOT = text("UPDATE messages SET thread_root_id = :root_id WHERE id = :id")
+RECOUNT = text(
+    "UPDATE messages SET reply_count = "
+    "(SELECT COUNT(*) FROM messages AS replies WHERE replies.thread_root_id = messages.id) "
+    "WHERE id IN :ids"
+).bindparams(bindparam("ids", expanding=True))
+
+
+def backfill_batch(conn, after_id: int, batch_size: int):
+    """Process one batch; returns (last id, rows updated) or None when done"""
+    rows = conn.execute(SELECT_BATCH, {"after_id": after_id, "limit": batch_size}).all()
+    if not rows:
+        return None
+
+    roots = {}  # message id -> thread root id, for this batch
+    parent_ids = {reply_to_id for _, reply_to_id in rows} - {message_id for message_id, _ in rows}
+    if parent_ids:
+        for parent_id, reply_to_id, thread_root_id in conn.execute(SELECT_PARENTS, {"ids": list(parent_ids)}):
+            # A root parent is its own thread root; a reply parent was handled by an earlier batch
+            roots[parent_id] = parent_id if reply_to_id is None else (thread_root_id or parent_id)
+
+    updates = []
+    for message_id, reply_to_id in rows:
+        root_id = roots.get(reply_to_id, reply_to_id)
+        roots[message_id] = root_id
+        updates.append({"id": message_id, "root_id": root_id})
+
+    conn.execute(UPDATE_ROOT, updates)
+    conn.execute(RECOUNT, {"ids": sorted({update["root_id"] for update in updates})})
+    return rows[-1][0], len(updates)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backfill messages.thread_root_id and reply counts")
+    parser.add_argument("--database-url", default=settings.database_url)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--after-id", type=int, default=0, help="Resume after this message id")
+    parser.add_argument("--sleep", type=float, default=0.0, help="Pause between batches to limit load")
+    args = parser.parse_args(argv)
+
+    engine = create_engine(args.database_url)
+    after_id, total, start = args.after_id, 0, time.perf_counter()
+    while True:
+        with engine.begin() as conn:
+            result = backfill_batch(conn, after_id, args.batch_size)
+        if result is None:
+            break
+        after_id, updated = result
+        total += updated
+        print(f"Backfilled {total} replies (through message {after_id})")
+        if args.sleep:
+            time.sleep(args.sleep)
+    print(f"Done: {total} replies in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
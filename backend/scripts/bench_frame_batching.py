@@ -0,0 +1,113 @@
+"""
+Outbound frame batching benchmark
+Drives the real ConnectionManager with one busy room of fake sockets and
+compares direct sends with batched sockets (app.websocket.batching). Each
+fake socket send builds the WebSocket frame with the websockets library
+(as uvicorn does) and writes it to /dev/null, so "sends" is the number of
+send syscalls and frames the server would make, and CPU is the process
+time the event loop spends to keep up.
+
+Messages arrive at --rate per second, paced on the wall clock, plus a
+typing event for every --typing-every messages. When direct sends can't
+keep up, the achieved rate drops below the target; the report shows both.
+
+No database, Redis or network is used.
+
+Run with: python -m scripts.bench_frame_batching --members 2000 --rate 1000 --seconds 2
+"""
+import argparse
+import asyncio
+import os
+import time
+
+os.environ["REDIS_URL"] = ""
+
+from websockets.frames import OP_TEXT, Frame  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.websocket.manager import ConnectionManager  # noqa: E402
+
+ROOM_ID = 1
+
+
+class FakeSocket:
+    """Just enough of a WebSocket for the manager; every send is one frame and one write(2)"""
+
+    def __init__(self, fd: int):
+        self.fd = fd
+        self.sends = 0
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        self.sends += 1
+        os.write(self.fd, Frame(OP_TEXT, text.encode()).serialize(mask=False))
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        pass
+
+
+async def run(members: int, rate: float, seconds: float, typing_every: int, batch: bool) -> dict:
+    manager = ConnectionManager()
+    fd = os.open(os.devnull, os.O_WRONLY)
+    sockets = [FakeSocket(fd) for _ in range(members)]
+    for websocket in sockets:
+        await manager.connect(websocket, ROOM_ID, batch=batch)
+
+    total = int(rate * seconds)
+    started, cpu_started = time.perf_counter(), time.process_time()
+    for index in range(total):
+        # Pace on absolute times so a slow send path falls behind instead of stretching the run
+        delay = started + index / rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await manager.broadcast_to_room({
+            "type": "message", "id": index, "room_id": ROOM_ID, "user_id": index % members,
+            "username": f"user{index % members}", "content": f"message {index} in a busy room", "seq": index,
+        }, ROOM_ID)
+        if typing_every and index % typing_every == 0:
+            await manager.broadcast_to_room({"type": "typing", "username": f"user{index % members}", "room_id": ROOM_ID}, ROOM_ID)
+    # Let the last batches go out
+    while manager.batcher.pending and any(manager.batcher.pending.values()):
+        await asyncio.sleep(settings.ws_batch_window_ms / 1000)
+    wall = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+    await manager.batcher.stop()
+    os.close(fd)
+
+    frames = total + (total // typing_every + (1 if total % typing_every else 0) if typing_every else 0)
+    return {
+        "frames": frames * members,
+        "sends": sum(websocket.sends for websocket in sockets),
+        "wall": wall,
+        "cpu": cpu,
+        "rate": total / wall,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure send syscalls and CPU with and without frame batching")
+    parser.add_argument("--members", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=1000.0, help="Messages per second into the room")
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--typing-every", type=int, default=5, help="One typing frame per N messages (0 for none)")
+    parser.add_argument("--window-ms", type=float, default=settings.ws_batch_window_ms)
+    args = parser.parse_args(argv)
+    settings.ws_batch_window_ms = args.window_ms
+
+    print(f"{args.members} sockets in one room, {args.rate:.0f} msgs/s target for {args.seconds}s, "
+          f"batch window {args.window_ms} ms")
+    results = {}
+    for label, batch in (("direct", False), ("batched", True)):
+        result = results[label] = asyncio.run(run(args.members, args.rate, args.seconds, args.typing_every, batch))
+        print(f"  {label:8} sends {result['sends']:>10,}  frames {result['frames']:>10,}  "
+              f"cpu {result['cpu']:6.2f}s  wall {result['wall']:6.2f}s  "
+              f"cpu/s {result['cpu'] / result['wall']:5.2f}  achieved {result['rate']:7.0f} msgs/s")
+    direct, batched = results["direct"], results["batched"]
+    print(f"Send syscalls: {direct['sends'] / max(1, batched['sends']):.1f}x fewer, "
+          f"CPU per message: {(direct['cpu'] / direct['frames']) / (batched['cpu'] / batched['frames']):.1f}x less")
+
+
+if __name__ == "__main__":
+    main()
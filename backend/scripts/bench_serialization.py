@@ -0,0 +1,114 @@
+"""
+Serialization microbenchmarks
+Compares the previous encode paths with the current ones for
+- a 100-message history page: FastAPI's response_model path (validate,
+  to_python(mode="json"), json.dumps) vs a prebuilt TypeAdapter dump_json
+- a 1,000-recipient broadcast: Starlette's send_json (json.dumps per
+  socket) vs encoding once with orjson and sending the same text
+
+No database or network is used; messages are transient ORM objects.
+
+Run with: python -m scripts.bench_serialization --repeat 200
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+
+from app.core.serialization import dumps_text, message_list_adapter
+from app.db import base  # noqa: F401 - registers every model
+from app.models.message import Message
+from app.models.user import User
+
+
+def make_page(size: int):
+    now = datetime.utcnow()
+    users = [
+        User(id=i, username=f"user{i}", email=f"user{i}@example.com", hashed_password="x",
+             is_active=True, is_admin=False, created_at=now)
+        for i in range(1, 11)
+    ]
+    page = []
+    for i in range(size):
+        user = users[i % len(users)]
+        page.append(Message(
+            id=i + 1, content=f"message number {i} with a little bit of text in it", room_id=1,
+            user_id=user.id, author_username=user.username, seq=i + 1, reply_count=0, created_at=now + timedelta(seconds=i)
+        ))
+    return page
+
+
+def fastapi_default(page) -> bytes:
+    value = message_list_adapter.validate_python(page, from_attributes=True)
+    content = message_list_adapter.dump_python(value, mode="json")
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode()
+
+
+def adapter_dump_json(page) -> bytes:
+    return message_list_adapter.dump_json(message_list_adapter.validate_python(page, from_attributes=True))
+
+
+class FakeWebSocket:
+    """Mimics starlette.websockets.WebSocket send_json/send_text without a transport"""
+
+    async def send(self, message):
+        pass
+
+    async def send_text(self, data: str):
+        await self.send({"type": "websocket.send", "text": data})
+
+    async def send_json(self, data):
+        await self.send_text(json.dumps(data, separators=(",", ":"), ensure_ascii=False))
+
+
+async def broadcast_send_json(sockets, message):
+    for websocket in sockets:
+        await websocket.send_json(message)
+
+
+async def broadcast_encode_once(sockets, message):
+    payload = dumps_text(message)
+    for websocket in sockets:
+        await websocket.send_text(payload)
+
+
+def timeit(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark JSON encode paths")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--recipients", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    page = make_page(args.page_size)
+    assert json.loads(fastapi_default(page)) == json.loads(adapter_dump_json(page))
+    before = timeit(lambda: fastapi_default(page), args.repeat)
+    after = timeit(lambda: adapter_dump_json(page), args.repeat)
+    print(f"history page ({args.page_size} messages): response_model {before:.3f} ms, "
+          f"TypeAdapter.dump_json {after:.3f} ms ({before / after:.1f}x)")
+
+    sockets = [FakeWebSocket() for _ in range(args.recipients)]
+    message = {
+        "type": "message", "id": 12345, "content": "hello everyone, how is it going today?",
+        "room_id": 1, "user_id": 7, "username": "user7", "reply_to_id": None, "seq": 999,
+        "created_at": datetime.utcnow().isoformat(),
+    }
+    loop = asyncio.new_event_loop()
+    before = timeit(lambda: loop.run_until_complete(broadcast_send_json(sockets, message)), args.repeat)
+    after = timeit(lambda: loop.run_until_complete(broadcast_encode_once(sockets, message)), args.repeat)
+    loop.close()
+    print(f"broadcast ({args.recipients} recipients): send_json {before:.3f} ms, "
+          f"encode once {after:.3f} ms ({before / after:.1f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
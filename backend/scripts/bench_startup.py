@@ -0,0 +1,100 @@
+"""
+Startup benchmark
+Measures how long `import app.main` takes (and optionally the lifespan
+startup) in fresh interpreters, and fails when the median exceeds a budget.
+Importing the app must not touch the database, Redis or OpenAI.
+
+Run with: python -m scripts.bench_startup --runs 5 --budget-ms 1500
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LIFESPAN_SNIPPET = """
+import asyncio, time
+start = time.perf_counter()
+from app.main import app, lifespan
+imported = time.perf_counter()
+async def main():
+    async with lifespan(app):
+        ready = time.perf_counter()
+    print(f"LIFESPAN {(imported - start) * 1000:.1f} {(ready - imported) * 1000:.1f}")
+asyncio.run(main())
+"""
+
+
+def parse_importtime(stderr: str):
+    """Return [(cumulative_us, self_us, module)] from -X importtime output"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), int(self_us), module.strip()))
+    return rows
+
+
+def measure_import(env) -> tuple:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"import app.main failed:\n{result.stderr[-2000:]}")
+    rows = parse_importtime(result.stderr)
+    total_us = next(cumulative for cumulative, _, module in rows if module == "app.main")
+    return total_us / 1000, rows
+
+
+def measure_lifespan(env) -> tuple:
+    result = subprocess.run(
+        [sys.executable, "-c", LIFESPAN_SNIPPET],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    for line in result.stdout.splitlines():
+        if line.startswith("LIFESPAN"):
+            _, import_ms, startup_ms = line.split()
+            return float(import_ms), float(startup_ms)
+    raise SystemExit(f"lifespan run failed:\n{result.stderr[-2000:]}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure app import and startup time")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=1500.0, help="Maximum median import time")
+    parser.add_argument("--top", type=int, default=10, help="Show the N slowest modules (self time)")
+    parser.add_argument("--lifespan", action="store_true", help="Also time the lifespan startup")
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ)
+
+    timings = []
+    rows = []
+    for _ in range(args.runs):
+        total_ms, rows = measure_import(env)
+        timings.append(total_ms)
+    median = statistics.median(timings)
+    print(f"import app.main: median {median:.1f} ms, min {min(timings):.1f} ms, max {max(timings):.1f} ms "
+          f"over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+
+    print("\nSlowest modules by self time (last run):")
+    for cumulative_us, self_us, module in sorted(rows, key=lambda row: row[1], reverse=True)[:args.top]:
+        print(f"  {self_us / 1000:8.1f} ms self {cumulative_us / 1000:8.1f} ms cumulative  {module}")
+
+    if args.lifespan:
+        import_ms, startup_ms = measure_lifespan(env)
+        print(f"\nlifespan: import {import_ms:.1f} ms, startup {startup_ms:.1f} ms")
+
+    if median > args.budget_ms:
+        print(f"\nFAIL: import time {median:.1f} ms is over the {args.budget_ms:.0f} ms budget")
+        return 1
+    print("\nOK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
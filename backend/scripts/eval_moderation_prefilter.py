@@ -0,0 +1,116 @@
+"""
+Moderation pre-classifier evaluation
+Scores a labelled export with the pre-classifier and reports what the
+configured thresholds would do: messages allowed or blocked locally,
+messages escalated to the remote classifier, the resulting precision and
+recall, and the share of remote calls saved. Escalated messages are
+assumed to get the label as their verdict (the labels come from the
+remote classifier), so every error counted here is a local decision.
+
+Labelled exports are JSON lines ({"text": ..., "label": 0|1}, "content"
+and "flagged" also accepted) or CSV files with text,label columns.
+
+Run with: python -m scripts.eval_moderation_prefilter data/labels.jsonl
+"""
+import argparse
+import csv
+import json
+import time
+from typing import List, Sequence, Tuple
+
+from app.core.config import settings
+from app.services.prefilter import HashedNgramModel
+
+SWEEP = (0.01, 0.02, 0.05, 0.1, 0.2, 0.3, 0.5)
+
+
+def read_examples(paths: Sequence[str]) -> Tuple[List[str], List[int]]:
+    texts, labels = [], []
+    for path in paths:
+        with open(path, newline="", encoding="utf-8") as handle:
+            if path.endswith(".csv"):
+                rows = csv.DictReader(handle)
+            else:
+                rows = (json.loads(line) for line in handle if line.strip())
+            for row in rows:
+                text = row.get("text", row.get("content"))
+                label = row.get("label", row.get("flagged"))
+                if text is None or label is None:
+                    continue
+                texts.append(text)
+                labels.append(1 if str(label).lower() in ("1", "true", "flagged") else 0)
+    return texts, labels
+
+
+def evaluate(scores: Sequence[float], labels: Sequence[int], allow_below: float, block_above: float) -> dict:
+    """Outcome of the allow/escalate/block bands on scored, labelled messages"""
+    allowed = blocked = escalated = 0
+    missed = false_blocks = caught_locally = caught_remotely = 0
+    for score, label in zip(scores, labels):
+        if score < allow_below:
+            allowed += 1
+            missed += label
+        elif score >= block_above:
+            blocked += 1
+            caught_locally += label
+            false_blocks += 1 - label
+        else:
+            escalated += 1
+            caught_remotely += label
+    flagged = sum(labels)
+    caught = caught_locally + caught_remotely
+    total = len(labels)
+    return {
+        "messages": total,
+        "flagged": flagged,
+        "allowed": allowed,
+        "blocked": blocked,
+        "escalated": escalated,
+        "missed": missed,
+        "false_blocks": false_blocks,
+        "precision": caught / (caught + false_blocks) if caught + false_blocks else 1.0,
+        "recall": caught / flagged if flagged else 1.0,
+        "call_reduction": 1 - escalated / total if total else 0.0,
+    }
+
+
+def print_report(model: HashedNgramModel, texts: Sequence[str], labels: Sequence[int],
+                 allow_below: float, block_above: float) -> None:
+    started = time.perf_counter()
+    scores = [model.score(text) for text in texts]
+    micros = (time.perf_counter() - started) / max(1, len(texts)) * 1e6
+
+    result = evaluate(scores, labels, allow_below, block_above)
+    print(f"{result['messages']} messages, {result['flagged']} flagged, {micros:.1f} us/message")
+    print(f"Thresholds: allow < {allow_below}, block >= {block_above}")
+    print(f"  allowed locally   {result['allowed']:8}  (missed {result['missed']})")
+    print(f"  blocked locally   {result['blocked']:8}  (false blocks {result['false_blocks']})")
+    print(f"  escalated         {result['escalated']:8}")
+    print(f"  precision {result['precision']:.4f}  recall {result['recall']:.4f}  "
+          f"call reduction {result['call_reduction']:.1%}")
+
+    print("Allow threshold sweep (same block threshold):")
+    print("  allow <   recall  precision  call reduction")
+    for threshold in SWEEP:
+        if threshold >= block_above:
+            break
+        swept = evaluate(scores, labels, threshold, block_above)
+        print(f"  {threshold:<8} {swept['recall']:7.4f}  {swept['precision']:9.4f}  {swept['call_reduction']:14.1%}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate the moderation pre-classifier on labelled messages")
+    parser.add_argument("paths", nargs="+", help="Labelled exports (.jsonl or .csv)")
+    parser.add_argument("--model", default=settings.moderation_prefilter_path)
+    parser.add_argument("--allow-below", type=float, default=settings.moderation_prefilter_allow_below)
+    parser.add_argument("--block-above", type=float, default=settings.moderation_prefilter_block_above)
+    args = parser.parse_args(argv)
+
+    texts, labels = read_examples(args.paths)
+    if not texts:
+        parser.error("no labelled messages found")
+    print_report(HashedNgramModel.load(args.model), texts, labels, args.allow_below, args.block_above)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+"""
+Synthetic data generator for benchmarking
+Bulk-loads users, rooms, messages and reply chains with realistic distributions:
+Zipfian room popularity, bursty timestamps and bounded reply depth.
+Uses Postgres COPY when available, batched executemany on SQLite.
+
+The same --seed and --end give the same dataset; ids start after the rows
+already in the database, so on a non-empty one they are offset.
+
+Run with: python -m scripts.generate_synthetic_data --users 100000 --rooms 500 --messages 5000000
+"""
+import argparse
+import bisect
+import csv
+import io
+import itertools
+import math
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import create_engine, text
+from passlib.context import CryptContext
+
+# Database URL from environment
+DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://whatyousayin:whatyousayin@db:5432/whatyousayin")
+
+# Password hashing (one hash shared by every synthetic user; bcrypt is far too slow per row)
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+USER_COLUMNS = ["id", "username", "email", "hashed_password", "is_active", "is_admin", "created_at"]
+ROOM_COLUMNS = ["id", "name", "description", "is_public", "created_by", "created_at"]
+MESSAGE_COLUMNS = [
+    "id", "content", "room_id", "user_id", "author_username", "author_avatar_url",
+    "reply_to_id", "thread_root_id", "seq", "created_at",
+]
+
+WORDS = (
+    "ya mon gwan ting wha dat nassau island junkanoo conch fritters rake scrape beach "
+    "boat fish market bay street cable vibes tonight weekend sports game music food "
+    "culture tech gaming weather sun rain breeze ferry exuma andros abaco eleuthera "
+    "who coming later soon yes no maybe true real nice good bad lol haha okay sure"
+).split()
+
+
+class ZipfSampler:
+    """Samples indexes 0..n-1 with probability proportional to 1 / (rank + 1) ** s"""
+
+    def __init__(self, n: int, s: float, rng: random.Random):
+        self.rng = rng
+        weights = (1.0 / math.pow(rank + 1, s) for rank in range(n))
+        self.cumulative = list(itertools.accumulate(weights))
+        self.total = self.cumulative[-1]
+
+    def sample(self) -> int:
+        return bisect.bisect_left(self.cumulative, self.rng.random() * self.total)
+
+
+def bursty_timestamps(count: int, start: datetime, end: datetime, rng: random.Random, burst_size: float):
+    """
+    Yield `count` increasing timestamps between start and end.
+
+    Messages arrive in bursts: burst start times are spread uniformly over the
+    window, burst lengths are geometric with mean `burst_size`, and gaps inside a
+    burst are short exponential delays (seconds) rather than hours.
+    """
+    span = (end - start).total_seconds()
+    bursts = max(1, int(count / burst_size))
+    starts = sorted(rng.random() * span for _ in range(bursts))
+    produced = 0
+    last = 0.0
+    for index, offset in enumerate(starts):
+        remaining_bursts = bursts - index
+        if remaining_bursts == 1:
+            length = count - produced
+        else:
+            length = min(count - produced, 1 + int(rng.expovariate(1.0 / burst_size)))
+        # A long burst can run into the next one; never step backwards in time
+        current = max(offset, last)
+        for _ in range(length):
+            current = min(span, current + rng.expovariate(1 / 8.0))
+            yield start + timedelta(seconds=current)
+        last = current
+        produced += length
+        if produced >= count:
+            return
+
+
+def random_content(rng: random.Random) -> str:
+    """Short chat-like message, lognormal length"""
+    length = max(1, min(60, int(rng.lognormvariate(1.8, 0.7))))
+    return " ".join(rng.choice(WORDS) for _ in range(length))
+
+
+def generate_users(count: int, first_id: int, hashed_password: str, start: datetime, rng: random.Random):
+    for offset in range(count):
+        user_id = first_id + offset
+        created = start + timedelta(seconds=rng.random() * 86400 * 30)
+        yield (user_id, f"user{user_id}", f"user{user_id}@example.com", hashed_password, True, False, created)
+
+
+def generate_rooms(count: int, first_id: int, creator_ids, start: datetime, rng: random.Random):
+    for offset in range(count):
+        room_id = first_id + offset
+        yield (room_id, f"Room {room_id}", f"Synthetic benchmark room {room_id}", True, rng.choice(creator_ids), start)
+
+
+def generate_messages(args, first_id: int, room_ids, user_ids, start: datetime, end: datetime, rng: random.Random):
+    """
+    Yield message rows in timestamp order.
+
+    Rooms are picked by a Zipf distribution, authors by a separate Zipf over users
+    (a few users are very chatty). Each room keeps a short window of recent
+    messages with their reply depth; a reply targets one of those and is dropped
+    back to a root message once `max_reply_depth` is reached.
+    """
+    room_sampler = ZipfSampler(len(room_ids), args.room_skew, rng)
+    user_sampler = ZipfSampler(len(user_ids), args.user_skew, rng)
+    recent = {}  # room_id -> list of (message_id, depth, thread root id)
+    seqs = {}  # room_id -> last per-room sequence number
+    message_id = first_id
+    for created in bursty_timestamps(args.messages, start, end, rng, args.burst_size):
+        room_id = room_ids[room_sampler.sample()]
+        window = recent.setdefault(room_id, [])
+        reply_to_id = None
+        thread_root_id = None
+        depth = 0
+        if window and rng.random() < args.reply_prob:
+            parent_id, parent_depth, parent_root = window[-1 - min(len(window) - 1, int(rng.expovariate(0.5)))]
+            if parent_depth < args.max_reply_depth:
+                reply_to_id = parent_id
+                thread_root_id = parent_root or parent_id
+                depth = parent_depth + 1
+        window.append((message_id, depth, thread_root_id))
+        if len(window) > 20:
+            del window[0]
+        seqs[room_id] = seqs.get(room_id, 0) + 1
+        user_id = user_ids[user_sampler.sample()]
+        # Author snapshot as the app stores it (synthetic users have no avatar)
+        yield (
+            message_id, random_content(rng), room_id, user_id, f"user{user_id}", None,
+            reply_to_id, thread_root_id, seqs[room_id], created,
+        )
+        message_id += 1
+
+
+def next_id(conn, table: str) -> int:
+    return (conn.execute(text(f"SELECT COALESCE(MAX(id), 0) FROM {table}")).scalar() or 0) + 1
+
+
+def copy_rows(conn, table: str, columns, rows, batch_size: int) -> int:
+    """Stream rows into Postgres with COPY ... FROM STDIN (CSV), one buffer per batch"""
+    cursor = conn.connection.dbapi_connection.cursor()
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+    total = 0
+    while True:
+        chunk = list(itertools.islice(rows, batch_size))
+        if not chunk:
+            break
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in chunk:
+            writer.writerow(["\\N" if value is None else value.isoformat() if isinstance(value, datetime) else value for value in row])
+        buffer.seek(0)
+        cursor.copy_expert(sql, buffer)
+        total += len(chunk)
+    cursor.close()
+    # Explicit ids bypass the serial sequence; move it past the loaded rows
+    conn.execute(text(
+        f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT COALESCE(MAX(id), 1) FROM {table}))"
+    ))
+    return total
+
+
+def insert_rows(conn, table: str, columns, rows, batch_size: int) -> int:
+    """Fallback for SQLite and other dialects: batched executemany"""
+    cursor = conn.connection.dbapi_connection.cursor()
+    placeholders = ", ".join("?" if conn.dialect.paramstyle == "qmark" else "%s" for _ in columns)
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+    total = 0
+    while True:
+        chunk = list(itertools.islice(rows, batch_size))
+        if not chunk:
+            break
+        cursor.executemany(sql, [
+            tuple(value.strftime("%Y-%m-%d %H:%M:%S.%f") if isinstance(value, datetime) else value for value in row)
+            for row in chunk
+        ])
+        total += len(chunk)
+    cursor.close()
+    return total
+
+
+def load(conn, table: str, columns, rows, batch_size: int) -> int:
+    started = time.perf_counter()
+    if conn.dialect.name == "postgresql":
+        total = copy_rows(conn, table, columns, rows, batch_size)
+    else:
+        total = insert_rows(conn, table, columns, rows, batch_size)
+    elapsed = time.perf_counter() - started
+    print(f"Loaded {total:,} {table} in {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f} rows/s)")
+    return total
+
+
+def generate(args):
+    """Generate and load the full synthetic dataset"""
+    rng = random.Random(args.seed)
+    engine = create_engine(args.database_url)
+
+    if args.create_schema:
+        from app.db.base import Base
+        Base.metadata.create_all(bind=engine)
+
+    end = args.end or datetime.now(timezone.utc).replace(microsecond=0)
+    start = end - timedelta(days=args.days)
+    hashed_password = pwd_context.hash("synthetic-password")
+
+    with engine.begin() as conn:
+        first_user = next_id(conn, "users")
+        first_room = next_id(conn, "rooms")
+        first_message = next_id(conn, "messages")
+        user_ids = list(range(first_user, first_user + args.users))
+        room_ids = list(range(first_room, first_room + args.rooms))
+
+        load(conn, "users", USER_COLUMNS, generate_users(args.users, first_user, hashed_password, start, rng), args.batch_size)
+        load(conn, "rooms", ROOM_COLUMNS, generate_rooms(args.rooms, first_room, user_ids, start, rng), args.batch_size)
+        load(
+            conn, "messages", MESSAGE_COLUMNS,
+            generate_messages(args, first_message, room_ids, user_ids, start, end, rng),
+            args.batch_size,
+        )
+
+        # Room sequence counters must match the generated per-room seqs
+        conn.execute(text(
+            "UPDATE rooms SET message_seq = (SELECT COALESCE(MAX(seq), 0) FROM messages WHERE messages.room_id = rooms.id) "
+            "WHERE id >= :first_room"
+        ), {"first_room": first_room})
+        conn.execute(text(
+            "UPDATE messages SET reply_count = "
+            "(SELECT COUNT(*) FROM messages AS replies WHERE replies.thread_root_id = messages.id) "
+            "WHERE id >= :first_message AND reply_to_id IS NULL"
+        ), {"first_message": first_message})
+
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("ANALYZE users; ANALYZE rooms; ANALYZE messages"))
+
+
+def parse_timestamp(value: str) -> datetime:
+    """ISO 8601 timestamp, UTC unless it carries an offset"""
+    timestamp = datetime.fromisoformat(value)
+    return timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic benchmarking dataset")
+    parser.add_argument("--database-url", default=DATABASE_URL)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--rooms", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--days", type=int, default=30, help="Time window the messages are spread over")
+    parser.add_argument("--end", type=parse_timestamp, default=None,
+                        help="End of the window, ISO 8601 (default: now; pin it to reproduce a dataset)")
+    parser.add_argument("--seed", type=int, default=42, help="Same seed and --end, same dataset")
+    parser.add_argument("--batch-size", type=int, default=50_000, help="Rows per COPY buffer / executemany call")
+    parser.add_argument("--room-skew", type=float, default=1.1, help="Zipf exponent for room popularity")
+    parser.add_argument("--user-skew", type=float, default=0.8, help="Zipf exponent for author activity")
+    parser.add_argument("--burst-size", type=float, default=25.0, help="Mean messages per burst")
+    parser.add_argument("--reply-prob", type=float, default=0.2, help="Probability a message is a reply")
+    parser.add_argument("--max-reply-depth", type=int, default=8)
+    parser.add_argument("--create-schema", action="store_true", help="Create tables from the app models first")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    generate(parse_args())
@@ -0,0 +1,50 @@
+"""
+Apply migrations
+alembic upgrade head, for databases created by the old create_all startup
+too: those have the tables but no alembic_version, so they are stamped with
+the revision their tables match first (0001, or 0001a if create_all already
+made read_markers) and then upgraded like any other database. The Docker
+images run this before starting uvicorn.
+
+Run with: python -m scripts.migrate
+"""
+import argparse
+import os
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, inspect
+
+from app.core.config import settings
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def unversioned_revision(database_url: str):
+    """The revision an unversioned create_all database matches, or None"""
+    engine = create_engine(database_url)
+    try:
+        tables = set(inspect(engine).get_table_names())
+    finally:
+        engine.dispose()
+    if "alembic_version" in tables or "users" not in tables:
+        return None
+    return "0001a" if "read_markers" in tables else "0001"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Upgrade the database schema to the latest revision")
+    parser.add_argument("--revision", default="head")
+    args = parser.parse_args(argv)
+
+    config = Config(os.path.join(BACKEND_DIR, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(BACKEND_DIR, "alembic"))
+    revision = unversioned_revision(settings.database_url)
+    if revision is not None:
+        print(f"Existing schema without migration history: stamping {revision}")
+        command.stamp(config, revision)
+    command.upgrade(config, args.revision)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Purge expired messages
+Runs the same batched retention purge as the background job (see
+app.services.retention) from the command line, e.g. from cron when
+RETENTION_INTERVAL_SECONDS is 0. Progress is checkpointed per room, so an
+interrupted run picks up where it stopped.
+
+Run with: python -m scripts.purge_messages --batch-size 1000 --sleep 0.05
+"""
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.db import base  # noqa: F401 - registers every model
+from app.models.retention_checkpoint import RetentionCheckpoint
+from app.services.retention import purge_batch, retention_policies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Delete messages past their room's retention in batches")
+    parser.add_argument("--database-url", default=settings.database_url)
+    parser.add_argument("--batch-size", type=int, default=settings.retention_batch_size)
+    parser.add_argument("--sleep", type=float, default=settings.retention_batch_pause_seconds,
+                        help="Pause between batches to limit load")
+    parser.add_argument("--room", type=int, action="append", help="Only these rooms (repeatable)")
+    args = parser.parse_args(argv)
+
+    Session = sessionmaker(bind=create_engine(args.database_url))
+    with Session() as db:
+        policies = [(room_id, days) for room_id, days in retention_policies(db) if not args.room or room_id in args.room]
+
+    deleted = tombstoned = 0
+    start = time.perf_counter()
+    for room_id, days in policies:
+        cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+        while True:
+            with Session() as db:
+                checkpoint = db.get(RetentionCheckpoint, room_id)
+                result = purge_batch(db, room_id, cutoff, checkpoint.purged_through_id if checkpoint else 0,
+                                     args.batch_size)
+                db.commit()
+            if result is None:
+                break
+            _, through_id, batch_deleted, batch_tombstoned = result
+            deleted += batch_deleted
+            tombstoned += batch_tombstoned
+            elapsed = time.perf_counter() - start
+            print(f"Room {room_id}: through message {through_id}, {deleted} deleted, {tombstoned} tombstoned "
+                  f"({(deleted + tombstoned) / elapsed:,.0f} rows/s)")
+            if args.sleep:
+                time.sleep(args.sleep)
+    elapsed = time.perf_counter() - start
+    print(f"Done: {deleted} deleted, {tombstoned} tombstoned in {len(policies)} rooms, {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Trace collector stand-in
+A minimal OTLP/HTTP JSON receiver for local debugging: accepts
+POST /v1/traces from workers (settings.trace_otlp_endpoint), appends every
+span to a JSONL file in the same flat format the app writes with
+trace_export_path, and prints one line per finished trace with its
+slowest step.
+
+It also renders a stored trace as an indented tree, from either file:
+
+    python -m scripts.trace_collector --show <trace_id> --file traces.jsonl
+
+Run with: python -m scripts.trace_collector --port 4318 --file traces.jsonl
+"""
+import argparse
+import json
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+
+def _attribute_value(value: dict):
+    for kind in ("stringValue", "boolValue", "doubleValue"):
+        if kind in value:
+            return value[kind]
+    if "intValue" in value:
+        return int(value["intValue"])
+    return None
+
+
+def flatten(body: dict) -> List[dict]:
+    """OTLP ExportTraceServiceRequest -> flat span records"""
+    records = []
+    for resource_spans in body.get("resourceSpans", []):
+        resource = {
+            attribute["key"]: _attribute_value(attribute["value"])
+            for attribute in resource_spans.get("resource", {}).get("attributes", [])
+        }
+        for scope_spans in resource_spans.get("scopeSpans", []):
+            for span in scope_spans.get("spans", []):
+                start, end = int(span["startTimeUnixNano"]), int(span["endTimeUnixNano"])
+                records.append({
+                    "trace_id": span["traceId"],
+                    "span_id": span["spanId"],
+                    "parent_span_id": span.get("parentSpanId") or None,
+                    "name": span["name"],
+                    "worker_id": resource.get("service.instance.id"),
+                    "start_time_unix_nano": start,
+                    "end_time_unix_nano": end,
+                    "duration_ms": round((end - start) / 1e6, 3),
+                    "attributes": {
+                        attribute["key"]: _attribute_value(attribute["value"])
+                        for attribute in span.get("attributes", [])
+                    },
+                })
+    return records
+
+
+def summarize(records: List[dict]) -> None:
+    by_trace: Dict[str, List[dict]] = defaultdict(list)
+    for record in records:
+        by_trace[record["trace_id"]].append(record)
+    for trace_id, spans in by_trace.items():
+        root = next((span for span in spans if not span["parent_span_id"]), spans[0])
+        children = [span for span in spans if span is not root]
+        slowest = max(children, key=lambda span: span["duration_ms"], default=None)
+        detail = f", slowest {slowest['name']} {slowest['duration_ms']:.2f} ms" if slowest else ""
+        print(f"{trace_id} {root['name']} {root['duration_ms']:.2f} ms, {len(spans)} spans{detail}")
+
+
+def render(records: List[dict], trace_id: str) -> str:
+    spans = sorted((record for record in records if record["trace_id"] == trace_id),
+                   key=lambda record: record["start_time_unix_nano"])
+    if not spans:
+        return f"Trace {trace_id} not found"
+    children: Dict[str, List[dict]] = defaultdict(list)
+    for span in spans:
+        children[span["parent_span_id"]].append(span)
+    origin = spans[0]["start_time_unix_nano"]
+    lines = []
+
+    def walk(span: dict, depth: int) -> None:
+        offset = (span["start_time_unix_nano"] - origin) / 1e6
+        attributes = " ".join(f"{key}={value}" for key, value in span["attributes"].items())
+        lines.append(f"{offset:9.3f} ms  {'  ' * depth}{span['name']} {span['duration_ms']:.3f} ms  {attributes}".rstrip())
+        for child in children.get(span["span_id"], []):
+            walk(child, depth + 1)
+
+    known = {span["span_id"] for span in spans}
+    for span in spans:
+        if not span["parent_span_id"] or span["parent_span_id"] not in known:
+            walk(span, 0)
+    return "\n".join(lines)
+
+
+def make_handler(path: str):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path.rstrip("/") != "/v1/traces":
+                self.send_error(404)
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                records = flatten(json.loads(self.rfile.read(length)))
+            except (ValueError, KeyError) as e:
+                self.send_error(400, str(e))
+                return
+            with open(path, "a", encoding="utf-8") as handle:
+                handle.writelines(json.dumps(record) + "\n" for record in records)
+            summarize(records)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Receive OTLP/HTTP JSON traces or show a stored trace")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4318)
+    parser.add_argument("--file", default="traces.jsonl", help="JSONL file spans are appended to / read from")
+    parser.add_argument("--show", metavar="TRACE_ID", help="Print one trace from --file as a tree and exit")
+    args = parser.parse_args(argv)
+
+    if args.show:
+        with open(args.file, encoding="utf-8") as handle:
+            records = [json.loads(line) for line in handle if line.strip()]
+        print(render(records, args.show))
+        return
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args.file))
+    print(f"Collecting traces on http://{args.host}:{args.port}/v1/traces into {args.file}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Moderation pre-classifier training
+Fits the hashed n-gram model (app.services.prefilter) on labelled exports
+and writes the weights file the app loads from
+settings.moderation_prefilter_path. A share of the examples is held out
+and reported with the same numbers as scripts.eval_moderation_prefilter.
+
+Labels can also come straight from the database: --from-db takes the
+delivered text of messages the remote classifier retracted
+(moderation_audit) as flagged and recent live messages as clean. Messages
+rejected before delivery are not stored, so exports from the moderation
+provider's logs give a better balance when available.
+
+Run with: python -m scripts.train_moderation_prefilter data/labels.jsonl --output data/moderation_prefilter.npz
+"""
+import argparse
+import os
+import random
+import time
+from typing import List, Tuple
+
+from app.core.config import settings
+from app.services.prefilter import train
+from scripts.eval_moderation_prefilter import print_report, read_examples
+
+
+def read_database(limit: int) -> Tuple[List[str], List[int]]:
+    from app.db import base  # noqa: F401 - registers every model
+    from app.db.session import SessionLocal
+    from app.models.message import Message
+    from app.models.moderation_audit import ModerationAudit
+
+    db = SessionLocal()
+    try:
+        flagged = [content for (content,) in db.query(ModerationAudit.content).filter(ModerationAudit.action == "retracted")]
+        clean = [
+            content for (content,) in db.query(Message.content)
+            .filter(Message.deleted_at.is_(None), Message.pending_moderation == False)
+            .order_by(Message.id.desc())
+            .limit(limit)
+        ]
+    finally:
+        db.close()
+    return flagged + clean, [1] * len(flagged) + [0] * len(clean)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the moderation pre-classifier")
+    parser.add_argument("paths", nargs="*", help="Labelled exports (.jsonl or .csv)")
+    parser.add_argument("--from-db", action="store_true", help="Also label retracted vs live messages from the database")
+    parser.add_argument("--db-limit", type=int, default=200_000, help="Live messages to take with --from-db")
+    parser.add_argument("--output", default=settings.moderation_prefilter_path or "data/moderation_prefilter.npz")
+    parser.add_argument("--bits", type=int, default=18, help="log2 of the number of hashed weights")
+    parser.add_argument("--min-n", type=int, default=2)
+    parser.add_argument("--max-n", type=int, default=5)
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--learning-rate", type=float, default=0.5)
+    parser.add_argument("--l2", type=float, default=1e-6)
+    parser.add_argument("--holdout", type=float, default=0.2, help="Share of examples kept for evaluation")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    texts, labels = read_examples(args.paths)
+    if args.from_db:
+        db_texts, db_labels = read_database(args.db_limit)
+        texts += db_texts
+        labels += db_labels
+    if not texts:
+        parser.error("no labelled messages found")
+
+    examples = list(zip(texts, labels))
+    random.Random(args.seed).shuffle(examples)
+    held = int(len(examples) * args.holdout)
+    test, fit = examples[:held], examples[held:]
+    print(f"Training on {len(fit)} messages ({sum(label for _, label in fit)} flagged), holding out {len(test)}")
+
+    started = time.perf_counter()
+    model = train(
+        [text for text, _ in fit], [label for _, label in fit],
+        bits=args.bits, min_n=args.min_n, max_n=args.max_n, epochs=args.epochs,
+        learning_rate=args.learning_rate, l2=args.l2, seed=args.seed,
+    )
+    print(f"Trained in {time.perf_counter() - started:.1f}s")
+
+    directory = os.path.dirname(args.output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    model.save(args.output)
+    print(f"Wrote {args.output} ({os.path.getsize(args.output) / 1024:.0f} KiB)")
+
+    if test:
+        print_report(
+            model, [text for text, _ in test], [label for _, label in test],
+            settings.moderation_prefilter_allow_below, settings.moderation_prefilter_block_above,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+WebSocket affinity router
+A local stand-in for an L7 proxy: accepts /ws/{room_id} and /ws/system
+connections and forwards each room socket to the worker that owns the room
+on the consistent-hash ring (the same ring the workers use), so clients
+that don't follow room_route hints still land on the right worker.
+System sockets go to any live worker.
+
+Members come from --workers / WS_AFFINITY_WORKERS ("id=ws://host:port,...")
+or from the Redis membership set the workers heartbeat into.
+
+Run with: python -m scripts.ws_router --port 8080
+"""
+import argparse
+import asyncio
+import itertools
+import re
+import time
+
+import websockets
+
+from app.core.config import settings
+from app.websocket.affinity import ENDPOINTS_KEY, MEMBERS_KEY, HashRing, parse_workers
+
+ROOM_PATH = re.compile(r"^/ws/(\d+)(\?.*)?$")
+
+
+class Membership:
+    def __init__(self, static_workers: str):
+        self.static = parse_workers(static_workers) if static_workers else None
+        self.members = dict(self.static or {})
+        self.ring = HashRing(self.members, settings.ws_affinity_vnodes)
+        self._any = itertools.count()
+
+    def _read_redis(self):
+        import redis
+        client = redis.from_url(settings.redis_url, decode_responses=True)
+        live = client.zrangebyscore(MEMBERS_KEY, time.time() - settings.ws_affinity_member_ttl_seconds, "+inf")
+        endpoints = client.hgetall(ENDPOINTS_KEY)
+        return {worker_id: endpoints[worker_id] for worker_id in live if worker_id in endpoints}
+
+    async def run(self):
+        while self.static is None:
+            try:
+                members = await asyncio.to_thread(self._read_redis)
+                if members != self.members:
+                    print(f"Ring: {sorted(members)}")
+                    self.members = members
+                    self.ring = HashRing(members, settings.ws_affinity_vnodes)
+            except Exception as e:
+                print(f"Membership refresh failed: {e}")
+            await asyncio.sleep(settings.ws_affinity_refresh_seconds)
+
+    def endpoint_for(self, path: str):
+        match = ROOM_PATH.match(path)
+        if match:
+            owner = self.ring.owner(f"room:{match.group(1)}")
+            return self.members.get(owner) if owner else None
+        if not self.members:
+            return None
+        endpoints = sorted(self.members.values())
+        return endpoints[next(self._any) % len(endpoints)]
+
+
+async def pipe(source, destination):
+    async for message in source:
+        await destination.send(message)
+
+
+def make_handler(membership: Membership):
+    async def handler(client):
+        endpoint = membership.endpoint_for(client.path)
+        if endpoint is None:
+            await client.close(code=1013, reason="no workers")
+            return
+        try:
+            upstream = await websockets.connect(endpoint.rstrip("/") + client.path)
+        except Exception as e:
+            print(f"Upstream {endpoint} unavailable: {e}")
+            await client.close(code=1013, reason="worker unavailable")
+            return
+        tasks = [asyncio.create_task(pipe(client, upstream)), asyncio.create_task(pipe(upstream, client))]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await upstream.close()
+        # Pass the worker's close code (e.g. 1012 during a drain) through to the client
+        if upstream.close_code is not None:
+            await client.close(code=upstream.close_code, reason=upstream.close_reason or "")
+    return handler
+
+
+async def main_async(args):
+    membership = Membership(args.workers)
+    refresher = asyncio.create_task(membership.run())
+    async with websockets.serve(make_handler(membership), args.host, args.port):
+        print(f"Routing on ws://{args.host}:{args.port} ({'static' if membership.static else 'redis'} membership)")
+        await asyncio.Future()
+    refresher.cancel()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Forward WebSockets to the worker that owns the room")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", default=settings.ws_affinity_workers, help='"id=ws://host:port,..."')
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(main_async(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,7 @@
 import { useState } from 'react'
 import { motion } from 'framer-motion'
 import api from '@/lib/api'
-import { setToken } from '@/lib/auth'
+import { setRefreshToken, setToken } from '@/lib/auth'
 import type { RegisterRequest, LoginRequest, Token } from '@/shared/types'
 
 interface LoginFormProps {
@@ -53,6 +53,7 @@ export default function LoginForm({ onLogin }: LoginFormProps) {
       )
 
       setToken(response.data.access_token)
+      setRefreshToken(response.data.refresh_token)
       onLogin()
     } catch (err: any) {
       setError(err.response?.data?.detail || 'Authentication failed. Please try again.')
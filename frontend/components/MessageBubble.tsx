@@ -17,7 +17,7 @@ export default function MessageBubble({ message, currentUser, onReply }: Message
   const isOwnMessage = currentUser && message.user_id === currentUser.id
   const displayName = message.user?.username || 'Unknown'
   const avatarInitial = displayName[0].toUpperCase()
-  const avatarUrl = getGravatarUrl(message.user?.email || message.user?.username, 40)
+  const avatarUrl = message.user?.avatar_url || getGravatarUrl(message.user?.username, 40)
 
   const formatTime = (dateString: string) => {
     const date = new Date(dateString)
@@ -68,7 +68,11 @@ export default function MessageBubble({ message, currentUser, onReply }: Message
               {message.reply_to.content.substring(0, 40)}...
             </div>
           )}
-          <p className="text-sm whitespace-pre-wrap break-words">{message.content}</p>
+          {message.deleted_at ? (
+            <p className="text-sm italic opacity-75">Message removed</p>
+          ) : (
+            <p className="text-sm whitespace-pre-wrap break-words">{message.content}</p>
+          )}
         </div>
 
         {/* Actions (Reply button) */}
@@ -49,8 +49,10 @@ export default function ChatApp() {
     useEffect(() => {
         if (selectedRoom && user) {
             loadMessages(selectedRoom.id)
-            connectWebSocket(selectedRoom.id)
+            const disconnectHandlers = connectWebSocket(selectedRoom.id)
             setTypingUsers([])
+            // Handlers for this room go with it
+            return disconnectHandlers
         } else {
             wsClient.disconnect()
             setMessages([])
@@ -95,9 +97,7 @@ export default function ChatApp() {
                         user: wsMessage.username ? {
                             id: wsMessage.user_id || 0,
                             username: wsMessage.username,
-                            is_active: true,
-                            is_admin: false,
-                            created_at: new Date().toISOString()
+                            avatar_url: wsMessage.avatar_url
                         } : undefined
                     }
                     setMessages(prev => [...prev, newMessage])
@@ -106,13 +106,31 @@ export default function ChatApp() {
                         setTypingUsers(prev => prev.filter(u => u !== wsMessage.username))
                     }
                 }
+            } else if (wsMessage.type === 'history_purged' && wsMessage.through_id) {
+                // Retention removed older messages on the server
+                const throughId = wsMessage.through_id
+                setMessages(prev => prev.filter(m => m.id > throughId))
+            } else if (wsMessage.type === 'message_removed' && wsMessage.id) {
+                // Delivered before moderation finished, then flagged
+                const removedId = wsMessage.id
+                setMessages(prev => prev.map(m => m.id === removedId
+                    ? { ...m, content: '', deleted_at: new Date().toISOString() }
+                    : m))
             } else if (wsMessage.type === 'typing' && wsMessage.username) {
                 handleTypingEvent(wsMessage.username)
+            } else if (wsMessage.type === 'error' && wsMessage.client_msg_id) {
+                // One of our sends was rejected and won't be retried
+                alert(wsMessage.message || 'Failed to send message.')
             }
         })
+        // Missed messages (sequence gap, reconnect): fetch everything after the last one seen
+        const unsubscribeGap = wsClient.onGap((afterSeq: number) => loadMessagesAfter(roomId, afterSeq))
 
         wsClient.connect(roomId)
-        return unsubscribe
+        return () => {
+            unsubscribe()
+            unsubscribeGap()
+        }
     }
 
     const loadUser = async () => {
@@ -148,6 +166,18 @@ export default function ChatApp() {
         }
     }
 
+    const loadMessagesAfter = async (roomId: number, afterSeq: number) => {
+        try {
+            const response = await api.get<Message[]>(`/api/rooms/${roomId}/messages`, { params: { after_seq: afterSeq } })
+            setMessages(prev => {
+                const missed = response.data.filter(m => !prev.some(existing => existing.id === m.id))
+                return missed.length ? [...prev, ...missed].sort((a, b) => a.id - b.id) : prev
+            })
+        } catch (error) {
+            console.error('Failed to load missed messages:', error)
+        }
+    }
+
     const handleSendMessage = async (content: string, replyToId?: number) => {
         if (!selectedRoom) return
 
@@ -80,6 +80,11 @@ export default function DashboardLayout() {
                     if (msg.status === 'online') return [...new Set([...prev, msg.username!])]
                     return prev.filter(u => u !== msg.username)
                 })
+            } else if (msg.type === 'mention' && msg.username) {
+                // Full list: GET /api/users/me/mentions
+                if (typeof Notification !== 'undefined' && Notification.permission === 'granted') {
+                    new Notification(`${msg.username} mentioned you`, { body: msg.content })
+                }
             }
         })
 
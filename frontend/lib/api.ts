@@ -1,5 +1,5 @@
 import axios, { AxiosInstance, InternalAxiosRequestConfig } from 'axios'
-import { getToken, removeToken } from './auth'
+import { getRefreshToken, getToken, removeToken, setRefreshToken, setToken } from './auth'
 
 const API_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000'
 
@@ -24,12 +24,39 @@ api.interceptors.request.use(
   }
 )
 
+// One refresh at a time; concurrent 401s wait for the same one
+let refreshing: Promise<string | null> | null = null
+
+export const refreshAccessToken = (): Promise<string | null> => {
+  const refreshToken = getRefreshToken()
+  if (!refreshToken) return Promise.resolve(null)
+  if (!refreshing) {
+    refreshing = axios.post(`${API_URL}/api/auth/refresh`, { refresh_token: refreshToken })
+      .then((response) => {
+        setToken(response.data.access_token)
+        setRefreshToken(response.data.refresh_token)
+        return response.data.access_token as string
+      })
+      .catch(() => null)
+      .finally(() => { refreshing = null })
+  }
+  return refreshing
+}
+
 // Response interceptor to handle errors
 api.interceptors.response.use(
   (response) => response,
-  (error) => {
-    if (error.response?.status === 401) {
-      // Unauthorized - simply remove token. 
+  async (error) => {
+    const config = error.config
+    if (error.response?.status === 401 && config && !config._retried) {
+      // Access tokens are short-lived: trade the refresh token for a new one and retry once
+      config._retried = true
+      const token = await refreshAccessToken()
+      if (token) {
+        config.headers.Authorization = `Bearer ${token}`
+        return api(config)
+      }
+      // Refresh failed or was revoked - remove tokens.
       // Components should handle the redirect or show login form as needed.
       removeToken()
     }
@@ -37,5 +64,13 @@ api.interceptors.response.use(
   }
 )
 
+export const logout = async (everywhere = false): Promise<void> => {
+  try {
+    await api.post('/api/auth/logout', { refresh_token: getRefreshToken(), everywhere })
+  } finally {
+    removeToken()
+  }
+}
+
 export default api
 
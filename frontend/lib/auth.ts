@@ -1,4 +1,5 @@
 const TOKEN_KEY = 'whatyousayin_token'
+const REFRESH_TOKEN_KEY = 'whatyousayin_refresh_token'
 
 export const getToken = (): string | null => {
   if (typeof window === 'undefined') return null
@@ -10,9 +11,20 @@ export const setToken = (token: string): void => {
   localStorage.setItem(TOKEN_KEY, token)
 }
 
+export const getRefreshToken = (): string | null => {
+  if (typeof window === 'undefined') return null
+  return localStorage.getItem(REFRESH_TOKEN_KEY)
+}
+
+export const setRefreshToken = (token: string): void => {
+  if (typeof window === 'undefined') return
+  localStorage.setItem(REFRESH_TOKEN_KEY, token)
+}
+
 export const removeToken = (): void => {
   if (typeof window === 'undefined') return
   localStorage.removeItem(TOKEN_KEY)
+  localStorage.removeItem(REFRESH_TOKEN_KEY)
 }
 
 export const isAuthenticated = (): boolean => {
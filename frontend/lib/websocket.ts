@@ -1,4 +1,5 @@
 import { getToken } from './auth'
+import { refreshAccessToken } from './api'
 import type { Message } from '@/shared/types'
 
 const WS_URL = (typeof window !== 'undefined'
@@ -6,17 +7,40 @@ const WS_URL = (typeof window !== 'undefined'
   : 'ws://localhost:8000')
 
 export interface WebSocketMessage {
-  type: 'message' | 'connected' | 'user_joined' | 'user_left' | 'typing' | 'presence' | 'presence_sync'
+  type: 'message' | 'connected' | 'user_joined' | 'user_left' | 'typing' | 'presence' | 'presence_sync' | 'ping' | 'pong' | 'reconnect' | 'room_route' | 'history_purged' | 'message_removed' | 'batch' | 'mention' | 'error'
   id?: number
   content?: string
   room_id?: number
   user_id?: number
   username?: string
+  avatar_url?: string | null
   reply_to_id?: number
+  thread_root_id?: number
+  client_msg_id?: string
+  seq?: number
+  trace_id?: string
+  batch_ms?: number
+  frames?: WebSocketMessage[]
   created_at?: string
   message?: string
   status?: 'online' | 'offline'
   users?: string[]
+  delay_ms?: number
+  through_id?: number
+  reason?: string
+  worker_id?: string | null
+  endpoint?: string | null
+  resume?: { room_id: number; last_seq: number | null }
+}
+
+// Room id -> WebSocket endpoint of the worker that owns it (from room_route frames)
+const roomEndpoints: Map<number, string> = new Map()
+
+function newClientMsgId(): string {
+  if (typeof crypto !== 'undefined' && 'randomUUID' in crypto) {
+    return crypto.randomUUID()
+  }
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`
 }
 
 export class WebSocketClient {
@@ -25,16 +49,26 @@ export class WebSocketClient {
   private reconnectAttempts = 0
   private maxReconnectAttempts = 5
   private reconnectDelay = 1000
+  private serverReconnectDelay: number | null = null
   private heartbeatInterval: NodeJS.Timeout | null = null
   private messageHandlers: Set<(message: WebSocketMessage) => void> = new Set()
   private onConnectHandlers: Set<() => void> = new Set()
   private onDisconnectHandlers: Set<() => void> = new Set()
+  private gapHandlers: Set<(afterSeq: number) => void> = new Set()
+  // Sends not yet echoed back (or rejected) by the server, resent after a reconnect (same client_msg_id)
+  private pending: Map<string, object> = new Map()
+  // Last room sequence number delivered here; the resume cursor after a reconnect
+  private lastSeq: number | null = null
 
   connect(target: number | 'system'): void {
     if (this.ws?.readyState === WebSocket.OPEN && this.target === target) {
       return // Already connected
     }
 
+    if (this.target !== target) {
+      this.pending.clear()
+      this.lastSeq = null
+    }
     this.disconnect()
     this.target = target
 
@@ -45,7 +79,10 @@ export class WebSocketClient {
     }
 
     const path = target === 'system' ? 'ws/system' : `ws/${target}`
-    const url = `${WS_URL}/${path}?token=${encodeURIComponent(token)}`
+    const base = (target !== 'system' && roomEndpoints.get(target)) || WS_URL
+    // Room sockets ask the server to coalesce outbound frames into batch frames
+    const batch = target === 'system' ? '' : '&batch=1'
+    const url = `${base.replace(/\/$/, '')}/${path}?token=${encodeURIComponent(token)}${batch}`
 
     try {
       this.ws = new WebSocket(url)
@@ -54,13 +91,24 @@ export class WebSocketClient {
         console.log(`WebSocket connected to ${target}`)
         this.reconnectAttempts = 0
         this.startHeartbeat()
+        this.pending.forEach(payload => this.ws?.send(JSON.stringify(payload)))
+        if (this.lastSeq !== null) {
+          // Back after a disconnect: fetch whatever was sent meanwhile
+          const afterSeq = this.lastSeq
+          this.gapHandlers.forEach(handler => handler(afterSeq))
+        }
         this.onConnectHandlers.forEach(handler => handler())
       }
 
       this.ws.onmessage = (event) => {
         try {
           const message: WebSocketMessage = JSON.parse(event.data)
-          this.messageHandlers.forEach(handler => handler(message))
+          if (message.type === 'batch') {
+            // Several frames coalesced by the server, in order
+            message.frames?.forEach(frame => this.handleFrame(frame))
+            return
+          }
+          this.handleFrame(message)
         } catch (error) {
           console.error('Failed to parse WebSocket message:', error)
         }
@@ -70,10 +118,17 @@ export class WebSocketClient {
         console.error('WebSocket error:', error)
       }
 
-      this.ws.onclose = () => {
+      this.ws.onclose = (event) => {
         console.log('WebSocket disconnected')
         this.stopHeartbeat()
         this.onDisconnectHandlers.forEach(handler => handler())
+        if (event.code === 1008) {
+          // Token expired or revoked: only come back with a fresh one
+          refreshAccessToken().then(token => {
+            if (token) this.attemptReconnect(target)
+          })
+          return
+        }
         this.attemptReconnect(target)
       }
     } catch (error) {
@@ -82,6 +137,45 @@ export class WebSocketClient {
     }
   }
 
+  private handleFrame(message: WebSocketMessage): void {
+    if (message.type === 'ping') {
+      // Server heartbeat: answer so the idle reaper keeps this socket
+      this.ws?.send(JSON.stringify({ type: 'pong' }))
+      return
+    }
+    if (message.type === 'reconnect') {
+      // Server is draining or turning us away (full, overloaded): reconnect after
+      // its jittered delay instead of our backoff
+      this.serverReconnectDelay = message.delay_ms ?? null
+      if (this.lastSeq === null && message.resume?.room_id === this.target && message.resume.last_seq != null) {
+        // Nothing sequenced seen yet: resume from the server's cursor
+        this.lastSeq = message.resume.last_seq
+      }
+    }
+    if (message.type === 'room_route' && message.room_id !== undefined) {
+      const previous = roomEndpoints.get(message.room_id)
+      if (message.endpoint) {
+        roomEndpoints.set(message.room_id, message.endpoint)
+      } else {
+        roomEndpoints.delete(message.room_id)
+      }
+      if (message.room_id === this.target && message.endpoint && message.endpoint !== previous) {
+        // Another worker owns this room: move there (after the server's delay when rebalancing)
+        this.serverReconnectDelay = message.delay_ms ?? 0
+        this.ws?.close()
+      }
+      return
+    }
+    if (message.type === 'message' && !this.trackMessage(message)) {
+      return // Already delivered
+    }
+    if (message.type === 'error' && message.client_msg_id) {
+      // Rejected (moderation, bad reply): resending won't help
+      this.pending.delete(message.client_msg_id)
+    }
+    this.messageHandlers.forEach(handler => handler(message))
+  }
+
   disconnect(): void {
     this.stopHeartbeat()
     if (this.ws) {
@@ -92,16 +186,21 @@ export class WebSocketClient {
     this.reconnectAttempts = 0
   }
 
-  sendMessage(content: string, replyToId?: number): void {
+  sendMessage(content: string, replyToId?: number): string {
+    const clientMsgId = newClientMsgId()
+    const payload = {
+      type: 'message',
+      content,
+      reply_to_id: replyToId,
+      client_msg_id: clientMsgId
+    }
+    this.pending.set(clientMsgId, payload)
     if (this.ws?.readyState === WebSocket.OPEN) {
-      this.ws.send(JSON.stringify({
-        type: 'message',
-        content,
-        reply_to_id: replyToId
-      }))
+      this.ws.send(JSON.stringify(payload))
     } else {
-      console.error('WebSocket is not connected')
+      console.error('WebSocket is not connected, message will be sent on reconnect')
     }
+    return clientMsgId
   }
 
   sendTyping(): void {
@@ -117,6 +216,12 @@ export class WebSocketClient {
     return () => this.messageHandlers.delete(handler)
   }
 
+  /** Called with the last sequence number seen when messages may have been missed (a skip, or a reconnect), to fetch after_seq */
+  onGap(handler: (afterSeq: number) => void): () => void {
+    this.gapHandlers.add(handler)
+    return () => this.gapHandlers.delete(handler)
+  }
+
   onConnect(handler: () => void): () => void {
     this.onConnectHandlers.add(handler)
     return () => this.onConnectHandlers.delete(handler)
@@ -131,6 +236,27 @@ export class WebSocketClient {
     return this.ws?.readyState === WebSocket.OPEN
   }
 
+  /** Returns false for a message already delivered; reports gaps in the room sequence */
+  private trackMessage(message: WebSocketMessage): boolean {
+    if (message.client_msg_id) {
+      this.pending.delete(message.client_msg_id)
+    }
+    if (message.seq == null) {
+      return true
+    }
+    if (this.lastSeq !== null) {
+      if (message.seq <= this.lastSeq) {
+        return false
+      }
+      if (message.seq > this.lastSeq + 1) {
+        const afterSeq = this.lastSeq
+        this.gapHandlers.forEach(handler => handler(afterSeq))
+      }
+    }
+    this.lastSeq = message.seq
+    return true
+  }
+
   private attemptReconnect(target: number | 'system'): void {
     if (this.reconnectAttempts >= this.maxReconnectAttempts) {
       console.error('Max reconnection attempts reached')
@@ -138,7 +264,9 @@ export class WebSocketClient {
     }
 
     this.reconnectAttempts++
-    const delay = this.reconnectDelay * Math.pow(2, this.reconnectAttempts - 1) // Exponential backoff
+    const delay = this.serverReconnectDelay
+      ?? this.reconnectDelay * Math.pow(2, this.reconnectAttempts - 1) // Exponential backoff
+    this.serverReconnectDelay = null
 
     setTimeout(() => {
       console.log(`Attempting to reconnect (${this.reconnectAttempts}/${this.maxReconnectAttempts})...`)
@@ -5,6 +5,7 @@ export interface User {
   avatar_url?: string
   is_active: boolean
   is_admin: boolean
+  is_trusted?: boolean
   created_at: string
   updated_at?: string
 }
@@ -14,26 +15,60 @@ export interface Room {
   name: string
   description?: string
   is_public: boolean
+  retention_days?: number | null
+  deliver_first?: boolean
+  max_connections?: number | null
   created_by: number
   created_at: string
   creator?: User
 }
 
+// Member of a private room
+export interface RoomMember {
+  user_id: number
+  username: string
+  created_at: string
+}
+
+// Author as of the message (snapshot stored with it)
+export interface MessageAuthor {
+  id: number
+  username?: string | null
+  avatar_url?: string | null
+}
+
 export interface Message {
   id: number
   content: string
   room_id: number
   user_id: number
   reply_to_id?: number
+  thread_root_id?: number
+  reply_count?: number
   created_at: string
-  user?: User
+  deleted_at?: string | null
+  user?: MessageAuthor
   room?: Room
   reply_to?: Message
 }
 
+export interface Thread {
+  root: Message
+  replies: Message[]
+  reply_count: number
+  next_after_id?: number
+}
+
+export interface MentionInbox {
+  mentions: Message[]
+  next_before_id?: number | null
+}
+
 export interface Token {
   access_token: string
+  refresh_token: string
   token_type: string
+  expires_in: number
 }
 
 export interface LoginRequest {